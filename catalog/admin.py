@@ -1,13 +1,35 @@
-from django.contrib import admin
+import datetime
 
-from .models import Author, Genre, Book, BookInstance, Language
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.template.response import TemplateResponse
+
+from . import holds, loans
+from .forms import RenewalBookForm
+from .models import Author, Genre, Book, BookInstance, Hold, Language
+from .pagination import EstimatedCountPaginator
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Change list settings for tables too big to COUNT(*) on every page view: the
+    unfiltered row count is estimated, and the "(N total)" count of the whole
+    table next to a filtered count isn't shown
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 #admin.site.register(BookInstance)
 @admin.register(BookInstance)
-class BookInstanceAdmin(admin.ModelAdmin):
+class BookInstanceAdmin(LargeTableAdmin):
     list_display = ('book', 'status', 'borrower', 'due_back')
+    # both filters are answered from the status/due_back indexes
     list_filter = ('status', 'due_back')
+    # book titles and borrower names come along in the page's query
+    list_select_related = ('book', 'borrower')
+    # plain id inputs rather than dropdowns listing every book and every user
+    raw_id_fields = ('book', 'borrower')
     fieldsets = (
         (None, {
             'fields' : ('book', 'imprint', 'id'),
@@ -16,29 +38,127 @@ class BookInstanceAdmin(admin.ModelAdmin):
             'fields' : ('status', 'due_back', 'borrower')
         })
     )
+    actions = ['renew_loans', 'mark_returned']
+    # copies listed on the renewal page; the rest are counted
+    renew_preview_limit = 100
+    # the permission each action needs, on top of changing copies
+    action_permissions = {
+        'renew_loans': 'catalog.can_renew',
+        'mark_returned': 'catalog.can_mark_returned',
+    }
+    
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        for name, permission in self.action_permissions.items():
+            if name in actions and not request.user.has_perm(permission):
+                del actions[name]
+        return actions
+    
+    def report_outcomes(self, request, outcomes, done):
+        """
+        One message with how many copies were changed, and one listing each copy
+        that wasn't and why
+        """
+        counts = loans.summarize(outcomes)
+        self.message_user(request, '%s %s loan(s).' % (done.capitalize(), counts[done]))
+        failed = [(copy, outcome) for copy_id, copy, outcome in loans.with_copies(outcomes) if outcome != done]
+        if failed:
+            self.message_user(request, 'Not %s: %s' % (done, '; '.join(
+                '%s (%s)' % (copy, outcome) for copy, outcome in failed)), messages.WARNING)
+    
+    def renew_loans(self, request, queryset):
+        """
+        Asks for a renewal date (checked like the librarian renewal form), then
+        renews every selected loan to it in one UPDATE
+        """
+        form = RenewalBookForm(request.POST if 'apply' in request.POST else None,
+            initial={'renewal_date': datetime.date.today() + datetime.timedelta(weeks=3)})
+        if form.is_valid():
+            outcomes = loans.renew(list(queryset.values_list('pk', flat=True)), form.cleaned_data['renewal_date'])
+            self.report_outcomes(request, outcomes, loans.RENEWED)
+            # back to the change list
+            return None
+        copies = list(queryset.select_related('book', 'borrower')[:self.renew_preview_limit])
+        count = queryset.count()
+        return TemplateResponse(request, 'admin/catalog/bookinstance/renew_loans.html', dict(
+            self.admin_site.each_context(request),
+            title='Renew loans',
+            opts=self.model._meta,
+            form=form,
+            copies=copies,
+            count=count,
+            more=count - len(copies),
+            select_across=request.POST.get('select_across', '0'),
+            selected=request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            action_checkbox_name=helpers.ACTION_CHECKBOX_NAME,
+        ))
+    renew_loans.short_description = 'Renew selected loans'
+    
+    def mark_returned(self, request, queryset):
+        outcomes = loans.mark_returned(list(queryset.values_list('pk', flat=True)))
+        self.report_outcomes(request, outcomes, loans.RETURNED)
+    mark_returned.short_description = 'Mark selected loans returned'
 
 class BookInstanceInline(admin.TabularInline):
     model = BookInstance
     extra = 0
+    raw_id_fields = ('borrower',)
 
 #admin.site.register(Book)
 @admin.register(Book)
-class BookAdmin(admin.ModelAdmin):
+class BookAdmin(LargeTableAdmin):
     # author is foreign key, so displays __str__ output
     list_display = ('title', 'author', 'display_genre')
+    list_filter = ('language',)
+    list_select_related = ('author',)
+    raw_id_fields = ('author',)
     inlines = [BookInstanceInline]
+    
+    def get_queryset(self, request):
+        # display_genre reads the prefetched genres: one query per page, not per row
+        return super().get_queryset(request).prefetch_related('genre')
 
 class BookInline(admin.TabularInline):
     model = Book
     extra = 0
+    # genres and language are edited on the book's own page; as inline fields
+    # they would load every genre and language once per book
+    fields = ('title', 'summary', 'isbn')
+    show_change_link = True
 
 #admin.site.register(Author)
 @admin.register(Author)
-class AuthorAdmin(admin.ModelAdmin):
+class AuthorAdmin(LargeTableAdmin):
     list_display = ('last_name', 'first_name', 'date_of_birth', 'date_of_death')
     fields = ['last_name', 'first_name', ('date_of_birth', 'date_of_death')]
     inlines = [BookInline]
 
+@admin.register(Hold)
+class HoldAdmin(admin.ModelAdmin):
+    list_display = ('book', 'patron', 'placed', 'copy', 'ready')
+    list_select_related = ('book', 'patron', 'copy')
+    raw_id_fields = ('book', 'patron')
+    # copies are reserved by the queue (catalog.holds), not by hand
+    readonly_fields = ('copy', 'ready')
+    actions = ['lend_copies']
+    
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        if 'lend_copies' in actions and not request.user.has_perm('catalog.can_mark_returned'):
+            del actions['lend_copies']
+        return actions
+    
+    def lend_copies(self, request, queryset):
+        """
+        Lends each selected hold's reserved copy to its patron and closes the hold
+        """
+        lent = [hold for hold in queryset if holds.collect(hold)]
+        self.message_user(request, 'Lent %s reserved cop%s.' % (len(lent), 'y' if len(lent) == 1 else 'ies'))
+        if len(lent) < len(queryset):
+            self.message_user(request, '%s of the selected holds have no copy yet.' % (len(queryset) - len(lent)),
+                messages.WARNING)
+    lend_copies.short_description = 'Lend the reserved copies to their patrons'
+
 admin.site.register(Genre)
 
 admin.site.register(Language)
\ No newline at end of file
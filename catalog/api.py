@@ -0,0 +1,317 @@
+"""
+Read-only JSON API for the catalog, for the kiosk and mobile clients that used
+to scrape the HTML pages.
+
+Every endpoint builds its response from values() dicts rather than model
+instances, and fetches related rows with one query per page (never one per row).
+Lists are keyset paginated by primary key: `?limit=` sets the page size and the
+`next` link carries `?after=<last id>`.
+
+Responses carry an ETag and Last-Modified taken from the CatalogVersion row,
+which changes whenever anything in the catalog does. A client repeating a poll
+with If-None-Match or If-Modified-Since gets a bodiless 304 for the price of that
+one-row query, until the catalog next changes.
+"""
+from functools import wraps
+
+from django.core.exceptions import ValidationError
+from django.core.urlresolvers import reverse
+from django.db.models import Min
+from django.http import JsonResponse
+from django.views.decorators.http import condition, require_safe
+
+from . import autocomplete
+from .middleware import query_budget
+from .routers import read_replica
+from .models import Author, Book, BookAvailability, BookInstance, CatalogVersion
+
+# bump when the shape of the responses changes, so clients don't keep stale copies
+API_VERSION = 1
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+DEFAULT_SUGGESTIONS = 10
+MAX_SUGGESTIONS = 25
+
+BOOK_FIELDS = ['id', 'title', 'isbn', 'author_id', 'author__first_name', 'author__last_name', 'language__name']
+AUTHOR_FIELDS = ['id', 'first_name', 'last_name', 'date_of_birth', 'date_of_death']
+COPY_FIELDS = ['id', 'book_id', 'imprint', 'status', 'due_back']
+
+
+class BadRequest(Exception):
+    pass
+
+
+class NotFound(Exception):
+    pass
+
+
+def catalog_version(request):
+    """
+    The CatalogVersion row, loaded once per request (the etag and last modified
+    functions both need it)
+    """
+    if not hasattr(request, '_catalog_version'):
+        request._catalog_version = CatalogVersion.load()
+    return request._catalog_version
+
+
+def catalog_etag(request, *args, **kwargs):
+    return '"%s-%s"' % (API_VERSION, catalog_version(request).version)
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    return catalog_version(request).last_modified
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params={'separators': (',', ':')})
+
+
+def api_view(view):
+    """
+    Makes a function returning a dict into a GET/HEAD-only JSON view that answers
+    conditional requests with 304 Not Modified, and reads from a replica
+    """
+    @read_replica
+    @require_safe
+    @condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return json_response(view(request, *args, **kwargs))
+        except BadRequest as e:
+            return json_response({'detail': str(e)}, status=400)
+        except NotFound:
+            return json_response({'detail': 'Not found.'}, status=404)
+    return wrapper
+
+
+def get_limit(request):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise BadRequest('limit must be a number')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def paginate(request, queryset, key='id'):
+    """
+    Returns one page of a values() queryset, ordered by key and starting after the
+    `after` parameter, and the URL of the next page (or None)
+    """
+    limit = get_limit(request)
+    after = request.GET.get('after')
+    queryset = queryset.order_by(key)
+    if after:
+        try:
+            after = queryset.model._meta.get_field(key).to_python(after)
+        except Exception:
+            raise BadRequest('after is not a valid id')
+        queryset = queryset.filter(**{'%s__gt' % key: after})
+    rows = list(queryset[:limit + 1])
+    next_url = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        params = request.GET.copy()
+        params['after'] = rows[-1][key]
+        next_url = request.build_absolute_uri('%s?%s' % (request.path, params.urlencode()))
+    return rows, next_url
+
+
+def get_row(queryset, fields, **lookup):
+    try:
+        row = queryset.filter(**lookup).values(*fields).first()
+    except ValidationError:
+        # e.g. a copy id that isn't a UUID
+        raise NotFound()
+    if row is None:
+        raise NotFound()
+    return row
+
+
+def filter_by_id(request, queryset, param, lookup):
+    """
+    Applies an optional integer id filter from the query string
+    """
+    value = request.GET.get(param)
+    if value is None:
+        return queryset
+    try:
+        return queryset.filter(**{lookup: int(value)})
+    except ValueError:
+        raise BadRequest('%s must be a number' % param)
+
+
+def book_dict(row):
+    """
+    Reshapes a Book values() row
+    """
+    return {
+        'id': row['id'],
+        'url': reverse('api-book-detail', args=[row['id']]),
+        'title': row['title'],
+        'isbn': row['isbn'],
+        'author': None if row['author_id'] is None else {
+            'id': row['author_id'],
+            'first_name': row['author__first_name'],
+            'last_name': row['author__last_name'],
+        },
+        'language': row['language__name'],
+    }
+
+
+def genre_names(book_ids):
+    """
+    Genre names for a set of books, in one query
+    """
+    genres = {}
+    for book_id, name in Book.genre.through.objects.filter(book_id__in=book_ids).order_by(
+            'book_id', 'genre__name').values_list('book_id', 'genre__name'):
+        genres.setdefault(book_id, []).append(name)
+    return genres
+
+
+def availability_fields(names):
+    """
+    values() lookups for the book's BookAvailability counters (None for a book
+    with no copies and so no row)
+    """
+    return ['availability__%s' % name for name in names]
+
+
+def next_due_dates(book_ids):
+    """
+    {book id: earliest due date of its copies on loan}, in one query
+    """
+    return dict(BookInstance.objects.filter(book_id__in=book_ids, status='o').order_by()
+                .values_list('book_id').annotate(Min('due_back')))
+
+
+@query_budget(3)
+@api_view
+def book_list(request):
+    queryset = filter_by_id(request, Book.objects.values(*BOOK_FIELDS), 'author', 'author_id')
+    queryset = filter_by_id(request, queryset, 'genre', 'genre__id')
+    rows, next_url = paginate(request, queryset)
+    genres = genre_names([row['id'] for row in rows])
+    results = []
+    for row in rows:
+        book = book_dict(row)
+        book['genres'] = genres.get(row['id'], [])
+        results.append(book)
+    return {'results': results, 'next': next_url}
+
+
+@query_budget(4)
+@api_view
+def book_detail(request, pk):
+    row = get_row(Book.objects.all(), BOOK_FIELDS + ['summary'], pk=pk)
+    book = book_dict(row)
+    book['summary'] = row['summary']
+    book['genres'] = genre_names([book['id']]).get(book['id'], [])
+    book['copies'] = list(BookInstance.objects.filter(book_id=pk).order_by('due_back', 'id').values(*COPY_FIELDS))
+    return book
+
+
+@query_budget(2)
+@api_view
+def author_list(request):
+    rows, next_url = paginate(request, Author.objects.values(*AUTHOR_FIELDS))
+    for row in rows:
+        row['url'] = reverse('api-author-detail', args=[row['id']])
+    return {'results': rows, 'next': next_url}
+
+
+@query_budget(3)
+@api_view
+def author_detail(request, pk):
+    author = get_row(Author.objects.all(), AUTHOR_FIELDS, pk=pk)
+    author['url'] = reverse('api-author-detail', args=[author['id']])
+    author['books'] = [
+        {'id': book_id, 'url': reverse('api-book-detail', args=[book_id]), 'title': title}
+        for book_id, title in Book.objects.filter(author_id=pk).order_by('title', 'id').values_list('id', 'title')]
+    return author
+
+
+@query_budget(2)
+@api_view
+def copy_list(request):
+    queryset = filter_by_id(request, BookInstance.objects.values(*COPY_FIELDS), 'book', 'book_id')
+    status = request.GET.get('status')
+    if status is not None:
+        if status not in dict(BookInstance.LOAN_STATUS):
+            raise BadRequest('unknown status %r' % status)
+        queryset = queryset.filter(status=status)
+    rows, next_url = paginate(request, queryset)
+    return {'results': rows, 'next': next_url}
+
+
+@query_budget(2)
+@api_view
+def copy_detail(request, pk):
+    return get_row(BookInstance.objects.all(), COPY_FIELDS, pk=pk)
+
+
+@query_budget(3)
+@api_view
+def availability_list(request):
+    """
+    Copy counts for a page of books, in book id order, from their availability
+    summaries
+    """
+    counters = ['copies', 'available', 'on_loan']
+    books, next_url = paginate(request, Book.objects.values('id', *availability_fields(counters)))
+    next_due = next_due_dates([book['id'] for book in books])
+    results = []
+    for book in books:
+        result = {name: book['availability__%s' % name] or 0 for name in counters}
+        result['book_id'] = book['id']
+        result['next_due'] = next_due.get(book['id'])
+        results.append(result)
+    return {'results': results, 'next': next_url}
+
+
+@query_budget(3)
+@api_view
+def availability_detail(request, pk):
+    """
+    Copy counts for one book from its availability summary, with a breakdown by
+    status
+    """
+    fields = BookAvailability.COUNT_FIELDS
+    row = get_row(Book.objects.all(), ['id'] + availability_fields(fields), pk=pk)
+    counts = {name: row['availability__%s' % name] or 0 for name in fields}
+    by_status = {code: counts[BookAvailability.STATUS_FIELDS[code]] for code, label in BookInstance.LOAN_STATUS
+                 if counts[BookAvailability.STATUS_FIELDS[code]]}
+    return {
+        'book_id': row['id'],
+        'copies': counts['copies'],
+        'available': counts['available'],
+        'on_loan': counts['on_loan'],
+        'next_due': next_due_dates([row['id']]).get(row['id']),
+        'by_status': by_status,
+    }
+
+
+SUGGESTION_URLS = {autocomplete.BOOK: ('book', 'book-detail'), autocomplete.AUTHOR: ('author', 'author-detail')}
+
+
+@query_budget(1)
+@require_safe
+def autocomplete_list(request):
+    """
+    Books and authors whose title or name starts with ?q=, for typing ahead.
+    Answered from the in-process prefix index (catalog.autocomplete) with no
+    queries once it is built, so it skips api_view's catalog version check.
+    """
+    try:
+        limit = max(1, min(int(request.GET.get('limit', DEFAULT_SUGGESTIONS)), MAX_SUGGESTIONS))
+    except ValueError:
+        return json_response({'detail': 'limit must be a number'}, status=400)
+    results = []
+    for kind, pk, label in autocomplete.lookup(request.GET.get('q', ''), limit):
+        name, url_name = SUGGESTION_URLS[kind]
+        results.append({'type': name, 'id': pk, 'label': label, 'url': reverse(url_name, args=[pk])})
+    return json_response({'results': results})
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class CatalogConfig(AppConfig):
     name = 'catalog'
+
+    def ready(self):
+        # connect the signal handlers that maintain the denormalized tables
+        from . import signals
+        # and register the system checks
+        from . import checks
@@ -0,0 +1,146 @@
+"""
+The static asset pipeline.
+
+Bootstrap and jQuery are served from our own static files rather than from
+CDNs, so pages don't wait on a third party and work in branches with no
+internet access. VENDOR_ASSETS pins the files; `manage.py vendor_static`
+downloads them (or copies them from a local mirror) into catalog/static/vendor,
+checking each against its Subresource Integrity hash. Until they are vendored,
+the {% vendored %} tag falls back to the CDN, and {% vendored_integrity %} adds
+the pinned hash to the tag so the browser refuses a CDN copy that has changed;
+the system checks in catalog/checks.py warn about the missing files, and
+`manage.py check --deploy` fails on them.
+
+`manage.py collectstatic` then copies every static file to STATIC_ROOT with
+CompressedManifestStaticFilesStorage: each file also gets a name with a hash of
+its content in it (css/style.3f1a9c2b7d4e.css), which {% static %} links to, so
+the files can be cached forever, and a .gz copy (plus a .br one if the optional
+brotli package is installed) for catalog.static_handler to send to browsers
+that accept it. Copies that don't come out smaller are not kept.
+"""
+import base64
+import functools
+import gzip
+import hashlib
+import io
+
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from django.templatetags.static import static
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# (path under static/, where it comes from, its SRI hash or None while it is
+# still to be pinned); the fonts are the glyphicons bootstrap.min.css refers to,
+# which collectstatic needs to find. Their hashes aren't pinned yet, so
+# `manage.py vendor_static` won't fetch them unless run with --no-verify, which
+# prints the hash of each unpinned file it fetches: check the files and copy the
+# hashes in here.
+VENDOR_ASSETS = [
+    ('vendor/jquery/1.12.4/jquery.min.js', 'https://code.jquery.com/jquery-1.12.4.min.js',
+     'sha256-ZosEbRLbNQzLpnKIkEdrPv7lOy9C27hHQ+Xp8a4MxAQ='),
+    ('vendor/bootstrap/3.3.7/css/bootstrap.min.css',
+     'https://maxcdn.bootstrapcdn.com/bootstrap/3.3.7/css/bootstrap.min.css',
+     'sha384-BVYiiSIFeK1dGmJRAkycuHAHRg32OmUcww7on3RYdg4Va+PmSTsz/K68vbdEjh4u'),
+    ('vendor/bootstrap/3.3.7/js/bootstrap.min.js',
+     'https://maxcdn.bootstrapcdn.com/bootstrap/3.3.7/js/bootstrap.min.js',
+     'sha384-Tc5IQib027qvyjSMfHjOMaLkfuWVxZxUPnCJA7l2mCWNIpG9mGCD8wGNIcPD7Txa'),
+] + [
+    ('vendor/bootstrap/3.3.7/fonts/glyphicons-halflings-regular.%s' % extension,
+     'https://maxcdn.bootstrapcdn.com/bootstrap/3.3.7/fonts/glyphicons-halflings-regular.%s' % extension, None)
+    for extension in ('eot', 'svg', 'ttf', 'woff', 'woff2')
+]
+
+# formats that are compressed already
+INCOMPRESSIBLE = ('.gz', '.br', '.png', '.jpg', '.jpeg', '.gif', '.webp', '.ico', '.woff', '.woff2', '.zip')
+
+# smaller files aren't worth a second request header's worth of bytes
+MIN_COMPRESS_SIZE = 256
+
+
+def integrity(content, algorithm='sha384'):
+    """
+    The Subresource Integrity hash of content, e.g. 'sha384-...'
+    """
+    return '%s-%s' % (algorithm, base64.b64encode(hashlib.new(algorithm, content).digest()).decode('ascii'))
+
+
+def check_integrity(content, expected):
+    return expected is None or integrity(content, expected.split('-', 1)[0]) == expected
+
+
+def vendor_asset(path):
+    """
+    The (path, url, sri) entry of VENDOR_ASSETS for path
+    """
+    for asset in VENDOR_ASSETS:
+        if asset[0] == path:
+            return asset
+    raise ValueError('%s is not in VENDOR_ASSETS' % path)
+
+
+@functools.lru_cache()
+def is_vendored(path):
+    # remembered, so restart after vendoring
+    vendor_asset(path)
+    return finders.find(path) is not None
+
+
+def vendored_url(path):
+    """
+    The URL of a vendored file, or of its CDN original if it hasn't been vendored
+    """
+    return static(path) if is_vendored(path) else vendor_asset(path)[1]
+
+
+def vendored_integrity(path):
+    """
+    The SRI hash to check the file against when it comes from the CDN, or None.
+    Our own copy needs none, and may not match: collectstatic rewrites the
+    url()s in stylesheets.
+    """
+    return None if is_vendored(path) else vendor_asset(path)[2]
+
+
+def gzip_compress(content):
+    buffer = io.BytesIO()
+    # mtime=0 so the same file always gives the same bytes
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=9, mtime=0) as compressed:
+        compressed.write(content)
+    return buffer.getvalue()
+
+
+def compressed_variants(name, content):
+    """
+    (suffix, compressed content) for each encoding worth keeping for this file
+    """
+    if name.lower().endswith(INCOMPRESSIBLE) or len(content) < MIN_COMPRESS_SIZE:
+        return []
+    variants = [('.gz', gzip_compress(content))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(content)))
+    return [(suffix, data) for suffix, data in variants if len(data) < len(content)]
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage that also writes compressed copies of the
+    content-hashed files
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in sorted(set(self.hashed_files.values())):
+            with self.open(name) as original:
+                content = original.read()
+            for suffix, data in compressed_variants(name, content):
+                if self.exists(name + suffix):
+                    self.delete(name + suffix)
+                self._save(name + suffix, ContentFile(data))
+                yield name, name + suffix, True
@@ -0,0 +1,308 @@
+"""
+In-process prefix index for autocompleting book titles and author names.
+
+A LIKE 'abc%' over the book and author tables is too slow for suggestions while
+the user types, so each process keeps every title and name in memory, in one
+sorted list that a lookup searches with bisect. Each entry is a single string,
+"<normalized key>\\0<label>\\0<kind><id>", which keeps the index to one list of
+str objects and needs nothing else to answer a lookup: no queries at all.
+
+Keys are lowercased, stripped of accents and punctuation, and cut to KEY_LENGTH
+characters. A book is found by its title, and by the title without a leading
+"The", "A" or "An"; an author by their last name and by their first name
+followed by the last.
+
+The index is built the first time it is used (djmdn2/wsgi.py starts that in the
+background at startup) from one streamed query over both tables, and the signal
+handlers in catalog.signals add, change and remove entries as books and authors
+are saved and deleted, once the change commits. Those only reach the process that made the change, so an
+index older than MAX_AGE seconds is rebuilt in the background, while the old one
+keeps answering.
+
+Memory is capped separately for titles and author names, at MAX_TITLE_BYTES
+and MAX_NAME_BYTES (an estimate: the entries plus the list's pointers), so a
+catalog with more titles than fit still suggests every author. Entries that
+would go over their cap are left out, and a warning logged, so raise the cap if
+that happens. The default title cap holds about 5 million titles (460 MB
+measured by `manage.py benchmark autocomplete`), with room for longer ones.
+
+Configure with the CATALOG_AUTOCOMPLETE setting, e.g.
+{'MAX_TITLE_BYTES': 640 * 1024 * 1024, 'MAX_NAME_BYTES': 128 * 1024 * 1024,
+'MAX_AGE': 15 * 60}.
+"""
+import bisect
+import logging
+import re
+import sys
+import threading
+import time
+import unicodedata
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_TITLE_BYTES = 640 * 1024 * 1024
+DEFAULT_MAX_NAME_BYTES = 128 * 1024 * 1024
+DEFAULT_MAX_AGE = 15 * 60
+
+# longer keys don't narrow the suggestions down any further in practice
+KEY_LENGTH = 40
+LABEL_LENGTH = 100
+
+# more new entries than this at once (an import) are merged in with one sort
+# rather than inserted one at a time, each insert moving the rest of the list
+INSERT_LIMIT = 100
+
+BOOK = 'b'
+AUTHOR = 'a'
+
+DEFAULT_MAX_BYTES = {BOOK: DEFAULT_MAX_TITLE_BYTES, AUTHOR: DEFAULT_MAX_NAME_BYTES}
+KIND_NAMES = {BOOK: 'titles', AUTHOR: 'author names'}
+
+ARTICLES = ('the ', 'a ', 'an ')
+
+# the book and author rows in one query, streamed in FETCH_SIZE batches
+ROWS_SQL = (
+    "SELECT 'b', id, title, '' FROM catalog_book "
+    "UNION ALL SELECT 'a', id, first_name, last_name FROM catalog_author")
+FETCH_SIZE = 2000
+
+NON_WORD = re.compile(r'[\W_]+')
+
+
+def get_options():
+    """
+    ({kind: byte cap}, max age) from the settings
+    """
+    options = getattr(settings, 'CATALOG_AUTOCOMPLETE', {})
+    max_bytes = {BOOK: options.get('MAX_TITLE_BYTES', DEFAULT_MAX_TITLE_BYTES),
+                 AUTHOR: options.get('MAX_NAME_BYTES', DEFAULT_MAX_NAME_BYTES)}
+    return max_bytes, options.get('MAX_AGE', DEFAULT_MAX_AGE)
+
+
+def normalize(text):
+    """
+    The key text is filed under, or looked up by: lowercase, without accents, and
+    with runs of punctuation and spaces made one space
+    """
+    text = text or ''
+    try:
+        text.encode('ascii')
+    except UnicodeEncodeError:
+        # str.isascii() would do, but only from Python 3.7
+        text = ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+    return NON_WORD.sub(' ', text.casefold()).strip()[:KEY_LENGTH]
+
+
+def book_entries(pk, title):
+    key = normalize(title)
+    keys = {key}
+    for article in ARTICLES:
+        if key.startswith(article):
+            keys.add(key[len(article):])
+    label = (title or '')[:LABEL_LENGTH]
+    return ['%s\0%s\0%s%d' % (k, label, BOOK, pk) for k in keys if k]
+
+
+def author_entries(pk, first_name, last_name):
+    label = ('%s, %s' % (last_name, first_name) if first_name else last_name or '')[:LABEL_LENGTH]
+    keys = {normalize(last_name), normalize('%s %s' % (first_name or '', last_name or ''))}
+    return ['%s\0%s\0%s%d' % (k, label, AUTHOR, pk) for k in keys if k]
+
+
+def entry_size(entry):
+    # the str object and its slot in the list
+    return sys.getsizeof(entry) + 8
+
+
+def entry_kind(entry):
+    return entry[entry.rindex('\0') + 1]
+
+
+class PrefixIndex(object):
+    """
+    The sorted entries, with a lock so lookups never see a half-made change.
+    max_bytes is {kind: byte cap}; sizes has the bytes each kind takes.
+    """
+
+    def __init__(self, entries=(), max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.sizes = dict.fromkeys(max_bytes, 0)
+        self.dropped = dict.fromkeys(max_bytes, 0)
+        kept = []
+        for entry in entries:
+            if self.fits(entry):
+                kept.append(entry)
+        kept.sort()
+        self.entries = kept
+        self.built = time.monotonic()
+        self.lock = threading.Lock()
+        for kind, dropped in self.dropped.items():
+            if dropped:
+                logger.warning('Autocomplete index is full (%s bytes of %s): left out %s entries', max_bytes[kind],
+                               KIND_NAMES[kind], dropped)
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def size(self):
+        return sum(self.sizes.values())
+
+    def fits(self, entry):
+        """
+        Whether the entry fits under its kind's cap, counting it in if it does
+        and as dropped if it doesn't
+        """
+        kind, size = entry_kind(entry), entry_size(entry)
+        if self.sizes[kind] + size > self.max_bytes[kind]:
+            self.dropped[kind] += 1
+            return False
+        self.sizes[kind] += size
+        return True
+
+    def add(self, entries):
+        with self.lock:
+            new = []
+            for entry in entries:
+                position = bisect.bisect_left(self.entries, entry)
+                if position < len(self.entries) and self.entries[position] == entry:
+                    continue
+                if not self.fits(entry):
+                    kind = entry_kind(entry)
+                    logger.warning('Autocomplete index is full (%s bytes of %s): left out %r',
+                                   self.max_bytes[kind], KIND_NAMES[kind], entry)
+                    continue
+                new.append(entry)
+            if len(new) <= INSERT_LIMIT:
+                for entry in new:
+                    bisect.insort(self.entries, entry)
+            else:
+                # a sorted run appended to a sorted list is merged in linear time
+                self.entries.extend(sorted(new))
+                self.entries.sort()
+
+    def remove(self, entries):
+        with self.lock:
+            for entry in entries:
+                position = bisect.bisect_left(self.entries, entry)
+                if position < len(self.entries) and self.entries[position] == entry:
+                    del self.entries[position]
+                    self.sizes[entry_kind(entry)] -= entry_size(entry)
+
+    def lookup(self, prefix, limit=10):
+        """
+        Up to limit (kind, id, label) for the entries whose key starts with
+        prefix, in the order of their keys; each book or author at most once
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        results, seen = [], set()
+        with self.lock:
+            position = bisect.bisect_left(self.entries, prefix)
+            while position < len(self.entries) and len(results) < limit:
+                entry = self.entries[position]
+                if not entry.startswith(prefix):
+                    break
+                key, label, ref = entry.split('\0')
+                if ref not in seen:
+                    seen.add(ref)
+                    results.append((ref[0], int(ref[1:]), label))
+                position += 1
+        return results
+
+
+def read_entries(using=connection):
+    """
+    Every entry for the books and authors in the database, from one query
+    """
+    with using.cursor() as cursor:
+        cursor.execute(ROWS_SQL)
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            for kind, pk, text, last_name in rows:
+                yield from book_entries(pk, text) if kind == BOOK else author_entries(pk, text, last_name)
+
+
+def build_index():
+    max_bytes, max_age = get_options()
+    started = time.perf_counter()
+    index = PrefixIndex(read_entries(), max_bytes)
+    logger.info('Built autocomplete index of %s entries (%s bytes) in %.2f s',
+                len(index), index.size, time.perf_counter() - started)
+    return index
+
+
+_index = None
+_build_lock = threading.Lock()
+_rebuilding = threading.Event()
+
+
+def get_index():
+    """
+    This process's index, built now if it hasn't been yet
+    """
+    global _index
+    if _index is None:
+        with _build_lock:
+            if _index is None:
+                _index = build_index()
+    elif time.monotonic() - _index.built > get_options()[1] and not _rebuilding.is_set():
+        _rebuilding.set()
+        threading.Thread(target=_rebuild, name='autocomplete-rebuild', daemon=True).start()
+    return _index
+
+
+def _rebuild():
+    global _index
+    try:
+        index = build_index()
+        with _build_lock:
+            _index = index
+    except Exception:
+        logger.exception('Could not rebuild the autocomplete index')
+    finally:
+        connection.close()
+        _rebuilding.clear()
+
+
+def warm():
+    """
+    Builds the index in a background thread, so the first lookup doesn't wait for it
+    """
+    def build():
+        try:
+            get_index()
+        except Exception:
+            logger.exception('Could not build the autocomplete index')
+        finally:
+            connection.close()
+    threading.Thread(target=build, name='autocomplete-build', daemon=True).start()
+
+
+def reset_index():
+    global _index
+    with _build_lock:
+        _index = None
+
+
+def lookup(prefix, limit=10):
+    return get_index().lookup(prefix, limit)
+
+
+def update(old_entries, new_entries):
+    """
+    Swaps an object's old entries for its new ones, in this process's index if
+    it has been built (a new index reads the database anyway)
+    """
+    index = _index
+    if index is None:
+        return
+    old_entries, new_entries = set(old_entries), set(new_entries)
+    index.remove(old_entries - new_entries)
+    index.add(sorted(new_entries - old_entries))
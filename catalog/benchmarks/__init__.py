@@ -0,0 +1,236 @@
+"""
+Benchmarks for the catalog, run with `manage.py benchmark <name>`.
+
+Each benchmark is a module in this package with a `run(out, options)` function.
+The command seeds a scratch database (never the real one) with `seed_catalog`
+before calling it, so benchmarks can assume a populated catalog.
+
+A benchmark may return its results as {name: measurements}. The command can
+then save them as JSON (--output) and compare them with an earlier run
+(--baseline), failing if anything got slower or runs more queries.
+"""
+import datetime
+import json
+import platform
+import random
+import statistics
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+
+from catalog.models import Author, Book, BookAvailability, BookInstance, CatalogStats, CatalogVersion, Genre, Language
+from catalog.search import rebuild_index as rebuild_search_index
+
+# name of the throwaway database the benchmarks run against
+BENCHMARK_DATABASE_NAME = 'benchdb.sqlite3'
+
+# vocabulary for made-up titles and summaries
+WORDS = '''
+    abbey acorn admiral amber anchor angel apple arrow ash autumn badger banner barley basin beacon bear bell
+    birch blade bloom bone border bramble bread bridge bronze brook cabin candle canyon castle cedar chain
+    chapel cherry circle cliff cloud clover coast comet copper coral crane crown crystal dagger dawn desert
+    dragon dream dust eagle echo ember emerald empire falcon feather fern field fire flame forest fortress
+    fountain fox frost garden garnet ghost glacier glass glen gold granite harbor harvest hawk heart heather
+    hill hollow horizon hunter island ivory ivy jade jasmine jewel journey keeper kettle king knight lake
+    lantern lark laurel legend lily lion maple marble meadow mercy mill mirror mist moon morning mountain
+    night north oak ocean orchard owl palace pearl pebble pine prince queen quill rain raven reed river road
+    rose ruby saddle sage salt sea shadow shell shield silver sky smoke snow sparrow spring star stone storm
+    summer sun swan sword thistle thorn thunder tide tiger tower valley velvet violet voyage wanderer willow
+    winter wolf wood wren
+'''.split()
+
+
+@contextmanager
+def scratch_database(keepdb=False):
+    """
+    Points the default connection at a throwaway database for the duration of the
+    block, the same way the test runner does. With keepdb the database (and
+    whatever was seeded into it) survives for the next run. The page fragment
+    cache is swapped for an empty in-memory one too, so pages cached from the
+    real database are never served.
+    """
+    fragment_cache = getattr(settings, 'CATALOG_FRAGMENT_CACHE', {}).get('CACHE', 'default')
+    caches = dict(settings.CACHES, **{fragment_cache: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark-fragments'}})
+    with override_settings(CACHES=caches), _scratch_database(keepdb):
+        yield
+
+
+@contextmanager
+def _scratch_database(keepdb):
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    saved_test_name = test_settings.get('NAME')
+    test_settings['NAME'] = BENCHMARK_DATABASE_NAME
+    old_name = connection.settings_dict['NAME']
+    try:
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=keepdb)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+    finally:
+        test_settings['NAME'] = saved_test_name
+
+
+def _next_id(model):
+    """
+    First free integer id for a model, so bulk_create can hand out ids itself
+    (SQLite doesn't give them back to us)
+    """
+    last = model.objects.order_by('-pk').values_list('pk', flat=True).first()
+    return (last or 0) + 1
+
+
+def _batch_size(model, objects, batch_size):
+    """
+    batch_size, or fewer if the backend can't take that many rows of the model in
+    one INSERT (SQLite's limit on terms in a compound SELECT)
+    """
+    return min(batch_size, max(connection.ops.bulk_batch_size(model._meta.concrete_fields, objects), 1))
+
+
+def seed_catalog(books=1000, copies_per_book=3, authors=None, genres=20, languages=5, borrowers=50,
+                 batch_size=5000, seed=0):
+    """
+    Bulk-loads a synthetic catalog and returns a dict of how many rows were made.
+    Signals aren't sent by bulk_create, so the denormalized tables are rebuilt at the end.
+    """
+    rng = random.Random(seed)
+    authors = authors or max(1, books // 10)
+
+    language_names = ['English'] + ['Language %s' % n for n in range(1, languages)]
+    start = _next_id(Language)
+    Language.objects.bulk_create([Language(id=start + n, name=name) for n, name in enumerate(language_names)])
+    language_ids = list(range(start, start + len(language_names)))
+
+    start = _next_id(Genre)
+    Genre.objects.bulk_create([Genre(id=start + n, name='Genre %s' % n) for n in range(genres)])
+    genre_ids = list(range(start, start + genres))
+
+    start = _next_id(Author)
+    new_authors = [
+        Author(id=start + n, first_name='First%s' % n, last_name='Last%s' % n,
+               date_of_birth=datetime.date(1900, 1, 1) + datetime.timedelta(days=n % 30000))
+        for n in range(authors)]
+    Author.objects.bulk_create(new_authors, batch_size=_batch_size(Author, new_authors, batch_size))
+    author_ids = list(range(start, start + authors))
+
+    users = [User(username='borrower%s_%s' % (seed, n)) for n in range(borrowers)]
+    User.objects.bulk_create(users, batch_size=_batch_size(User, users, batch_size))
+    user_ids = list(User.objects.filter(username__startswith='borrower%s_' % seed).values_list('id', flat=True))
+
+    GenreLink = Book.genre.through
+    today = datetime.date.today()
+    statuses = [code for code, label in BookInstance.LOAN_STATUS]
+    start = _next_id(Book)
+    for offset in range(0, books, batch_size):
+        chunk = range(start + offset, start + min(offset + batch_size, books))
+        Book.objects.bulk_create([
+            Book(id=book_id, title=' '.join(rng.sample(WORDS, 3)).title(),
+                 summary=' '.join(rng.choice(WORDS) for _ in range(12)).capitalize(), isbn='%013d' % book_id,
+                 author_id=rng.choice(author_ids), language_id=rng.choice(language_ids))
+            for book_id in chunk])
+        GenreLink.objects.bulk_create([
+            GenreLink(book_id=book_id, genre_id=genre_id)
+            for book_id in chunk for genre_id in rng.sample(genre_ids, min(2, len(genre_ids)))])
+        copies = []
+        for book_id in chunk:
+            for n in range(copies_per_book):
+                status = rng.choice(statuses)
+                on_loan = status == 'o'
+                copies.append(BookInstance(
+                    id=uuid.UUID(int=rng.getrandbits(128)), book_id=book_id, imprint='Imprint %s' % n, status=status,
+                    due_back=today + datetime.timedelta(days=rng.randint(-30, 30)) if on_loan else None,
+                    borrower_id=rng.choice(user_ids) if on_loan and user_ids else None))
+        BookInstance.objects.bulk_create(copies)
+
+    CatalogStats.rebuild()
+    BookAvailability.rebuild()
+    CatalogVersion.bump()
+    rebuild_search_index()
+    return {'books': books, 'copies': books * copies_per_book, 'authors': authors, 'genres': genres,
+            'languages': len(language_names), 'borrowers': len(user_ids)}
+
+
+def measure(func, repeat=20):
+    """
+    Calls func `repeat` times and returns timing statistics in milliseconds
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        'repeat': repeat,
+        'min': timings[0],
+        'median': statistics.median(timings),
+        'mean': statistics.mean(timings),
+        'p95': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        'p99': timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+        'max': timings[-1],
+    }
+
+
+def report(out, label, timing):
+    """
+    Writes one line of timing results
+    """
+    out.write('%-40s median %9.3f ms   p95 %9.3f ms   min %9.3f ms' % (
+        label, timing['median'], timing['p95'], timing['min']))
+
+
+def save_results(path, results, options):
+    """
+    Writes a benchmark's results to a JSON file along with what was measured
+    """
+    import django
+    data = {
+        'meta': {
+            'benchmark': options['name'],
+            'books': options['books'],
+            'copies': options['copies'],
+            'repeat': options['repeat'],
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'created': datetime.datetime.now().isoformat(),
+        },
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare_results(results, baseline, tolerance=0.25, min_ms=1.0):
+    """
+    Compares results with a baseline saved by save_results and returns a list of
+    regressions: a median or p95 more than `tolerance` (and at least min_ms)
+    slower than the baseline, more queries than the baseline, or a different
+    status code
+    """
+    regressions = []
+    for name, old in sorted(baseline['results'].items()):
+        new = results.get(name)
+        if new is None:
+            regressions.append('%s: missing from this run' % name)
+            continue
+        for key in ('median', 'p95'):
+            if key in old and new[key] > old[key] * (1 + tolerance) and new[key] - old[key] >= min_ms:
+                regressions.append('%s: %s %.2f ms, baseline %.2f ms (+%.0f%%)' % (
+                    name, key, new[key], old[key], (new[key] / old[key] - 1) * 100))
+        if 'queries' in old and new.get('queries', 0) > old['queries']:
+            regressions.append('%s: %s queries, baseline %s' % (name, new['queries'], old['queries']))
+        if 'status' in old and new.get('status') != old['status']:
+            regressions.append('%s: status %s, baseline %s' % (name, new.get('status'), old['status']))
+    return regressions
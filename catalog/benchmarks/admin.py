@@ -0,0 +1,39 @@
+"""
+Admin change lists of the big tables: the queries and time of the first page and
+a filtered page, and what counting each table costs with the stock paginator's
+COUNT(*) and with the estimate the change lists use now
+"""
+from django.contrib.auth.models import User
+from django.core.paginator import Paginator
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from catalog.models import Author, Book, BookInstance
+from catalog.pagination import EstimatedCountPaginator
+
+from . import measure, report
+
+
+def run(out, options):
+    User.objects.create_superuser('benchmark-admin', 'admin@example.com', 'password')
+    client = Client()
+    client.login(username='benchmark-admin', password='password')
+    pages = [
+        ('books', reverse('admin:catalog_book_changelist'), {}),
+        ('copies', reverse('admin:catalog_bookinstance_changelist'), {}),
+        ('copies on loan', reverse('admin:catalog_bookinstance_changelist'), {'status__exact': 'o'}),
+        ('authors', reverse('admin:catalog_author_changelist'), {}),
+    ]
+    for label, url, params in pages:
+        with CaptureQueriesContext(connection) as queries:
+            client.get(url, params)
+        out.write('%s: %d queries' % (label, len(queries)))
+        report(out, '%s page' % label, measure(lambda: client.get(url, params), options['repeat']))
+
+    for model in (Book, BookInstance, Author):
+        name = model._meta.verbose_name_plural
+        report(out, '%s COUNT(*)' % name, measure(lambda: Paginator(model.objects.order_by('pk'), 100).count, options['repeat']))
+        report(out, '%s estimated count' % name,
+               measure(lambda: EstimatedCountPaginator(model.objects.order_by('pk'), 100).count, options['repeat']))
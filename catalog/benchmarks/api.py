@@ -0,0 +1,33 @@
+"""
+Requests per second for the JSON API against the HTML pages the kiosk clients
+used to scrape, for a list page and a book page, plus a repeat poll answered
+304 Not Modified. Requests go through the full middleware stack with the test
+client.
+"""
+from django.core.urlresolvers import reverse
+from django.test import Client
+
+from catalog.models import Book
+
+from . import measure, report
+
+
+def run(out, options):
+    client = Client()
+    book = Book.objects.order_by('pk').first()
+    pages = [
+        ('HTML book list', reverse('books'), {}),
+        ('API book list (10)', reverse('api-books'), {'limit': 10}),
+        ('API book list (50)', reverse('api-books'), {}),
+        ('HTML book detail', book.get_absolute_url(), {}),
+        ('API book detail', reverse('api-book-detail', args=[book.pk]), {}),
+        ('API availability (50)', reverse('api-availability'), {}),
+    ]
+    etag = client.get(reverse('api-books'))['ETag']
+    for label, url, params in pages:
+        timing = measure(lambda: client.get(url, params), options['repeat'])
+        report(out, label, timing)
+        out.write('%-40s %9.0f requests/sec' % ('', 1000 / timing['median']))
+    timing = measure(lambda: client.get(reverse('api-books'), HTTP_IF_NONE_MATCH=etag), options['repeat'])
+    report(out, 'API book list, 304 Not Modified', timing)
+    out.write('%-40s %9.0f requests/sec' % ('', 1000 / timing['median']))
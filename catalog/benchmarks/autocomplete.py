@@ -0,0 +1,65 @@
+"""
+Autocomplete latency: building the prefix index from the seeded catalog (what a
+process does at startup), then building, querying and updating one of
+SYNTHETIC_ENTRIES made-up titles, the size it has to stay fast at
+"""
+import random
+import time
+
+from django.test import Client
+
+from catalog import autocomplete
+
+from . import WORDS, measure, report
+
+SYNTHETIC_ENTRIES = 5000000
+
+
+def synthetic_entries(count, seed=0, start=1):
+    rng = random.Random(seed)
+    for pk in range(start, start + count):
+        title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).title()
+        yield '%s\0%s\0%s%d' % (autocomplete.normalize(title), title, autocomplete.BOOK, pk)
+
+
+def run(out, options):
+    results = {}
+    autocomplete.reset_index()
+    started = time.perf_counter()
+    index = autocomplete.get_index()
+    results['startup: build from the database'] = {'ms': (time.perf_counter() - started) * 1000}
+    out.write('built index of %s entries (%.1f MB) from the database in %.2f s' % (
+        len(index), index.size / 1024 / 1024, time.perf_counter() - started))
+    client = Client()
+    timing = measure(lambda: client.get('/catalog/api/autocomplete/', {'q': WORDS[0][:3]}), options['repeat'])
+    report(out, 'GET /catalog/api/autocomplete/?q=%s' % WORDS[0][:3], timing)
+    results['GET api-autocomplete'] = timing
+
+    entries = list(synthetic_entries(SYNTHETIC_ENTRIES))
+    started = time.perf_counter()
+    # under the default caps, which SYNTHETIC_ENTRIES titles have to fit in
+    index = autocomplete.PrefixIndex(entries, autocomplete.DEFAULT_MAX_BYTES)
+    elapsed = time.perf_counter() - started
+    del entries
+    out.write('built synthetic index of %s entries (%.1f MB, %s left out) in %.2f s' % (
+        len(index), index.size / 1024 / 1024, sum(index.dropped.values()), elapsed))
+    results['synthetic: build'] = {'ms': elapsed * 1000, 'entries': len(index), 'bytes': index.size}
+
+    started = time.perf_counter()
+    for text in ('The Lord of the Rings', 'Les Misérables') * 50000:
+        autocomplete.book_entries(1, text)
+    out.write('normalized 100000 titles in %.2f s' % (time.perf_counter() - started))
+
+    rng = random.Random(1)
+    for label, length in (('1 letter', 1), ('3 letters', 3), ('a whole word', None), ('no match', 0)):
+        prefixes = ['zzzz' if length == 0 else word if length is None else word[:length]
+                    for word in (rng.choice(WORDS) for _ in range(100))]
+        timing = measure(lambda: index.lookup(rng.choice(prefixes)), options['repeat'] * 50)
+        report(out, 'synthetic lookup: %s' % label, timing)
+        results['synthetic lookup: %s' % label] = timing
+
+    entries = synthetic_entries(options['repeat'], seed=2, start=SYNTHETIC_ENTRIES + 1)
+    timing = measure(lambda: index.add([next(entries)]), options['repeat'])
+    report(out, 'synthetic add one entry', timing)
+    results['synthetic add'] = timing
+    return results
@@ -0,0 +1,83 @@
+"""
+Circulation log and rollups: what logging adds to a renewal, rolling up
+SYNTHETIC_EVENTS events spread over SYNTHETIC_DAYS days from scratch, then
+rolling up a few minutes' more on top of them, and the statistics page
+"""
+import datetime
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.test import RequestFactory
+from django.utils import timezone
+
+from catalog import circulation, loans
+from catalog.models import Book, BookInstance, LoanEvent
+from catalog.views import CirculationStatsView
+
+from . import measure, report
+
+SYNTHETIC_EVENTS = 200000
+SYNTHETIC_DAYS = 90
+
+# events rolled up on top of the history: a few minutes' worth, as between runs
+INCREMENT = 1000
+INCREMENT_SPAN = datetime.timedelta(minutes=10)
+
+
+def synthetic_events(count, book_ids, end, span, seed=0):
+    """
+    count made-up events on random books at random times in the span before end
+    """
+    rng = random.Random(seed)
+    kinds = [LoanEvent.CHECKOUT] * 4 + [LoanEvent.RENEWAL, LoanEvent.RETURN] * 2 + [LoanEvent.STATUS]
+    for n in range(count):
+        yield LoanEvent(time=end - datetime.timedelta(seconds=rng.randrange(int(span.total_seconds()))),
+                        kind=rng.choice(kinds), copy_id='00000000-0000-0000-0000-%012d' % n,
+                        book_id=rng.choice(book_ids), status='o')
+
+
+def run(out, options):
+    results = {}
+    loan = BookInstance.objects.on_loan().order_by('pk').first()
+    due_back = datetime.date.today() + datetime.timedelta(weeks=3)
+    timing = measure(lambda: loans.renew([loan.pk], due_back), options['repeat'])
+    report(out, 'bulk renewal of one loan (logged)', timing)
+    results['renew one loan'] = timing
+
+    def save():
+        loan.due_back += datetime.timedelta(days=1)
+        loan.save()
+    timing = measure(save, options['repeat'])
+    report(out, 'save a renewed copy (logged)', timing)
+    results['save one copy'] = timing
+
+    # everything up to now counted, so the synthetic history is all that's left
+    now = timezone.now()
+    circulation.rollup(now=now + circulation.SETTLE * 2)
+    book_ids = list(Book.objects.values_list('pk', flat=True))
+    LoanEvent.objects.bulk_create(synthetic_events(SYNTHETIC_EVENTS, book_ids, now, datetime.timedelta(days=SYNTHETIC_DAYS)))
+    started = time.perf_counter()
+    count = circulation.rollup(now=now + circulation.SETTLE * 2)
+    elapsed = time.perf_counter() - started
+    out.write('rolled up %s events over %s days in %.2f s' % (count, SYNTHETIC_DAYS, elapsed))
+    results['rollup history'] = {'ms': elapsed * 1000, 'events': count}
+
+    LoanEvent.objects.bulk_create(synthetic_events(INCREMENT, book_ids, now, INCREMENT_SPAN, seed=1))
+    started = time.perf_counter()
+    count = circulation.rollup(now=now + circulation.SETTLE * 2)
+    elapsed = time.perf_counter() - started
+    out.write('rolled up %s more events in %.3f s' % (count, elapsed))
+    results['rollup increment'] = {'ms': elapsed * 1000, 'events': count}
+
+    factory = RequestFactory()
+    librarian = User.objects.create_superuser('benchmark-librarian', 'librarian@example.com', 'password')
+
+    def fetch():
+        request = factory.get('/', {'days': SYNTHETIC_DAYS})
+        request.user = librarian
+        CirculationStatsView.as_view()(request).render()
+    timing = measure(fetch, options['repeat'])
+    report(out, 'circulation stats page, %s days' % SYNTHETIC_DAYS, timing)
+    results['circulation stats page'] = timing
+    return results
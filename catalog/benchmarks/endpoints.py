@@ -0,0 +1,125 @@
+"""
+Drives every URL in catalog/urls.py through the full middleware stack with the
+test client, as an anonymous visitor, a borrower or a librarian, and records
+latency percentiles, throughput and the number of queries for each.
+
+Run it with --output to save the results and later with --baseline to compare
+against them, e.g.
+
+    manage.py benchmark endpoints --output baseline.json
+    manage.py benchmark endpoints --baseline baseline.json
+
+The seed is fixed, so two runs with the same --books and --copies measure the
+same data. Each endpoint gets one untimed request first, which also counts its
+queries, so timings are with warm caches. Forms are only fetched, except the
+renewal forms, which are posted (renewing the same copies to the same date),
+and the borrower's hold on the sample book, placed over and over.
+"""
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db import connection, reset_queries
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from catalog.models import Author, Book, BookInstance
+from catalog.views import BookListView
+
+from . import WORDS, measure, report
+
+# endpoints that read whole tables get a tenth of the repetitions
+HEAVY = 10
+
+
+def endpoints(book, author, loan):
+    """
+    (label, url name, url args, params, user, method, heavy) for every URL;
+    user is None, 'borrower' or 'librarian'
+    """
+    deep_page = max(1, min(50, (Book.objects.count() - 1) // BookListView.paginate_by + 1))
+    renewal = {'renewal_date': (datetime.date.today() + datetime.timedelta(weeks=2)).isoformat()}
+    # a class set of loans, renewed together
+    class_set = dict(renewal, action='renew', copy=[str(pk) for pk in BookInstance.objects.on_loan()
+                                                        .order_by('due_back', 'pk').values_list('pk', flat=True)[:40]])
+    return [
+        ('index', 'index', [], {}, None, 'get', False),
+        ('books', 'books', [], {}, None, 'get', False),
+        ('books deep page', 'books', [], {'page': deep_page}, None, 'get', False),
+        ('books keyset', 'books', [], {'cursor': ''}, None, 'get', False),
+        ('search', 'search', [], {'q': WORDS[0]}, None, 'get', False),
+        ('book-detail', 'book-detail', [book.pk], {}, None, 'get', False),
+        ('authors', 'authors', [], {}, None, 'get', False),
+        ('author-detail', 'author-detail', [author.pk], {}, None, 'get', False),
+        ('borrowed-books', 'borrowed-books', [], {}, 'borrower', 'get', False),
+        ('all-borrowed-books', 'all-borrowed-books', [], {}, 'librarian', 'get', False),
+        ('overdue-report', 'overdue-report', [], {}, 'librarian', 'get', False),
+        ('circulation-stats', 'circulation-stats', [], {}, 'librarian', 'get', False),
+        ('renew-book-librarian GET', 'renew-book-librarian', [loan.pk], {}, 'librarian', 'get', False),
+        ('renew-book-librarian POST', 'renew-book-librarian', [loan.pk], renewal, 'librarian', 'post', False),
+        ('bulk-update-loans renew', 'bulk-update-loans', [], class_set, 'librarian', 'post', False),
+        # placing a hold again leaves it where it is
+        ('hold-book', 'hold-book', [book.pk], {'action': 'place'}, 'borrower', 'post', False),
+        ('author-create', 'author-create', [], {}, 'librarian', 'get', False),
+        ('author-update', 'author-update', [author.pk], {}, 'librarian', 'get', False),
+        ('author-delete', 'author-delete', [author.pk], {}, 'librarian', 'get', False),
+        ('book-create', 'book-create', [], {}, 'librarian', 'get', False),
+        ('book-update', 'book-update', [book.pk], {}, 'librarian', 'get', False),
+        ('book-deete', 'book-deete', [book.pk], {}, 'librarian', 'get', False),
+        ('export-catalog loans.csv', 'export-catalog', ['loans', 'csv', ''], {}, 'librarian', 'get', True),
+        ('api-books', 'api-books', [], {}, None, 'get', False),
+        ('api-book-detail', 'api-book-detail', [book.pk], {}, None, 'get', False),
+        ('api-authors', 'api-authors', [], {}, None, 'get', False),
+        ('api-author-detail', 'api-author-detail', [author.pk], {}, None, 'get', False),
+        ('api-copies', 'api-copies', [], {}, None, 'get', False),
+        ('api-copy-detail', 'api-copy-detail', [loan.pk], {}, None, 'get', False),
+        ('api-availability', 'api-availability', [], {}, None, 'get', False),
+        ('api-availability-detail', 'api-availability-detail', [book.pk], {}, None, 'get', False),
+        ('api-autocomplete', 'api-autocomplete', [], {'q': book.title[:3]}, None, 'get', False),
+    ]
+
+
+def sample_objects():
+    """
+    A well-stocked book and author, a copy on loan and its borrower
+    """
+    book = Book.objects.annotate(copies=Count('bookinstance')).order_by('-copies', 'pk').first()
+    author = Author.objects.annotate(books=Count('book')).order_by('-books', 'pk').first()
+    loan = BookInstance.objects.on_loan().exclude(borrower=None).order_by('due_back', 'pk').first()
+    return book, author, loan, loan.borrower
+
+
+def fetch(client, method, url, params):
+    response = getattr(client, method)(url, params)
+    # drain streamed responses so their work is timed too
+    if response.streaming:
+        for chunk in response.streaming_content:
+            pass
+    return response
+
+
+def run(out, options):
+    book, author, loan, borrower = sample_objects()
+    librarian = User.objects.create_superuser('benchmark-librarian', 'librarian@example.com', 'password')
+    clients = {None: Client(), 'borrower': Client(), 'librarian': Client()}
+    clients['borrower'].force_login(borrower)
+    clients['librarian'].force_login(librarian)
+
+    results = {}
+    for label, name, args, params, user, method, heavy in endpoints(book, author, loan):
+        client, url = clients[user], reverse(name, args=args)
+        # the query log is capped, and CaptureQueriesContext can't count once it's full
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            status = fetch(client, method, url, params).status_code
+        # read the count now, the timed requests below reset the query log
+        query_count = len(queries)
+        repeat = max(1, options['repeat'] // HEAVY) if heavy else options['repeat']
+        timing = measure(lambda: fetch(client, method, url, params), repeat)
+        timing.update(queries=query_count, status=status, requests_per_second=1000 / timing['mean'])
+        results[label] = timing
+        report(out, label, timing)
+        out.write('%-40s p99 %9.3f ms   %6.0f req/s   %3d queries   status %s' % (
+            '', timing['p99'], timing['requests_per_second'], timing['queries'], status))
+    return results
@@ -0,0 +1,27 @@
+"""
+Export throughput (rows/sec) for every table and format, and peak Python memory
+use per table (measured in a separate pass, since tracing slows things down)
+"""
+import time
+import tracemalloc
+
+from catalog import export
+from catalog.models import Book, BookInstance
+
+
+def run(out, options):
+    counts = {'books': Book.objects.count(), 'copies': BookInstance.objects.count(),
+              'loans': BookInstance.objects.filter(status__exact='o').count()}
+    for table in ('books', 'copies', 'loans'):
+        for fmt in ('csv', 'jsonl'):
+            for compress in (False, True):
+                started = time.perf_counter()
+                size = sum(len(data) for data in export.export(table, fmt, compress))
+                elapsed = time.perf_counter() - started
+                out.write('%-7s %-5s %-4s %8d rows  %8.0f rows/sec  %7.1f MB out' % (
+                    table, fmt, 'gz' if compress else '', counts[table], counts[table] / elapsed, size / 1e6))
+        tracemalloc.start()
+        for data in export.export(table, 'jsonl', True):
+            pass
+        out.write('%-7s peak memory %.1f MB' % (table, tracemalloc.get_traced_memory()[1] / 1e6))
+        tracemalloc.stop()
@@ -0,0 +1,45 @@
+"""
+Book and author pages with the fragment cache cold (the page's version is
+bumped before every request) and warm, with an in-memory and a file based cache
+"""
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.db.models import Count
+from django.test import Client, override_settings
+
+from catalog import fragments
+from catalog.models import Author, Book
+
+from . import measure, report
+
+
+def run(out, options):
+    client = Client()
+    book = Book.objects.annotate(copies=Count('bookinstance')).order_by('-copies', 'pk').first()
+    author = Author.objects.annotate(books=Count('book')).order_by('-books', 'pk').first()
+    pages = [('book', book.pk, reverse('book-detail', args=[book.pk])),
+             ('author', author.pk, reverse('author-detail', args=[author.pk]))]
+
+    directory = tempfile.mkdtemp()
+    backends = [
+        ('locmem', {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'}),
+        ('file', {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}),
+    ]
+    alias = getattr(settings, 'CATALOG_FRAGMENT_CACHE', {}).get('CACHE', 'default')
+    try:
+        for name, backend in backends:
+            with override_settings(CACHES=dict(settings.CACHES, **{alias: backend})):
+                for kind, pk, url in pages:
+                    def cold():
+                        fragments.invalidate(kind, [pk])
+                        client.get(url)
+                    report(out, '%s %s page, cold' % (name, kind), measure(cold, options['repeat']))
+                    report(out, '%s %s page, warm' % (name, kind), measure(lambda: client.get(url), options['repeat']))
+    finally:
+        shutil.rmtree(directory)
+    for kind, metrics in sorted(fragments.fragment_metrics().items()):
+        out.write('%-6s hits %6d  misses %6d  invalidations %6d' % (
+            kind, metrics['hits'], metrics['misses'], metrics['invalidations']))
@@ -0,0 +1,20 @@
+"""
+Index page counts: five live COUNT(*)s against the single precomputed stats row
+"""
+from django.test import Client
+
+from catalog.models import CatalogStats
+
+from . import measure, report
+
+
+def run(out, options):
+    repeat = options['repeat']
+    live = measure(CatalogStats.live_counts, repeat)
+    report(out, 'live counts (5 queries)', live)
+    precomputed = measure(CatalogStats.load, repeat)
+    report(out, 'precomputed stats row (1 query)', precomputed)
+    out.write('speedup: %.1fx' % (live['median'] / precomputed['median']))
+
+    client = Client()
+    report(out, 'GET /catalog/', measure(lambda: client.get('/catalog/'), repeat))
@@ -0,0 +1,52 @@
+"""
+Every hot BookInstance query (see catalog.queryplans) timed without and with
+the copy indexes, with the query plan each time. The indexes are dropped for
+the "before" run and created again afterwards. Querysets the site only reads a
+page of are fetched; the rest are counted (the way the paginators use them),
+so the timings aren't dominated by building model instances.
+"""
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Count
+
+from catalog.models import Author, Book, BookInstance
+from catalog.queryplans import access_paths, explain, queryset_full_scans
+
+from . import measure, report
+
+
+def time_paths(out, options):
+    user = User.objects.annotate(loans=Count('bookinstance')).order_by('-loans').first()
+    book = Book.objects.filter(pk=BookInstance.objects.filter(borrower=user).values('book_id')[:1]).get()
+    author = book.author or Author.objects.first()
+    timings = {}
+    for name, queryset in access_paths(book, author, user).items():
+        plan = explain(queryset)
+        if queryset.query.high_mark is not None:
+            timings[name] = measure(lambda: list(queryset.all()), options['repeat'])
+        else:
+            timings[name] = measure(queryset.count, options['repeat'])
+        report(out, name, timings[name])
+        out.write('    %s%s' % ('; '.join(plan), '   <-- FULL SCAN' if queryset_full_scans(queryset) else ''))
+    return timings
+
+
+def run(out, options):
+    indexes = BookInstance._meta.indexes
+    out.write('Before: without %s' % ', '.join(index.name for index in indexes))
+    with connection.schema_editor() as editor:
+        for index in indexes:
+            editor.remove_index(BookInstance, index)
+    connection.cursor().execute('ANALYZE')
+    try:
+        before = time_paths(out, options)
+    finally:
+        with connection.schema_editor() as editor:
+            for index in indexes:
+                editor.add_index(BookInstance, index)
+    connection.cursor().execute('ANALYZE')
+    out.write('After:')
+    after = time_paths(out, options)
+    out.write('Speedup (median):')
+    for name in before:
+        out.write('%-40s %8.1fx' % (name, before[name]['median'] / max(after[name]['median'], 0.001)))
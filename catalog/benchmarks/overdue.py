@@ -0,0 +1,35 @@
+"""
+Overdue queries: counting, grouping by borrower, the librarian report and the
+daily snapshot, with the query plan of the overdue filter
+"""
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import RequestFactory
+
+from catalog.models import BookInstance, OverdueSnapshot
+from catalog.views import OverdueReportView
+
+from . import measure, report
+
+
+def run(out, options):
+    factory = RequestFactory()
+    librarian = User.objects.create_superuser('benchmark-librarian', 'librarian@example.com', 'password')
+
+    def fetch():
+        request = factory.get('/')
+        request.user = librarian
+        OverdueReportView.as_view()(request).render()
+
+    overdue = BookInstance.objects.overdue()
+    sql, params = overdue.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        out.write('plan: %s' % '; '.join(str(row[-1]) for row in cursor.fetchall()))
+    out.write('%s overdue loans of %s on loan' % (overdue.count(), BookInstance.objects.on_loan().count()))
+
+    report(out, 'count overdue', measure(overdue.count, options['repeat']))
+    report(out, 'group by borrower, first page',
+           measure(lambda: list(BookInstance.objects.overdue_by_borrower()[:20]), options['repeat']))
+    report(out, 'overdue report page', measure(fetch, options['repeat']))
+    report(out, 'daily snapshot', measure(OverdueSnapshot.take, options['repeat']))
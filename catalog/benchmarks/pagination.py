@@ -0,0 +1,43 @@
+"""
+Offset pagination against keyset pagination, first page and a deep page, for
+the book list and the all-loans list. Page 10,000 needs 100,000 rows; with a
+smaller seed the deepest page that exists is used instead.
+"""
+from django.contrib.auth.models import User
+from django.test import RequestFactory
+
+from catalog.models import Book, BookInstance
+from catalog.pagination import encode_cursor
+from catalog.views import AllBooksLoanedListView, BookListView
+
+from . import measure, report
+
+DEEP_PAGE = 10000
+
+
+def run(out, options):
+    factory = RequestFactory()
+    librarian = User.objects.create_superuser('benchmark-librarian', 'librarian@example.com', 'password')
+
+    def fetch(view_class, params):
+        request = factory.get('/', params)
+        request.user = librarian
+        view_class.as_view()(request).render()
+
+    for view_class, queryset in ((BookListView, Book.objects.all()),
+                                 (AllBooksLoanedListView, BookInstance.objects.filter(status__exact='o'))):
+        ordering = view_class.cursor_ordering
+        queryset = queryset.order_by(*ordering)
+        page_size = view_class.paginate_by
+        deep_page = min(DEEP_PAGE, max(1, (queryset.count() - 1) // page_size + 1))
+        # the cursor a visitor would have after clicking "next" deep_page - 1 times
+        last_row = queryset.values_list(*ordering)[(deep_page - 1) * page_size - 1] if deep_page > 1 else None
+        deep_cursor = encode_cursor('n', last_row) if last_row else ''
+
+        name = view_class.__name__
+        report(out, '%s offset page 1' % name, measure(lambda: fetch(view_class, {'page': 1}), options['repeat']))
+        report(out, '%s offset page %s' % (name, deep_page),
+               measure(lambda: fetch(view_class, {'page': deep_page}), options['repeat']))
+        report(out, '%s keyset page 1' % name, measure(lambda: fetch(view_class, {'cursor': ''}), options['repeat']))
+        report(out, '%s keyset page %s' % (name, deep_page),
+               measure(lambda: fetch(view_class, {'cursor': deep_cursor}), options['repeat']))
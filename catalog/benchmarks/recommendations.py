@@ -0,0 +1,32 @@
+"""
+The "more like this" batch job: a full run, an incremental run after a few books
+change, and the book page reading the stored recommendations
+"""
+from django.test import Client
+
+from catalog import recommendations
+from catalog.models import Book, Genre
+
+from . import measure, report
+
+CHANGED_BOOKS = 20
+
+
+def run(out, options):
+    for label, incremental in (('full run', False), ('incremental run, nothing changed', True)):
+        recorded = recommendations.recompute(incremental=incremental)
+        out.write('%-40s %6d books  load %.2f s  compute %.2f s  store %.2f s' % (
+            label, recorded.recomputed, recorded.load_seconds, recorded.compute_seconds, recorded.store_seconds))
+
+    genre = Genre.objects.order_by('pk').first()
+    for book in Book.objects.order_by('pk')[:CHANGED_BOOKS]:
+        book.genre.add(genre)
+    recorded = recommendations.recompute(incremental=True)
+    out.write('%-40s %6d books  load %.2f s  compute %.2f s  store %.2f s' % (
+        'incremental run, %s books changed' % CHANGED_BOOKS, recorded.recomputed,
+        recorded.load_seconds, recorded.compute_seconds, recorded.store_seconds))
+
+    book = Book.objects.order_by('pk').first()
+    client = Client()
+    report(out, 'GET %s' % book.get_absolute_url(),
+           measure(lambda: client.get(book.get_absolute_url()), options['repeat']))
@@ -0,0 +1,37 @@
+"""
+Full-text search latency: rebuilding the FTS5 index, and ranked first pages and
+match counts for selective and common queries
+"""
+import time
+
+from django.test import Client
+
+from catalog import search
+from catalog.models import Book
+
+from . import WORDS, measure, report
+
+
+def run(out, options):
+    started = time.perf_counter()
+    indexed = search.rebuild_index()
+    out.write('rebuilt index of %s books in %.2f s' % (indexed, time.perf_counter() - started))
+
+    book = Book.objects.select_related('author').order_by('id').first()
+    queries = [
+        ('isbn', book.isbn),
+        ('exact title', book.title),
+        ('author name', '%s %s' % (book.author.first_name, book.author.last_name)),
+        ('two common words', '%s %s' % (WORDS[0], WORDS[1])),
+        ('one common word', WORDS[2]),
+        ('prefix while typing', WORDS[3][:3]),
+    ]
+    for label, query in queries:
+        results = search.search_books(query)
+        report(out, '%s: first page' % label, measure(lambda: search.search_books(query)[:10], options['repeat']))
+        report(out, '%s: count (%s)' % (label, results.count()),
+               measure(lambda: search.search_books(query).count(), options['repeat']))
+
+    client = Client()
+    report(out, 'GET /catalog/search/?q=%s' % WORDS[0],
+           measure(lambda: client.get('/catalog/search/', {'q': WORDS[0]}), options['repeat']))
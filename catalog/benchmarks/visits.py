@@ -0,0 +1,50 @@
+"""
+Load test for the index page visit counter: database writes and time per hit
+when counting in the session (the old way) versus the batched VisitBuffer
+"""
+import time
+
+from django.contrib.sessions.backends.db import SessionStore
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from catalog.visits import get_visit_buffer, reset_visit_buffer
+
+VISITORS = 20
+
+
+def count_writes(queries):
+    return sum(1 for q in queries.captured_queries if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE')))
+
+
+def session_counter(hits):
+    """
+    What the index view used to do: read the session, bump num_visits, save it
+    """
+    sessions = [SessionStore() for _ in range(VISITORS)]
+    for hit in range(hits):
+        session = SessionStore(session_key=sessions[hit % VISITORS].session_key)
+        session['num_visits'] = session.get('num_visits', 0) + 1
+        session.save()
+        sessions[hit % VISITORS] = session
+
+
+def index_requests(hits):
+    clients = [Client() for _ in range(VISITORS)]
+    for hit in range(hits):
+        clients[hit % VISITORS].get('/catalog/')
+    get_visit_buffer().flush()
+
+
+def run(out, options):
+    hits = options['repeat'] * 50
+    out.write('%s hits from %s visitors' % (hits, VISITORS))
+    for label, func in (('session counter only (old)', session_counter),
+                        ('GET /catalog/ with VisitBuffer', index_requests)):
+        reset_visit_buffer()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            func(hits)
+            elapsed = time.perf_counter() - started
+        out.write('%-40s %6d writes   %8.3f ms/hit' % (label, count_writes(queries), elapsed * 1000 / hits))
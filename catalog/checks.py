@@ -0,0 +1,52 @@
+"""
+System checks for the vendored static files (see catalog/assets.py): pages
+falling back to the CDN because `manage.py vendor_static` hasn't been run are
+a warning in development and an error under `manage.py check --deploy`, as are
+files with no pinned hash. A vendored file that doesn't match its hash is
+always an error.
+"""
+from django.contrib.staticfiles import finders
+from django.core import checks
+
+from .assets import VENDOR_ASSETS, check_integrity
+
+
+def missing_files():
+    return [path for path, url, sri in VENDOR_ASSETS if not finders.find(path)]
+
+
+@checks.register('staticfiles')
+def check_vendored_files(app_configs, **kwargs):
+    errors = []
+    missing = missing_files()
+    if missing:
+        errors.append(checks.Warning(
+            '%s of the vendored static files are missing, so pages load them from the CDN: %s'
+            % (len(missing), ', '.join(missing)),
+            hint='Run `manage.py vendor_static`.', id='catalog.W001'))
+    for path, url, sri in VENDOR_ASSETS:
+        found = finders.find(path)
+        if found and sri:
+            with open(found, 'rb') as vendored:
+                if not check_integrity(vendored.read(), sri):
+                    errors.append(checks.Error(
+                        '%s does not match its pinned hash %s' % (path, sri),
+                        hint='Fetch it again with `manage.py vendor_static --force`.', id='catalog.E002'))
+    return errors
+
+
+@checks.register('staticfiles', deploy=True)
+def check_vendored_files_for_deploy(app_configs, **kwargs):
+    errors = []
+    missing = missing_files()
+    if missing:
+        errors.append(checks.Error(
+            'The vendored static files are missing, so pages would load them from the CDN: %s' % ', '.join(missing),
+            hint='Run `manage.py vendor_static` before deploying.', id='catalog.E001'))
+    unpinned = [path for path, url, sri in VENDOR_ASSETS if not sri]
+    if unpinned:
+        errors.append(checks.Error(
+            'No Subresource Integrity hash is pinned for %s' % ', '.join(unpinned),
+            hint='`manage.py vendor_static --no-verify` prints the hash of each unpinned file it fetches; '
+                 'add them to VENDOR_ASSETS in catalog/assets.py.', id='catalog.E003'))
+    return errors
@@ -0,0 +1,184 @@
+"""
+The circulation log and the statistics rolled up from it.
+
+Every time a copy is lent, renewed, returned or moved to another status, a
+LoanEvent row is appended: from the BookInstance post_save handler (the admin,
+the renewal form) and from the bulk paths that bypass it (catalog.loans,
+catalog.holds), which log all their copies with one bulk INSERT. Nothing on the
+request path reads the log.
+
+`manage.py rollup_loans` (run it every few minutes, e.g. from cron) folds the
+events logged since its last run into daily counts for the whole library, each
+book and each genre (DailyLoans, DailyBookLoans, DailyGenreLoans). It starts
+after the last event it counted, recorded in LoanRollupMark, so each run only
+reads the new events through the primary key, however long the log gets. The
+statistics page reads only the rollups.
+
+Event ids are handed out when rows are inserted but become visible when their
+transaction commits, which can be in a different order. Events younger than
+SETTLE are left for the next run so that one committing late isn't skipped.
+
+Copies created by the importer aren't logged: loading a catalog isn't
+circulation.
+"""
+import datetime
+from collections import Counter, defaultdict
+
+from django.utils import timezone
+
+from . import locking
+from .models import Book, DailyBookLoans, DailyGenreLoans, DailyLoans, LoanCounts, LoanEvent, LoanRollupMark
+
+# how old an event has to be before it is rolled up
+SETTLE = datetime.timedelta(minutes=1)
+
+# events per transaction when rolling up
+BATCH_SIZE = 10000
+
+# ids per query, under SQLite's limit on query parameters
+IDS_PER_QUERY = 500
+
+
+def kinds(old, status, borrower_id, due_back):
+    """
+    The kinds of event a copy going from old (its row before the change as a
+    dict, or None for a new copy) to the given status, borrower and due date
+    amounts to
+    """
+    was_on_loan = old is not None and old['status'] == 'o'
+    if status == 'o':
+        if not was_on_loan:
+            return [LoanEvent.CHECKOUT]
+        if old['borrower_id'] != borrower_id:
+            # handed straight from one borrower to the next
+            return [LoanEvent.RETURN, LoanEvent.CHECKOUT]
+        return [LoanEvent.RENEWAL] if old['due_back'] != due_back else []
+    if was_on_loan:
+        return [LoanEvent.RETURN]
+    return [LoanEvent.STATUS] if old is not None and old['status'] != status else []
+
+
+def log(kind, copies, status, due_back=None):
+    """
+    Appends an event of this kind for each copy (dicts with id, book_id and
+    borrower_id, as catalog.loans reads them), in one INSERT
+    """
+    now = timezone.now()
+    LoanEvent.objects.bulk_create([
+        LoanEvent(time=now, kind=kind, copy_id=copy['id'], book_id=copy['book_id'],
+                  borrower_id=copy['borrower_id'], status=status, due_back=due_back)
+        for copy in copies])
+
+
+def log_saved(copy):
+    """
+    Logs what saving this copy changed, going by the row stashed by the pre_save
+    handler
+    """
+    old = getattr(copy, '_old_state', None)
+    found = kinds(old, copy.status, copy.borrower_id, copy.due_back)
+    if not found:
+        return
+    now = timezone.now()
+    # a return is the previous borrower's
+    LoanEvent.objects.bulk_create([
+        LoanEvent(time=now, kind=kind, copy_id=copy.pk, book_id=copy.book_id,
+                  borrower_id=old['borrower_id'] if kind == LoanEvent.RETURN else copy.borrower_id,
+                  status=copy.status, due_back=copy.due_back)
+        for kind in found])
+
+
+def rollup(now=None, batch_size=BATCH_SIZE):
+    """
+    Adds the events logged since the last run (and at least SETTLE ago) to the
+    daily rollups, a batch at a time, each batch in one transaction with the
+    mark moved past it. Returns the number of events rolled up.
+    """
+    cutoff = (now or timezone.now()) - SETTLE
+    total = 0
+    while True:
+        with locking.immediate():
+            mark = LoanRollupMark.objects.select_for_update().filter(pk=1).first()
+            if mark is None:
+                mark = LoanRollupMark.objects.create(pk=1)
+            events = []
+            for event in (LoanEvent.objects.filter(pk__gt=mark.last_event).order_by('pk')
+                          .values_list('pk', 'time', 'kind', 'book_id')[:batch_size]):
+                if event[1] >= cutoff:
+                    # this one and any after it are left for the next run
+                    break
+                events.append(event)
+            if events:
+                add_events(events)
+                mark.last_event = events[-1][0]
+            mark.last_run = timezone.now()
+            mark.save()
+        total += len(events)
+        if len(events) < batch_size:
+            return total
+
+
+def add_events(events):
+    """
+    Adds (id, time, kind, book id) events to the daily counts, in the caller's
+    transaction
+    """
+    days, books = defaultdict(Counter), defaultdict(Counter)
+    for pk, time, kind, book_id in events:
+        field = LoanCounts.KIND_FIELDS.get(kind)
+        if field is None:
+            continue
+        day = timezone.localtime(time).date()
+        days[(day,)][field] += 1
+        if book_id is not None:
+            books[day, book_id][field] += 1
+    if not days:
+        return
+
+    genres = defaultdict(Counter)
+    existing, links = set(), defaultdict(list)
+    book_ids = sorted({book_id for day, book_id in books})
+    for start in range(0, len(book_ids), IDS_PER_QUERY):
+        batch = book_ids[start:start + IDS_PER_QUERY]
+        existing.update(Book.objects.filter(pk__in=batch).values_list('pk', flat=True))
+        for book_id, genre_id in Book.genre.through.objects.filter(book_id__in=batch).values_list('book_id', 'genre_id'):
+            links[book_id].append(genre_id)
+    for (day, book_id), counts in list(books.items()):
+        if book_id not in existing:
+            # the book has been deleted since; the library's totals still count it
+            del books[day, book_id]
+            continue
+        for genre_id in links[book_id]:
+            genres[day, genre_id].update(counts)
+
+    add_counts(DailyLoans, ('date',), days)
+    add_counts(DailyBookLoans, ('date', 'book_id'), books)
+    add_counts(DailyGenreLoans, ('date', 'genre_id'), genres)
+
+
+def add_counts(model, key_fields, counts):
+    """
+    Adds {key: Counter(field: number)} to the model's rows, keyed by the values
+    of key_fields. The rows that already exist are read, deleted and written
+    back with the new counts added, so a batch takes a few statements rather
+    than an UPDATE per row; only rollup() writes these tables, and it runs one
+    at a time.
+    """
+    fields = list(LoanCounts.KIND_FIELDS.values())
+    rows = model.objects.filter(date__in=sorted({key[0] for key in counts})).order_by()
+    if len(key_fields) > 1:
+        ids = sorted({key[1] for key in counts})
+        querysets = [rows.filter(**{'%s__in' % key_fields[1]: ids[start:start + IDS_PER_QUERY]})
+                     for start in range(0, len(ids), IDS_PER_QUERY)]
+    else:
+        querysets = [rows]
+    replaced = []
+    for queryset in querysets:
+        for row in queryset.values_list('pk', *key_fields + tuple(fields)):
+            key = row[1:1 + len(key_fields)]
+            if key in counts:
+                replaced.append(row[0])
+                counts[key].update(dict(zip(fields, row[1 + len(key_fields):])))
+    for start in range(0, len(replaced), IDS_PER_QUERY):
+        model.objects.filter(pk__in=replaced[start:start + IDS_PER_QUERY]).delete()
+    model.objects.bulk_create([model(**dict(zip(key_fields, key), **counts[key])) for key in sorted(counts)])
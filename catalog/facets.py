@@ -0,0 +1,90 @@
+"""
+Faceted browsing for the book list: filter by genre, language and availability,
+with the number of books next to each choice.
+
+Each facet's counts take one GROUP BY query over the books matching the *other*
+active filters (the usual faceting rule, so choosing a genre doesn't hide the
+other genres), which is one aggregate per dimension, not one per choice. They are
+cached in the fragment cache (catalog.fragments) under the 'facets' kind, with
+one version for the books (bumped when books, their genres, genres or languages
+change) and one for the copies (bumped when copies change status). Counts that
+involve availability depend on both, the others only on the books, so lending a
+copy doesn't throw away the genre and language counts.
+"""
+from django.db.models import Case, Count, IntegerField, Sum, When
+
+from . import fragments
+
+# query parameter for each dimension, in the order the sidebar shows them
+DIMENSIONS = ('genre', 'language', 'available')
+
+BOOKS = 'books'
+COPIES = 'copies'
+
+
+def parse_filters(params):
+    """
+    {dimension: value} for the filters in a query string that are well formed:
+    genre and language take an id, available only '1'
+    """
+    filters = {}
+    for dimension in ('genre', 'language'):
+        try:
+            filters[dimension] = int(params[dimension])
+        except (KeyError, ValueError):
+            pass
+    if params.get('available') == '1':
+        filters['available'] = 1
+    return filters
+
+
+def apply_filters(queryset, filters):
+    if 'genre' in filters:
+        queryset = queryset.filter(genre=filters['genre'])
+    if 'language' in filters:
+        queryset = queryset.filter(language=filters['language'])
+    if filters.get('available'):
+        queryset = queryset.filter(availability__available__gt=0)
+    return queryset
+
+
+def count_dimension(queryset, dimension):
+    """
+    [(value, label, number of books)] for one dimension, in one query
+    """
+    if dimension == 'available':
+        counts = queryset.order_by().aggregate(available=Sum(Case(
+            When(availability__available__gt=0, then=1), default=0, output_field=IntegerField())))
+        return [(1, 'Available now', counts['available'] or 0)]
+    rows = (queryset.exclude(**{dimension: None}).order_by()
+            .values_list(dimension, '%s__name' % dimension).annotate(number=Count('id'))
+            .order_by('%s__name' % dimension))
+    return list(rows)
+
+
+def facet_counts(queryset, filters):
+    """
+    {dimension: [(value, label, count)]} for the books in queryset, each
+    dimension counted with the other dimensions' filters applied
+    """
+    cache = fragments.get_cache()
+    copies_version = None
+    counts = {}
+    for dimension in DIMENSIONS:
+        others = {key: value for key, value in filters.items() if key != dimension}
+        vary_on = [dimension] + ['%s=%s' % item for item in sorted(others.items())]
+        if dimension == 'available' or others.get('available'):
+            if copies_version is None:
+                copies_version = fragments.get_version(cache, 'facets', COPIES)
+            vary_on.append(copies_version)
+        counts[dimension] = fragments.get_or_render(
+            'facets', BOOKS, lambda: count_dimension(apply_filters(queryset, others), dimension), vary_on)
+    return counts
+
+
+def invalidate_books():
+    fragments.invalidate('facets', [BOOKS])
+
+
+def invalidate_copies():
+    fragments.invalidate('facets', [COPIES])
@@ -0,0 +1,156 @@
+"""
+Cache for the rendered content of the book and author pages, and of each
+borrower's list of loans ("My books").
+
+Those pages are read far more often than the catalog changes, so the main block
+of each is rendered once and kept in a cache (the {% cachefragment %} tag in
+catalog_extras). Cached fragments are never deleted. Instead every book, author
+and borrower has a version number in the cache, the version is part of the
+fragment's key, and the signal handlers in catalog.signals bump the versions of
+exactly the pages a change shows up on, once the change commits. A borrower's
+version only moves when a copy lent to them changes (renewed, returned, checked
+out) or one of their books is edited. The next request then misses and renders afresh, and the stale
+fragment ages out of the cache by itself.
+
+The book list's facet counts are cached the same way, see catalog.facets.
+
+A page rendered from a read replica (see catalog.routers) may predate the change
+that invalidated it, if the replica is behind, so its fragment is only kept for
+STICKY_SECONDS, the time replicas are trusted to catch up in.
+
+A version that has been evicted starts again from the current time in
+microseconds rather than from 1, so it can never come back to a key that still
+holds an old fragment.
+
+Configure with the CATALOG_FRAGMENT_CACHE setting, e.g. {'CACHE': 'catalog'}
+to use the cache with that alias (default 'default'). It should be a cache
+shared by all the server processes (file based, memcached) so that a change made
+through one process invalidates the pages cached by the others. Hits, misses and
+invalidations are counted per process, see fragment_metrics().
+"""
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+
+from . import routers
+
+logger = logging.getLogger(__name__)
+
+KINDS = ('book', 'author', 'borrower', 'facets')
+
+_metrics = Counter()
+_metrics_lock = threading.Lock()
+
+
+def get_cache():
+    alias = getattr(settings, 'CATALOG_FRAGMENT_CACHE', {}).get('CACHE', 'default')
+    return caches[alias]
+
+
+def version_key(kind, pk):
+    return 'catalog:fragment:%s:%s:version' % (kind, pk)
+
+
+def fragment_key(kind, pk, version, vary_on=()):
+    return 'catalog:fragment:%s:%s:%s:%s' % (kind, pk, version, ':'.join(str(value) for value in vary_on))
+
+
+def count(kind, event, number=1):
+    with _metrics_lock:
+        _metrics[kind, event] += number
+
+
+def fragment_metrics():
+    """
+    Hits, misses and invalidations for each kind of page since this process
+    started (or since reset_fragment_metrics), with the hit ratio
+    """
+    with _metrics_lock:
+        metrics = {}
+        for kind in KINDS:
+            hits, misses = _metrics[kind, 'hits'], _metrics[kind, 'misses']
+            metrics[kind] = {
+                'hits': hits,
+                'misses': misses,
+                'invalidations': _metrics[kind, 'invalidations'],
+                'hit_ratio': hits / (hits + misses) if hits + misses else None,
+            }
+        return metrics
+
+
+def reset_fragment_metrics():
+    with _metrics_lock:
+        _metrics.clear()
+
+
+def get_version(cache, kind, pk):
+    """
+    The current version of a page, starting one if it doesn't have one yet
+    """
+    key = version_key(kind, pk)
+    version = cache.get(key)
+    if version is None:
+        # never expires; if it's evicted anyway the clock gives a fresh number
+        cache.add(key, int(time.time() * 1000000), None)
+        version = cache.get(key)
+    return version
+
+
+def get_or_render(kind, pk, render, vary_on=()):
+    """
+    Returns the cached fragment for this version of the page, or renders it with
+    render() and caches it
+    """
+    cache = get_cache()
+    key = fragment_key(kind, pk, get_version(cache, kind, pk), vary_on)
+    content = cache.get(key)
+    if content is not None:
+        count(kind, 'hits')
+        return content
+    count(kind, 'misses')
+    logger.debug('Fragment cache miss: %s', key)
+    content = render()
+    cache.set(key, content, routers.get_options()[1] if routers.replica_in_use() else DEFAULT_TIMEOUT)
+    return content
+
+
+def invalidate(kind, pks):
+    """
+    Bumps the versions of these pages, so their cached fragments are no longer
+    used, once the current transaction commits (at once outside a transaction).
+    Bumped any earlier, a request coming in before the commit would render the
+    old rows under the new version, and that page would stay stale until the
+    next change.
+    """
+    pks = {pk for pk in pks if pk is not None}
+    if pks:
+        transaction.on_commit(lambda: _bump(kind, pks))
+
+
+def _bump(kind, pks):
+    cache = get_cache()
+    for pk in pks:
+        try:
+            cache.incr(version_key(kind, pk))
+        except ValueError:
+            # no version, so nothing has been cached for this version yet either
+            pass
+    count(kind, 'invalidations', len(pks))
+
+
+def invalidate_books(pks):
+    invalidate('book', pks)
+
+
+def invalidate_authors(pks):
+    invalidate('author', pks)
+
+
+def invalidate_borrowers(pks):
+    invalidate('borrower', pks)
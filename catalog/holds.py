@@ -0,0 +1,148 @@
+"""
+The hold queue: patrons waiting for a book, served first come, first served.
+
+A hold waits until a copy of its book is available. The copy is then Reserved
+for the hold's patron (status 'r', with them as its borrower) until they collect
+it, and it goes on loan to them, or cancel, and it goes to the next hold in the
+queue. Copies are handed out whenever one may have become free for a waiting
+hold: when a hold is placed or cancelled, and when copies are returned
+(loans.mark_returned).
+
+Every change runs in a locking.immediate() transaction with the books' rows
+locked, so for any one book, holds are placed and copies handed out one at a
+time, and a copy returned while a hold is being placed goes to that hold
+whichever of the two commits first. Handing a copy over is also a pair of
+conditional UPDATEs (the copy only if it is still available, the hold only if
+it still has no copy), and a copy can only be attached to one hold, so a copy
+is never given out twice even by code that doesn't take the locks.
+
+The copies' statuses are changed with QuerySet.update(), so the catalog stats
+and the books' availability counts are adjusted, and the changes logged (see
+catalog.circulation), here.
+"""
+import datetime
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import circulation, facets, fragments, locking
+from .models import Book, BookAvailability, BookInstance, CatalogStats, CatalogVersion, Hold, LoanEvent
+
+# how long a collected copy is lent for
+LOAN_PERIOD = datetime.timedelta(weeks=3)
+
+
+def _changed(book_ids):
+    CatalogVersion.bump()
+    facets.invalidate_copies()
+    # the copies' statuses are listed on the book's page and counted on its author's
+    fragments.invalidate_books(book_ids)
+    fragments.invalidate_authors(Book.objects.filter(pk__in=book_ids).values_list('author_id', flat=True))
+
+
+def _copy(copy_id, hold):
+    # the copy as circulation.log() takes it, with the hold's patron as the borrower
+    return {'id': copy_id, 'book_id': hold.book_id, 'borrower_id': hold.patron_id}
+
+
+def _reserve(hold, copy_id):
+    """
+    Reserves the copy for the hold, unless the copy is no longer available or the
+    hold has been served or cancelled since they were read
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        if not BookInstance.objects.filter(pk=copy_id, status='a').update(status='r', borrower=hold.patron_id):
+            return False
+        if not Hold.objects.filter(pk=hold.pk, copy=None).update(copy=copy_id, ready=now):
+            # puts the copy back
+            transaction.set_rollback(True)
+            return False
+        CatalogStats.adjust(num_instances_available=-1)
+        BookAvailability.adjust({(hold.book_id, 'a'): -1, (hold.book_id, 'r'): 1})
+        circulation.log(LoanEvent.STATUS, [_copy(copy_id, hold)], 'r')
+    hold.copy_id, hold.ready = copy_id, now
+    return True
+
+
+def allocate(book_ids):
+    """
+    Reserves the available copies of these books for their oldest waiting holds,
+    as many as there are of both, and returns the holds that got a copy. Runs in
+    the caller's transaction, which should have the books locked.
+    """
+    served = []
+    # one query to skip the books nobody is waiting for
+    waited_for = Hold.objects.waiting().filter(book_id__in=book_ids).order_by().values_list('book_id', flat=True)
+    for book_id in sorted(set(waited_for)):
+        while True:
+            copy_ids = list(BookInstance.objects.filter(book_id=book_id, status='a').order_by('pk')
+                            .values_list('pk', flat=True))
+            queue = list(Hold.objects.waiting().filter(book_id=book_id)[:len(copy_ids)]) if copy_ids else []
+            for hold, copy_id in zip(queue, copy_ids):
+                if not _reserve(hold, copy_id):
+                    # changed behind our back; read the queue again rather than serve a later hold first
+                    break
+                served.append(hold)
+            else:
+                break
+    return served
+
+
+def place(book, patron):
+    """
+    Puts patron at the back of the book's queue (or leaves them where they are,
+    if they already hold it) and returns their hold, which has a copy already
+    if one was available
+    """
+    with locking.immediate():
+        locking.lock_books([book.pk])
+        hold, created = Hold.objects.get_or_create(book=book, patron=patron)
+        served = allocate([book.pk]) if created else []
+        if served:
+            _changed([book.pk])
+    return next((served_hold for served_hold in served if served_hold.pk == hold.pk), hold)
+
+
+def cancel(hold):
+    """
+    Takes the hold out of its queue. A copy reserved for it goes to the next
+    hold, or back on the shelf.
+    """
+    with locking.immediate():
+        locking.lock_books([hold.book_id])
+        # the hold as it is now (it may have got a copy since it was loaded)
+        hold = Hold.objects.filter(pk=hold.pk).first()
+        if hold is None:
+            return
+        hold.delete()
+        if hold.copy_id and BookInstance.objects.filter(pk=hold.copy_id, status='r').update(status='a', borrower=None):
+            CatalogStats.adjust(num_instances_available=1)
+            BookAvailability.adjust({(hold.book_id, 'r'): -1, (hold.book_id, 'a'): 1})
+            circulation.log(LoanEvent.STATUS, [_copy(hold.copy_id, hold)], 'a')
+            allocate([hold.book_id])
+            _changed([hold.book_id])
+
+
+def collect(hold, due_back=None):
+    """
+    Lends the copy reserved for the hold to its patron, due back after
+    LOAN_PERIOD unless due_back is given, and closes the hold. Returns the
+    copy's id, or None if no copy is reserved for the hold.
+    """
+    with locking.immediate():
+        locking.lock_books([hold.book_id])
+        hold = Hold.objects.filter(pk=hold.pk).first()
+        if hold is None or hold.copy_id is None:
+            return None
+        due_back = due_back or datetime.date.today() + LOAN_PERIOD
+        if not BookInstance.objects.filter(pk=hold.copy_id, status='r').update(
+                status='o', borrower=hold.patron_id, due_back=due_back):
+            return None
+        circulation.log(LoanEvent.CHECKOUT, [_copy(hold.copy_id, hold)], 'o', due_back)
+        BookAvailability.adjust({(hold.book_id, 'r'): -1, (hold.book_id, 'o'): 1})
+        hold.delete()
+        _changed([hold.book_id])
+        # the copy is now on the patron's list of loans
+        fragments.invalidate_borrowers([hold.patron_id])
+    return hold.copy_id
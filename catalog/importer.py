@@ -0,0 +1,300 @@
+"""
+Streaming bulk import of books (with their authors, genres, language and copies)
+from CSV or JSON Lines, used by `manage.py import_catalog`.
+
+Each input row is one book:
+
+    title, summary, isbn, author_first_name, author_last_name, language,
+    genres, copies, imprint, status
+
+genres is a '|'-separated list in CSV (a list or a '|'-separated string in
+JSONL), copies is how many BookInstance rows to create (default 0), with the
+given imprint and status (default 'a'). Only title is required.
+
+Rows are read lazily and handled in fixed-size chunks, each in its own
+transaction with one bulk INSERT per table, so memory use depends on the chunk
+size and not on the size of the file. Authors, genres and languages are looked
+up through bounded in-memory caches, and created in bulk when missing. Rows
+that are left out are counted, and only the first few kept for the report.
+
+Given a checkpoint name (the command uses the file's path), the number of rows
+done is saved in an ImportCheckpoint row inside each chunk's transaction, so an
+import that dies part way can be resumed from exactly where it stopped.
+"""
+import csv
+import io
+import json
+import uuid
+from collections import OrderedDict
+from itertools import islice
+
+from django.db import connection, transaction
+from django.db.models import Max
+
+from . import autocomplete, facets, fragments, search
+from .models import (Author, Book, BookAvailability, BookInstance, CatalogStats, CatalogVersion, Genre,
+                     ImportCheckpoint, Language)
+
+STATUS_CODES = {code for code, label in BookInstance.LOAN_STATUS}
+
+# skipped rows kept with their reasons; the rest are only counted
+SKIPPED_SAMPLE = 20
+
+
+class CatalogImportError(Exception):
+    """
+    Raised for input that can't be imported at all (as opposed to single bad rows)
+    """
+
+
+def read_rows(path, fmt=None):
+    """
+    Yields one dict per input row. The format is taken from the file extension
+    unless given ('csv' or 'jsonl').
+    """
+    fmt = fmt or ('jsonl' if path.endswith(('.jsonl', '.json')) else 'csv')
+    with io.open(path, encoding='utf-8', newline='') as source:
+        if fmt == 'csv':
+            for row in csv.DictReader(source):
+                yield row
+        elif fmt == 'jsonl':
+            for line_number, line in enumerate(source, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    raise CatalogImportError('Line %s is not valid JSON: %s' % (line_number, e))
+        else:
+            raise CatalogImportError('Unknown format %r' % fmt)
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class LookupCache(object):
+    """
+    A name -> id mapping that forgets the least recently used names beyond maxsize
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __getitem__(self, key):
+        self.data.move_to_end(key)
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+
+def bulk_create_with_ids(model, objects):
+    """
+    bulk_create that leaves every object with its primary key set. Backends that
+    can return ids from a bulk insert do so; otherwise (SQLite) the ids are
+    handed out here, inside the caller's transaction.
+    """
+    if not objects:
+        return objects
+    if connection.features.can_return_ids_from_bulk_insert:
+        return model.objects.bulk_create(objects)
+    next_id = (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+    for n, obj in enumerate(objects):
+        obj.pk = next_id + n
+    return model.objects.bulk_create(objects)
+
+
+def clean(value):
+    return (value or '').strip() if not isinstance(value, (int, float)) else value
+
+
+class CatalogImporter(object):
+    """
+    Imports rows chunk by chunk. Totals are kept in rows_done, books, copies and
+    skipped (the number of rows that were left out); skipped_rows has (row number,
+    reason) for the first SKIPPED_SAMPLE of them.
+    """
+
+    def __init__(self, chunk_size=1000, cache_size=100000, checkpoint=None):
+        self.chunk_size = chunk_size
+        self.checkpoint = checkpoint
+        self.authors = LookupCache(cache_size)
+        self.genres = LookupCache(cache_size)
+        self.languages = LookupCache(cache_size)
+        self.rows_done = self.books = self.copies = self.skipped = 0
+        self.skipped_rows = []
+
+    def run(self, rows, skip=0, on_chunk=None):
+        """
+        Imports rows, ignoring the first `skip` (already imported) ones. on_chunk is
+        called with the importer after each chunk has been committed.
+        """
+        self.rows_done = skip
+        for chunk in chunked(islice(rows, skip, None), self.chunk_size):
+            with transaction.atomic():
+                self.import_chunk(chunk)
+                if self.checkpoint:
+                    ImportCheckpoint.objects.update_or_create(source=self.checkpoint,
+                                                              defaults={'rows_done': self.rows_done})
+            if on_chunk:
+                on_chunk(self)
+
+    def import_chunk(self, rows):
+        books, copies = [], []
+        parsed = []
+        for n, row in enumerate(rows, self.rows_done + 1):
+            try:
+                parsed.append(self.parse(row))
+            except ValueError as e:
+                self.skipped += 1
+                if len(self.skipped_rows) < SKIPPED_SAMPLE:
+                    self.skipped_rows.append((n, str(e)))
+        self.rows_done += len(rows)
+        if not parsed:
+            return
+
+        authors = self.resolve(self.authors, {r['author'] for r in parsed if r['author']}, self.create_authors)
+        genres = self.resolve(self.genres, {g for r in parsed for g in r['genres']}, self.create_genres)
+        languages = self.resolve(self.languages, {r['language'] for r in parsed if r['language']}, self.create_languages)
+
+        for r in parsed:
+            books.append(Book(title=r['title'], summary=r['summary'], isbn=r['isbn'],
+                              author_id=authors[r['author']] if r['author'] else None,
+                              language_id=languages[r['language']] if r['language'] else None))
+        bulk_create_with_ids(Book, books)
+
+        GenreLink = Book.genre.through
+        GenreLink.objects.bulk_create([
+            GenreLink(book_id=book.pk, genre_id=genres[name])
+            for book, r in zip(books, parsed) for name in r['genres']])
+        for book, r in zip(books, parsed):
+            copies.extend(BookInstance(id=uuid.uuid4(), book_id=book.pk, imprint=r['imprint'], status=r['status'])
+                          for _ in range(r['copies']))
+        BookInstance.objects.bulk_create(copies)
+
+        # bulk_create doesn't send signals, so bring the denormalized tables up to date here
+        english = set(Language.objects.filter(name='English').values_list('id', flat=True))
+        CatalogStats.adjust(
+            num_books=len(books), num_instances=len(copies),
+            num_instances_available=sum(1 for c in copies if c.status == 'a'),
+            num_books_english=sum(1 for b in books if b.language_id in english))
+        BookAvailability.rebuild({copy.book_id for copy in copies})
+        search.index_books([book.pk for book in books])
+        self.add_to_autocomplete([entry for book in books for entry in autocomplete.book_entries(book.pk, book.title)])
+        CatalogVersion.bump()
+        fragments.invalidate_authors({book.author_id for book in books})
+        facets.invalidate_books()
+        facets.invalidate_copies()
+        self.books += len(books)
+        self.copies += len(copies)
+
+    def parse(self, row):
+        title = clean(row.get('title'))
+        if not title:
+            raise ValueError('missing title')
+        genres = row.get('genres') or []
+        if not isinstance(genres, list):
+            genres = genres.split('|')
+        try:
+            copies = int(row.get('copies') or 0)
+        except (TypeError, ValueError):
+            raise ValueError('copies is not a number: %r' % row.get('copies'))
+        status = clean(row.get('status')) or 'a'
+        if status not in STATUS_CODES:
+            raise ValueError('unknown status %r' % status)
+        first_name, last_name = clean(row.get('author_first_name')), clean(row.get('author_last_name'))
+        return {
+            'title': title[:200],
+            'summary': clean(row.get('summary'))[:1000],
+            'isbn': clean(row.get('isbn'))[:13],
+            'author': (first_name[:100], last_name[:100]) if first_name or last_name else None,
+            'language': clean(row.get('language'))[:200],
+            'genres': sorted({clean(g)[:200] for g in genres if clean(g)}),
+            'copies': max(copies, 0),
+            'imprint': clean(row.get('imprint'))[:200],
+            'status': status,
+        }
+
+    def resolve(self, cache, keys, create):
+        """
+        {key: id} for every key: the ones we have seen come from the cache, the
+        rest are looked up in the database, and whatever isn't there either is
+        created. The chunk uses the returned dict, not the cache, which may
+        already have forgotten some of its keys when it is smaller than the chunk.
+        """
+        found, missing = {}, []
+        for key in keys:
+            if key in cache:
+                found[key] = cache[key]
+            else:
+                missing.append(key)
+        if missing:
+            created = create(missing)
+            for key in missing:
+                cache[key] = found[key] = created[key]
+        return found
+
+    def create_authors(self, missing):
+        wanted, found = set(missing), {}
+        for start in range(0, len(missing), 500):
+            last_names = {last for first, last in missing[start:start + 500]}
+            for pk, first, last in Author.objects.filter(last_name__in=last_names).values_list(
+                    'pk', 'first_name', 'last_name').order_by('pk'):
+                if (first, last) in wanted and (first, last) not in found:
+                    found[first, last] = pk
+        new = [Author(first_name=first, last_name=last) for first, last in missing if (first, last) not in found]
+        bulk_create_with_ids(Author, new)
+        for author in new:
+            found[author.first_name, author.last_name] = author.pk
+        CatalogStats.adjust(num_authors=len(new))
+        self.add_to_autocomplete([entry for author in new
+                                  for entry in autocomplete.author_entries(author.pk, author.first_name, author.last_name)])
+        return found
+
+    def add_to_autocomplete(self, entries):
+        # once the chunk commits: a chunk that rolls back mustn't leave its
+        # books and authors in this process's index
+        transaction.on_commit(lambda: autocomplete.update([], entries))
+
+    def create_named(self, model, missing):
+        found = {}
+        for start in range(0, len(missing), 500):
+            for pk, name in model.objects.filter(name__in=missing[start:start + 500]).values_list(
+                    'pk', 'name').order_by('-pk'):
+                found[name] = pk
+        new = [model(name=name) for name in missing if name not in found]
+        bulk_create_with_ids(model, new)
+        for obj in new:
+            found[obj.name] = obj.pk
+        return found
+
+    def create_genres(self, missing):
+        return self.create_named(Genre, missing)
+
+    def create_languages(self, missing):
+        return self.create_named(Language, missing)
+
+
+
+def read_checkpoint(source):
+    """
+    The number of rows of source already imported, or None if there's no checkpoint
+    """
+    return ImportCheckpoint.objects.filter(source=source).values_list('rows_done', flat=True).first()
+
+
+def clear_checkpoint(source):
+    ImportCheckpoint.objects.filter(source=source).delete()
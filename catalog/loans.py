@@ -0,0 +1,137 @@
+"""
+Bulk renewal and check-in of loans, for the librarians' borrowed books page and
+the BookInstance admin.
+
+Each operation takes a list of copy ids and changes all the eligible ones with a
+single UPDATE ... WHERE id IN (...) (one per BATCH_SIZE copies), instead of
+loading and saving the copies one at a time. QuerySet.update() sends no signals, so the catalog stats, the books'
+availability counts, the catalog version and the cached book, author and
+borrower pages are brought up to date here, once per call, and the changes are logged
+(see catalog.circulation) with one INSERT.
+
+Both run in a locking.immediate() transaction. Returned copies go straight to
+the oldest waiting hold on their book, if there is one (see catalog.holds).
+
+Both return the outcome for every id they were given, in the order given:
+a list of (id, outcome), where outcome is one of RENEWED, RETURNED, NOT_ON_LOAN
+or NOT_FOUND. Only copies on loan can be renewed or returned.
+"""
+from collections import Counter
+
+from django.core.exceptions import ValidationError
+
+from . import circulation, facets, fragments, holds, locking
+from .models import Book, BookAvailability, BookInstance, CatalogStats, CatalogVersion, LoanEvent
+
+RENEWED = 'renewed'
+RETURNED = 'returned'
+NOT_ON_LOAN = 'not on loan'
+NOT_FOUND = 'not found'
+
+# copies per UPDATE; a class set is one batch
+BATCH_SIZE = 500
+
+
+def parse_ids(copy_ids):
+    """
+    The ids as UUIDs, with None for any that aren't valid ids
+    """
+    field = BookInstance._meta.pk
+    parsed = []
+    for copy_id in copy_ids:
+        try:
+            parsed.append(field.to_python(copy_id))
+        except ValidationError:
+            parsed.append(None)
+    return parsed
+
+
+def _apply(copy_ids, done, **changes):
+    """
+    Applies changes to the copies on loan among copy_ids, one UPDATE per batch (in the
+    caller's transaction, with the rows locked between reading and updating) and
+    returns ([(id, outcome)], [the changed copies' rows], rows updated)
+    """
+    parsed = parse_ids(copy_ids)
+    valid = sorted({pk for pk in parsed if pk is not None})
+    rows, eligible, updated = {}, [], 0
+    # batches keep the IN lists under SQLite's limit on query parameters
+    for start in range(0, len(valid), BATCH_SIZE):
+        batch = valid[start:start + BATCH_SIZE]
+        found = {row['id']: row for row in BookInstance.objects.select_for_update()
+                 .filter(pk__in=batch).order_by().values('id', 'status', 'book_id', 'borrower_id')}
+        on_loan = [pk for pk, row in found.items() if row['status'] == 'o']
+        if on_loan:
+            # status is checked again in the UPDATE itself, in case it changed since
+            updated += BookInstance.objects.filter(pk__in=on_loan).on_loan().update(**changes)
+        rows.update(found)
+        eligible.extend(on_loan)
+    outcomes = []
+    for copy_id, pk in zip(copy_ids, parsed):
+        row = rows.get(pk)
+        outcomes.append((copy_id, NOT_FOUND if row is None else done if row['status'] == 'o' else NOT_ON_LOAN))
+    return outcomes, [rows[pk] for pk in eligible], updated
+
+
+def _changed(copies):
+    book_ids = {copy['book_id'] for copy in copies}
+    CatalogVersion.bump()
+    facets.invalidate_copies()
+    # copies and their due dates are listed on the book's page and counted on its author's
+    fragments.invalidate_books(book_ids)
+    fragments.invalidate_authors(Book.objects.filter(pk__in=book_ids).values_list('author_id', flat=True))
+    # and on the borrowers' lists of loans
+    fragments.invalidate_borrowers({copy['borrower_id'] for copy in copies})
+
+
+@locking.immediate()
+def renew(copy_ids, renewal_date):
+    """
+    Sets the due date of every copy on loan among copy_ids to renewal_date. The
+    date isn't checked here; validate it with RenewalBookForm first.
+    """
+    outcomes, copies, updated = _apply(copy_ids, RENEWED, due_back=renewal_date)
+    if updated:
+        circulation.log(LoanEvent.RENEWAL, copies, 'o', renewal_date)
+        _changed(copies)
+    return outcomes
+
+
+@locking.immediate()
+def mark_returned(copy_ids):
+    """
+    Makes every copy on loan among copy_ids available again, with no borrower
+    and no due date, then reserves them for the books' waiting holds
+    """
+    parsed = [pk for pk in parse_ids(copy_ids) if pk is not None]
+    # the books before the copies, in the same order as the hold queue takes them
+    locking.lock_books(BookInstance.objects.filter(pk__in=parsed).values_list('book_id', flat=True))
+    outcomes, copies, updated = _apply(copy_ids, RETURNED, status='a', borrower=None, due_back=None)
+    if updated:
+        circulation.log(LoanEvent.RETURN, copies, 'a')
+        CatalogStats.adjust(num_instances_available=updated)
+        deltas = Counter()
+        for copy in copies:
+            deltas[copy['book_id'], 'o'] -= 1
+            deltas[copy['book_id'], 'a'] += 1
+        BookAvailability.adjust(deltas)
+        holds.allocate({copy['book_id'] for copy in copies})
+        _changed(copies)
+    return outcomes
+
+
+def with_copies(outcomes):
+    """
+    (id, copy, outcome) for each outcome, with the copies (and their books and
+    borrowers) loaded in one query; copy is None for ids that weren't found
+    """
+    parsed = parse_ids([copy_id for copy_id, outcome in outcomes])
+    copies = BookInstance.objects.select_related('book', 'borrower').in_bulk([pk for pk in parsed if pk is not None])
+    return [(copy_id, copies.get(pk), outcome) for (copy_id, outcome), pk in zip(outcomes, parsed)]
+
+
+def summarize(outcomes):
+    """
+    How many ids had each outcome
+    """
+    return Counter(outcome for copy_id, outcome in outcomes)
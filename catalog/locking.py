@@ -0,0 +1,54 @@
+"""
+Transactions for code that reads rows and then changes them on the strength of
+what it read, like the loans and the hold queue, where two requests acting on
+the same copies at once must not both succeed.
+
+On a server database the rows involved are locked with SELECT ... FOR UPDATE,
+so requests about other books don't wait for each other. SQLite has no row
+locks: a transaction takes a shared lock when it first reads and only asks for
+the write lock when it first writes. Two transactions that have both read can
+then never both get it, and one fails at once with "database is locked" (the
+busy timeout doesn't apply). immediate() starts the transaction with BEGIN
+IMMEDIATE instead, which takes the write lock up front, waiting for it if need
+be, so transactions that write queue up one after another rather than failing.
+"""
+from contextlib import contextmanager
+
+from django.db import transaction
+
+from .models import Book
+
+
+@contextmanager
+def immediate(using=None):
+    """
+    transaction.atomic(), except that on SQLite an outermost block begins with
+    BEGIN IMMEDIATE. Nested blocks are savepoints as usual; the write lock was
+    (or wasn't) taken by the outermost one.
+    """
+    connection = transaction.get_connection(using)
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        with transaction.atomic(using=using):
+            yield
+        return
+    connection.ensure_connection()
+    # atomic() starts a transaction on SQLite with this method (a plain BEGIN);
+    # shadow it on this connection for the one call
+    connection._start_transaction_under_autocommit = lambda: connection.cursor().execute('BEGIN IMMEDIATE')
+    try:
+        with transaction.atomic(using=using):
+            vars(connection).pop('_start_transaction_under_autocommit', None)
+            yield
+    finally:
+        vars(connection).pop('_start_transaction_under_autocommit', None)
+
+
+def lock_books(book_ids):
+    """
+    Locks these books' rows until the end of the transaction, in id order so
+    that two transactions locking overlapping sets can't deadlock. book_ids can
+    be a list or a values_list() queryset, which becomes a subquery. Does nothing
+    on SQLite, where immediate() holds the lock on the whole database.
+    """
+    if transaction.get_connection().features.has_select_for_update:
+        list(Book.objects.select_for_update().filter(pk__in=book_ids).order_by('pk').values_list('pk', flat=True))
@@ -0,0 +1,60 @@
+import importlib
+import pkgutil
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog import benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Seeds a scratch database and runs one of the benchmarks in catalog.benchmarks'
+
+    def add_arguments(self, parser):
+        names = sorted(name for _, name, _ in pkgutil.iter_modules(benchmarks.__path__))
+        parser.add_argument('name', choices=names, help='Which benchmark to run')
+        parser.add_argument('--books', type=int, default=10000, help='Number of books to seed')
+        parser.add_argument('--copies', type=int, default=5, help='Copies seeded per book')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed repetitions per measurement')
+        parser.add_argument('--keepdb', action='store_true', help='Keep (and reuse) the seeded benchmark database')
+        parser.add_argument('--output', help='Save the results as JSON to this file')
+        parser.add_argument('--baseline', help='Compare the results with a JSON file saved by an earlier --output')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='How much slower than the baseline counts as a regression (default 0.25, i.e. 25%%)')
+
+    def handle(self, *args, **options):
+        try:
+            module = importlib.import_module('catalog.benchmarks.%s' % options['name'])
+        except ImportError as e:
+            raise CommandError('Could not load benchmark %s: %s' % (options['name'], e))
+
+        with benchmarks.scratch_database(keepdb=options['keepdb']):
+            from catalog.models import Book
+            if not Book.objects.exists():
+                self.stdout.write('Seeding %s books with %s copies each...' % (options['books'], options['copies']))
+                started = time.perf_counter()
+                benchmarks.seed_catalog(books=options['books'], copies_per_book=options['copies'])
+                self.stdout.write('Seeded in %.1f s' % (time.perf_counter() - started))
+            results = module.run(self.stdout, options)
+
+        if options['output'] or options['baseline']:
+            if results is None:
+                raise CommandError('The %s benchmark does not return results to save or compare' % options['name'])
+        if options['output']:
+            benchmarks.save_results(options['output'], results, options)
+            self.stdout.write('Saved results to %s' % options['output'])
+        if options['baseline']:
+            try:
+                baseline = benchmarks.load_results(options['baseline'])
+            except (OSError, ValueError) as e:
+                raise CommandError('Could not read baseline %s: %s' % (options['baseline'], e))
+            meta = baseline.get('meta', {})
+            if (meta.get('books'), meta.get('copies')) != (options['books'], options['copies']):
+                self.stderr.write('Warning: the baseline was seeded with %s books x %s copies' % (
+                    meta.get('books'), meta.get('copies')))
+            regressions = benchmarks.compare_results(results, baseline, options['tolerance'])
+            for regression in regressions:
+                self.stderr.write('REGRESSION %s' % regression)
+            if regressions:
+                raise CommandError('%s regression(s) against %s' % (len(regressions), options['baseline']))
+            self.stdout.write('No regressions against %s' % options['baseline'])
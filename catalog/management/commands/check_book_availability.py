@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog import facets
+from catalog.models import Book, BookAvailability
+
+
+class Command(BaseCommand):
+    help = "Compares every book's availability counts with its copies, and with --repair recounts the ones that differ"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help='Recount the books whose counts are wrong')
+        parser.add_argument('--verbose-diff', action='store_true', help='Show the stored and actual counts of each wrong book')
+
+    def handle(self, *args, **options):
+        checked, wrong = 0, []
+        last_id = 0
+        while True:
+            # a batch of books at a time, in id order
+            book_ids = list(Book.objects.filter(pk__gt=last_id).order_by('pk')
+                            .values_list('pk', flat=True)[:BookAvailability.BATCH_SIZE])
+            if not book_ids:
+                break
+            last_id = book_ids[-1]
+            checked += len(book_ids)
+            inconsistencies = BookAvailability.inconsistencies(book_ids)
+            for book_id, stored, live in inconsistencies:
+                if options['verbose_diff']:
+                    self.stdout.write('Book %s: stored %s, actual %s' % (book_id, stored, live))
+            wrong.extend(book_id for book_id, stored, live in inconsistencies)
+            if options['repair'] and inconsistencies:
+                BookAvailability.rebuild([book_id for book_id, stored, live in inconsistencies])
+
+        self.stdout.write('Checked %s books, %s with wrong availability counts' % (checked, len(wrong)))
+        if wrong and options['repair']:
+            # the availability facet was counted from the wrong numbers
+            facets.invalidate_copies()
+            self.stdout.write('Recounted %s books' % len(wrong))
+        elif wrong:
+            raise CommandError('%s books have wrong availability counts, run with --repair to fix them' % len(wrong))
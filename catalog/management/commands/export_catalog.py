@@ -0,0 +1,34 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from catalog import export
+
+
+class Command(BaseCommand):
+    help = 'Streams a catalog table (books, copies or loans) out as CSV or JSON Lines with constant memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('table', choices=sorted(export.TABLES))
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output with gzip')
+        parser.add_argument('--output', '-o', help='File to write to (default: standard output)')
+        parser.add_argument('--chunk-size', type=int, default=export.CHUNK_SIZE, help='Rows fetched per query')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        stream = export.export(options['table'], options['format'], options['gzip'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                written = self.write(stream, output)
+            self.stderr.write('Wrote %d bytes to %s in %.1f s' % (written, options['output'], time.perf_counter() - started))
+        else:
+            self.write(stream, sys.stdout.buffer)
+
+    def write(self, stream, output):
+        written = 0
+        for data in stream:
+            output.write(data)
+            written += len(data)
+        return written
@@ -0,0 +1,54 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.importer import CatalogImporter, CatalogImportError, clear_checkpoint, read_checkpoint, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Streams books, authors, genres, languages and copies from a CSV or JSON Lines file into the catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file (see catalog/importer.py for the columns)')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Input format (default: from the file extension)')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows per transaction')
+        parser.add_argument('--resume', action='store_true',
+                            help='Skip the rows the last run of this file got through (progress is recorded in the '
+                                 'database with every chunk)')
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(options['path'])
+        if not os.path.exists(path):
+            raise CommandError('No such file: %s' % path)
+
+        skip = 0
+        if options['resume']:
+            skip = read_checkpoint(path)
+            if skip is None:
+                raise CommandError('No checkpoint found for %s' % path)
+            self.stdout.write('Resuming after row %s' % skip)
+
+        importer = CatalogImporter(chunk_size=options['chunk_size'], checkpoint=path)
+        started = time.perf_counter()
+
+        def progress(importer):
+            elapsed = time.perf_counter() - started
+            self.stdout.write('%d rows read, %d books and %d copies imported, %.0f rows/sec' % (
+                importer.rows_done, importer.books, importer.copies, (importer.rows_done - skip) / elapsed))
+
+        try:
+            importer.run(read_rows(path, options['format']), skip=skip, on_chunk=progress)
+        except CatalogImportError as e:
+            raise CommandError(str(e))
+
+        elapsed = time.perf_counter() - started
+        for row_number, reason in importer.skipped_rows:
+            self.stderr.write('Skipped row %s: %s' % (row_number, reason))
+        if importer.skipped > len(importer.skipped_rows):
+            self.stderr.write('... and %s more skipped rows' % (importer.skipped - len(importer.skipped_rows)))
+        self.stdout.write(self.style.SUCCESS('Imported %d books and %d copies from %d rows in %.1f s (%.0f rows/sec)' % (
+            importer.books, importer.copies, importer.rows_done - skip, elapsed,
+            (importer.rows_done - skip) / elapsed if elapsed else 0)))
+        # the whole file is in, so there's nothing left to resume
+        clear_checkpoint(path)
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from catalog.models import CatalogStats
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the precomputed catalog counts shown on the index page'
+
+    def handle(self, *args, **options):
+        stats = CatalogStats.rebuild()
+        self.stdout.write('Rebuilt catalog stats: %s books, %s copies (%s available), %s authors, %s books in English' % (
+            stats.num_books, stats.num_instances, stats.num_instances_available, stats.num_authors, stats.num_books_english))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index from the book and author tables'
+
+    def handle(self, *args, **options):
+        if not search.search_available():
+            raise CommandError('Full-text search needs SQLite with FTS5')
+        self.stdout.write('Indexed %s books' % search.rebuild_index())
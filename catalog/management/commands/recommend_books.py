@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the "more like this" recommendations shown on the book pages (run it nightly)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--changed', action='store_true',
+                            help='Only recompute the books affected by changes since the last run')
+        parser.add_argument('--top', type=int, default=recommendations.TOP_N,
+                            help='Recommendations per book (default %s)' % recommendations.TOP_N)
+
+    def handle(self, *args, **options):
+        if options['top'] < 1:
+            raise CommandError('--top must be at least 1')
+        run = recommendations.recompute(incremental=options['changed'], top_n=options['top'])
+        self.stdout.write('Recomputed recommendations for %s of %s books (%s) in %.2f s: '
+                          'load %.2f s, compute %.2f s, store %.2f s' % (
+                              run.recomputed, run.books, 'NumPy' if recommendations.np is not None else 'pure Python',
+                              run.total_seconds, run.load_seconds, run.compute_seconds, run.store_seconds))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog import circulation
+
+
+class Command(BaseCommand):
+    help = 'Adds the loan events logged since the last run to the daily circulation statistics (run it every few minutes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=circulation.BATCH_SIZE,
+                            help='Events per transaction (default %s)' % circulation.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        count = circulation.rollup(batch_size=options['batch_size'])
+        self.stdout.write('Rolled up %s loan events' % count)
@@ -0,0 +1,23 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.models import OverdueSnapshot
+
+
+class Command(BaseCommand):
+    help = "Records today's number of overdue loans in the overdue history (run once a day)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Take the snapshot as of this day (YYYY-MM-DD) instead of today')
+
+    def handle(self, *args, **options):
+        today = None
+        if options['date']:
+            try:
+                today = datetime.datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--date must look like YYYY-MM-DD')
+        snapshot = OverdueSnapshot.take(today)
+        self.stdout.write('Overdue on %s: %s loans held by %s borrowers (%s on loan)' % (
+            snapshot.date, snapshot.overdue_loans, snapshot.overdue_borrowers, snapshot.loans))
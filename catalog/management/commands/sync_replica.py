@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from catalog.routers import get_options
+
+
+class Command(BaseCommand):
+    help = ("Copies the primary SQLite database into a SQLite replica, standing in for replication "
+            "when trying the read replicas out locally")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', help='The replica alias (default: the first in CATALOG_REPLICAS)')
+
+    def handle(self, *args, **options):
+        aliases, sticky_seconds = get_options()
+        alias = options['database'] or (aliases[0] if aliases else None)
+        if alias is None:
+            raise CommandError('No replicas are configured; set CATALOG_REPLICA_DB to a SQLite file to use one')
+        if alias == DEFAULT_DB_ALIAS:
+            raise CommandError('%s is the primary' % alias)
+        primary, replica = connections[DEFAULT_DB_ALIAS], connections[alias]
+        if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+            raise CommandError('Only SQLite databases can be copied; other databases replicate themselves')
+        primary.ensure_connection()
+        replica.ensure_connection()
+        # SQLite's online backup: a consistent copy, even while the primary is in use
+        primary.connection.backup(replica.connection)
+        self.stdout.write('Copied %s into %s' % (primary.settings_dict['NAME'], replica.settings_dict['NAME']))
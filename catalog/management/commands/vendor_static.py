@@ -0,0 +1,56 @@
+import os
+from urllib.request import urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.assets import VENDOR_ASSETS, check_integrity, integrity
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'static')
+
+
+class Command(BaseCommand):
+    help = ("Fetches the third-party static files (Bootstrap, jQuery) into catalog/static/vendor, "
+            "checking them against their pinned hashes")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', help='Copy the files from this directory (laid out like static/) instead of downloading them')
+        parser.add_argument('--force', action='store_true', help='Fetch files that are already there again')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds to wait for each download')
+        parser.add_argument('--no-verify', action='store_true', dest='no_verify',
+                            help='Fetch files with no pinned hash too, printing the hash to pin for each')
+
+    def fetch(self, path, url, options):
+        if options['source']:
+            with open(os.path.join(options['source'], path), 'rb') as source:
+                return source.read()
+        with urlopen(url, timeout=options['timeout']) as response:
+            return response.read()
+
+    def handle(self, *args, **options):
+        fetched = 0
+        for path, url, sri in VENDOR_ASSETS:
+            destination = os.path.join(STATIC_DIR, path)
+            if os.path.exists(destination) and not options['force']:
+                with open(destination, 'rb') as existing:
+                    if check_integrity(existing.read(), sri):
+                        continue
+            if sri is None and not options['no_verify']:
+                raise CommandError('%s has no pinned hash to check it against; pin one in VENDOR_ASSETS, or run '
+                                   'with --no-verify to fetch it unchecked and print its hash' % path)
+            try:
+                content = self.fetch(path, url, options)
+            except OSError as e:
+                raise CommandError('Could not fetch %s: %s' % (path, e))
+            if not check_integrity(content, sri):
+                raise CommandError('%s does not match its pinned hash %s' % (path, sri))
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            # written under another name first, so an interrupted run leaves no half file
+            with open(destination + '.part', 'wb') as partial:
+                partial.write(content)
+            os.replace(destination + '.part', destination)
+            fetched += 1
+            self.stdout.write('Fetched %s (%s bytes)' % (path, len(content)))
+            if sri is None:
+                self.stdout.write(self.style.WARNING('%s has no pinned hash; pin %s in VENDOR_ASSETS' % (
+                    path, integrity(content))))
+        self.stdout.write('%s of %s vendored files fetched, the rest were up to date' % (fetched, len(VENDOR_ASSETS)))
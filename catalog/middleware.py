@@ -0,0 +1,218 @@
+"""
+Per-request SQL instrumentation.
+
+SQLInstrumentationMiddleware counts the queries each request runs and how long
+they took, and spots repeated queries: the same SQL with different literals run
+over and over is the signature of an N+1 (usually a template following a
+relation once per row). The numbers go out in a Server-Timing header, so they
+show up in the browser's network panel, and in one log line per request on the
+catalog.middleware logger, as JSON.
+
+A view can declare a query budget, the most queries a request to it should
+need: a `query_budget` attribute on a class-based view, or the query_budget()
+decorator on a function view. Budgets count every query of the request,
+including the session, user and permission lookups. A request over budget is
+logged as a warning, and raises QueryBudgetExceeded when RAISE is set (the
+test runner turns it on, so a change that makes a page run more queries fails
+the test suite rather than shipping).
+
+Queries are counted by wrapping each connection's cursors for the length of the
+request, which keeps only the counts, times and query shapes: nothing is added
+to connection.queries, which Django only fills under DEBUG (or assertNumQueries).
+
+Configure with the CATALOG_SQL_INSTRUMENTATION setting, e.g.
+{'ENABLED': True, 'SERVER_TIMING': True, 'RAISE': False, 'REPEAT_THRESHOLD': 5}.
+A query repeated REPEAT_THRESHOLD times or more in one request is logged as a
+likely N+1 even if the view is within budget.
+
+Queries run while a streaming response is being sent happen after the
+middleware has seen the response, so they aren't counted.
+"""
+import json
+import logging
+import re
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+from django.utils.deprecation import MiddlewareMixin
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REPEAT_THRESHOLD = 5
+
+# literals and IN lists, so queries that differ only in their parameters match
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+IN_LISTS = re.compile(r'\bIN \((?:(?:\?|%s), )*(?:\?|%s)\)')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(budget):
+    """
+    Declares the most queries a request to a function view should run
+    """
+    def decorator(view):
+        view.query_budget = budget
+        return view
+    return decorator
+
+
+def get_options():
+    return getattr(settings, 'CATALOG_SQL_INSTRUMENTATION', {})
+
+
+def query_shape(sql):
+    """
+    The SQL with its literals replaced by ?
+    """
+    return IN_LISTS.sub('IN (...)', LITERALS.sub('?', sql))
+
+
+class QueryCounter(object):
+    """
+    The number of queries, their total time and how often each query (and each
+    query shape) ran
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.exact = set()
+        self.shapes = Counter()
+
+    def add(self, sql, params, seconds):
+        self.queries += 1
+        self.seconds += seconds
+        self.exact.add((sql, repr(params)))
+        self.shapes[query_shape(sql)] += 1
+
+    def summary(self):
+        """
+        Count, total time in ms, exact duplicates and the most repeated query
+        shape, with how many times it ran
+        """
+        shape, repeats = self.shapes.most_common(1)[0] if self.shapes else (None, 0)
+        return {
+            'queries': self.queries,
+            'sql_ms': self.seconds * 1000,
+            'duplicates': self.queries - len(self.exact),
+            'similar': self.queries - len(self.shapes),
+            'most_repeated': shape if repeats > 1 else None,
+            'repeats': repeats,
+        }
+
+
+def summarize(queries):
+    """
+    QueryCounter.summary() for a list of queries from connection.queries
+    """
+    counter = QueryCounter()
+    for query in queries:
+        counter.add(query['sql'], None, float(query['time']))
+    return counter.summary()
+
+
+class CountingCursor(object):
+    """
+    A connection's cursor that adds the queries run through it to a QueryCounter
+    """
+
+    def __init__(self, cursor, counter):
+        self.cursor = cursor
+        self.counter = counter
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        return self.cursor.__exit__(type, value, traceback)
+
+    def execute(self, sql, params=None):
+        started = time.perf_counter()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            self.counter.add(sql, params, time.perf_counter() - started)
+
+    def executemany(self, sql, param_list):
+        started = time.perf_counter()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            self.counter.add(sql, None, time.perf_counter() - started)
+
+
+def count_queries(connection, counter):
+    """
+    Has every cursor the connection hands out count its queries, until
+    stop_counting()
+    """
+    cursor = connection.cursor
+    connection.cursor = lambda: CountingCursor(cursor(), counter)
+
+
+def stop_counting(connection):
+    connection.__dict__.pop('cursor', None)
+
+
+def server_timing(summary, total_ms):
+    return 'sql;desc="%d queries, %d duplicates";dur=%.1f, total;dur=%.1f' % (
+        summary['queries'], summary['duplicates'], summary['sql_ms'], total_ms)
+
+
+class SQLInstrumentationMiddleware(MiddlewareMixin):
+
+    def process_request(self, request):
+        if not get_options().get('ENABLED', True):
+            return
+        counter = QueryCounter()
+        for connection in connections.all():
+            count_queries(connection, counter)
+        request._sql_instrumentation = {'started': time.perf_counter(), 'counter': counter}
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'view_class', view_func)
+        request._query_budget = getattr(view, 'query_budget', None)
+
+    def process_response(self, request, response):
+        state = getattr(request, '_sql_instrumentation', None)
+        if state is None:
+            return response
+        del request._sql_instrumentation
+        for connection in connections.all():
+            stop_counting(connection)
+        total_ms = (time.perf_counter() - state['started']) * 1000
+        summary = state['counter'].summary()
+
+        options = get_options()
+        if options.get('SERVER_TIMING', True):
+            response['Server-Timing'] = server_timing(summary, total_ms)
+
+        budget = getattr(request, '_query_budget', None)
+        match = getattr(request, 'resolver_match', None)
+        record = dict(summary, method=request.method, path=request.path, status=response.status_code,
+                      view=match.view_name if match else None, budget=budget, total_ms=round(total_ms, 3),
+                      sql_ms=round(summary['sql_ms'], 3))
+        over_budget = budget is not None and summary['queries'] > budget
+        repeated = summary['repeats'] >= options.get('REPEAT_THRESHOLD', DEFAULT_REPEAT_THRESHOLD)
+        if over_budget or repeated:
+            record['problem'] = 'over budget' if over_budget else 'repeated query'
+            logger.warning(json.dumps(record, sort_keys=True), extra={'sql': record})
+        else:
+            logger.info(json.dumps(record, sort_keys=True), extra={'sql': record})
+
+        if over_budget and options.get('RAISE', False):
+            raise QueryBudgetExceeded('%s ran %d queries, over its budget of %d (most repeated, %d times: %s)' % (
+                record['view'] or request.path, summary['queries'], budget, summary['repeats'],
+                summary['most_repeated']))
+        return response
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from catalog import search
+    search.create_index(schema_editor)
+    if search.search_available(schema_editor.connection):
+        # index whatever is already in the catalog
+        schema_editor.execute(search.INDEX_SQL)
+
+
+def drop_search_index(apps, schema_editor):
+    from catalog import search
+    search.drop_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0003_visitcount'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 22:52
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_catalogversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OverdueSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('overdue_loans', models.PositiveIntegerField(default=0)),
+                ('overdue_borrowers', models.PositiveIntegerField(default=0)),
+                ('loans', models.PositiveIntegerField(default=0, help_text='All copies on loan that day')),
+            ],
+            options={
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='bookinstance',
+            index=models.Index(fields=['status', 'due_back'], name='copy_status_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookinstance',
+            index=models.Index(fields=['borrower', 'status', 'due_back'], name='copy_borrower_status_due_idx'),
+        ),
+    ]
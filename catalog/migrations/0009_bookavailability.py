@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 23:16
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+STATUS_FIELDS = {'m': 'maintenance', 'o': 'on_loan', 'a': 'available', 'r': 'reserved',
+                 'p': 'between_phases', 'x': 'in_dimension_x', 'k': 'not_provided'}
+
+
+def count_existing_copies(apps, schema_editor):
+    BookAvailability = apps.get_model('catalog', 'BookAvailability')
+    BookInstance = apps.get_model('catalog', 'BookInstance')
+    rows = {}
+    for book_id, status, number in (BookInstance.objects.exclude(book=None).order_by()
+                                    .values_list('book_id', 'status').annotate(number=models.Count('id'))):
+        row = rows.setdefault(book_id, BookAvailability(book_id=book_id))
+        row.copies += number
+        if status in STATUS_FIELDS:
+            setattr(row, STATUS_FIELDS[status], getattr(row, STATUS_FIELDS[status]) + number)
+    BookAvailability.objects.bulk_create(rows.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0008_bookinstance_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookAvailability',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='availability', serialize=False, to='catalog.Book')),
+                ('copies', models.IntegerField(default=0)),
+                ('maintenance', models.IntegerField(default=0)),
+                ('on_loan', models.IntegerField(default=0)),
+                ('available', models.IntegerField(default=0)),
+                ('reserved', models.IntegerField(default=0)),
+                ('between_phases', models.IntegerField(default=0)),
+                ('in_dimension_x', models.IntegerField(default=0)),
+                ('not_provided', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'book availability',
+            },
+        ),
+        migrations.RunPython(count_existing_copies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 23:42
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0010_hold'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started', models.DateTimeField(default=django.utils.timezone.now)),
+                ('incremental', models.BooleanField(default=False)),
+                ('books', models.PositiveIntegerField(default=0, help_text='Books in the catalog')),
+                ('recomputed', models.PositiveIntegerField(default=0, help_text='Books whose recommendations were recomputed')),
+                ('load_seconds', models.FloatField(default=0)),
+                ('compute_seconds', models.FloatField(default=0)),
+                ('store_seconds', models.FloatField(default=0)),
+            ],
+            options={
+                'ordering': ['-started'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RecommendationSignature',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='catalog.Book')),
+                ('signature', models.BigIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RelatedBook',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.PositiveIntegerField()),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_books', to='catalog.Book')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.Book')),
+            ],
+            options={
+                'ordering': ['book', 'rank'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='relatedbook',
+            unique_together=set([('book', 'rank')]),
+        ),
+    ]
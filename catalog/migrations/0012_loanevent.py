@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 23:49
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('catalog', '0011_relatedbook'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyBookLoans',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('checkouts', models.PositiveIntegerField(default=0)),
+                ('renewals', models.PositiveIntegerField(default=0)),
+                ('returns', models.PositiveIntegerField(default=0)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.Book')),
+            ],
+            options={
+                'verbose_name_plural': 'daily book loans',
+                'ordering': ['-date'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyGenreLoans',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('checkouts', models.PositiveIntegerField(default=0)),
+                ('renewals', models.PositiveIntegerField(default=0)),
+                ('returns', models.PositiveIntegerField(default=0)),
+                ('genre', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.Genre')),
+            ],
+            options={
+                'verbose_name_plural': 'daily genre loans',
+                'ordering': ['-date'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyLoans',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('checkouts', models.PositiveIntegerField(default=0)),
+                ('renewals', models.PositiveIntegerField(default=0)),
+                ('returns', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'daily loans',
+                'ordering': ['-date'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='LoanEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('time', models.DateTimeField(default=django.utils.timezone.now)),
+                ('kind', models.CharField(choices=[('c', 'Checkout'), ('n', 'Renewal'), ('r', 'Return'), ('s', 'Status change')], max_length=1)),
+                ('status', models.CharField(choices=[('m', 'Maintenance'), ('o', 'On Loan'), ('a', 'Available'), ('r', 'Reserved'), ('p', 'Between Matter Phases'), ('x', 'Trapped in Dimension X'), ('k', 'Not Yet Provided By The Free Market')], max_length=1)),
+                ('due_back', models.DateField(null=True)),
+                ('book', models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='catalog.Book')),
+                ('borrower', models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('copy', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='catalog.BookInstance')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='LoanRollupMark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_event', models.BigIntegerField(default=0)),
+                ('last_run', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailyloans',
+            unique_together=set([('date',)]),
+        ),
+        migrations.AddIndex(
+            model_name='dailygenreloans',
+            index=models.Index(fields=['date', 'genre'], name='daily_genre_loans_date_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailygenreloans',
+            unique_together=set([('genre', 'date')]),
+        ),
+        migrations.AddIndex(
+            model_name='dailybookloans',
+            index=models.Index(fields=['date', 'book'], name='daily_book_loans_date_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailybookloans',
+            unique_together=set([('book', 'date')]),
+        ),
+    ]
@@ -1,4 +1,7 @@
-from django.db import models
+from collections import Counter
+
+from django.db import models, transaction
+from django.db.models import F
 from django.core.urlresolvers import reverse
 
 class Genre(models.Model):
@@ -42,6 +45,11 @@ class Book(models.Model):
     genre = models.ManyToManyField(Genre, help_text="Select a genre for this book")
     language = models.ForeignKey(Language, on_delete=models.SET_NULL, null=True)
     
+    class Meta:
+        # the book list's order (see BookListView.cursor_ordering), so its pages
+        # are read straight off the index
+        indexes = [models.Index(fields=['title', 'id'], name='book_title_idx')]
+    
     def __str__(self):
         """
         String representing the model object
@@ -67,6 +75,39 @@ import uuid # for uniqueness
 from django.contrib.auth.models import User
 from datetime import date
 
+class BookInstanceQuerySet(models.QuerySet):
+    """
+    Loan queries that are answered in SQL, so they can be filtered, counted and
+    paginated by the database (backed by the status/due_back index)
+    """
+
+    def on_loan(self):
+        return self.filter(status__exact='o')
+
+    def overdue(self, today=None):
+        """
+        Copies on loan that were due back before today
+        """
+        return self.on_loan().filter(due_back__lt=today or date.today())
+
+    def with_overdue(self, today=None):
+        """
+        Annotates each copy with `overdue` (a bool), the SQL version of is_overdue
+        """
+        return self.annotate(overdue=models.Case(
+            models.When(status__exact='o', due_back__lt=today or date.today(), then=models.Value(True)),
+            default=models.Value(False), output_field=models.BooleanField()))
+
+    def overdue_by_borrower(self, today=None):
+        """
+        One row per borrower with overdue loans: borrower, number of overdue
+        loans and the earliest due date among them, most overdue loans first
+        """
+        return self.overdue(today).order_by().values('borrower').annotate(
+            overdue_loans=models.Count('id'), oldest_due_back=models.Min('due_back'),
+        ).order_by('-overdue_loans', 'oldest_due_back', 'borrower')
+
+
 class BookInstance(models.Model):
     """
     Specific copy of a book that can be borrowed
@@ -89,23 +130,90 @@ class BookInstance(models.Model):
     status = models.CharField(max_length=1, choices=LOAN_STATUS, blank=True, default='m', help_text='Book availability')
     borrower = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     
+    objects = BookInstanceQuerySet.as_manager()
+    
     class Meta:
         # can also specify in any class-based view that uses this
         ordering = ['due_back']
+        # one index per access path (see catalog.queryplans and its tests):
+        # loans and overdue loans by status and due date, overall or per borrower,
+        # copies (and their statuses) per book, every copy by due date in the
+        # admin's order (due_back, -pk), so it can stop after one page, and the
+        # copies in one status in id order, for the export's keyset walk
+        indexes = [
+            models.Index(fields=['status', 'due_back'], name='copy_status_due_idx'),
+            models.Index(fields=['status', 'id'], name='copy_status_id_idx'),
+            models.Index(fields=['borrower', 'status', 'due_back'], name='copy_borrower_status_due_idx'),
+            models.Index(fields=['book', 'status'], name='copy_book_status_idx'),
+            models.Index(fields=['due_back', '-id'], name='copy_due_idx'),
+        ]
         permissions = (("can_mark_returned", "Set book as returned"),("can_renew", "Renew book due date"))
         
     def __str__(self):
         """
-        String for representing the model object
+        String for representing the model object (select_related('book') when
+        showing many, or this is a query per copy)
         """
-        return '%s (%s)' % (self.id, self.book.title)
+        return '%s (%s)' % (self.id, self.book.title if self.book_id else 'no book')
+    
+    def save(self, *args, **kwargs):
+        # the post_save handlers update BookAvailability and CatalogStats; doing it
+        # in the same transaction as the row means the counts never disagree with it
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
     
     @property
     def is_overdue(self):
+        # for a single copy; use BookInstance.objects.overdue() / with_overdue() for lists
         if self.due_back and date.today() > self.due_back:
             return True
         return False
-        
+
+from django.utils import timezone
+
+class HoldQuerySet(models.QuerySet):
+
+    def waiting(self):
+        """
+        Holds still waiting for a copy, oldest first
+        """
+        return self.filter(copy__isnull=True).order_by('placed', 'id')
+
+    def ready(self):
+        """
+        Holds with a copy reserved for the patron to collect
+        """
+        return self.filter(copy__isnull=False)
+
+
+class Hold(models.Model):
+    """
+    A patron's place in the queue for a book. Copies that come back go to the
+    oldest waiting hold, and are then Reserved for that patron until they collect
+    them (see catalog.holds, which makes every change to the queue)
+    """
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='holds')
+    patron = models.ForeignKey(User, on_delete=models.CASCADE, related_name='holds')
+    placed = models.DateTimeField(default=timezone.now)
+    # one copy can only ever be reserved for one hold
+    copy = models.OneToOneField(BookInstance, on_delete=models.SET_NULL, null=True, blank=True, related_name='hold')
+    ready = models.DateTimeField(null=True, blank=True)
+
+    objects = HoldQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['placed', 'id']
+        # one place in each book's queue per patron
+        unique_together = ('book', 'patron')
+        # the head of a book's queue: its waiting holds in the order they were placed
+        indexes = [models.Index(fields=['book', 'copy', 'placed'], name='hold_queue_idx')]
+
+    def __str__(self):
+        """
+        String representing the model object
+        """
+        return '%s for %s' % (self.book, self.patron)
+
 class Author(models.Model):
     """
     An author of a book
@@ -115,6 +223,10 @@ class Author(models.Model):
     date_of_birth = models.DateField(null=True, blank=True)
     date_of_death = models.DateField('Died', null=True, blank=True)
 
+    class Meta:
+        # authors are looked up by name when importing, and listed in name order
+        indexes = [models.Index(fields=['last_name', 'first_name'], name='author_name_idx')]
+
     def get_absolute_url(self):
         """
         Returns the url to access a partiular instance of the author
@@ -125,4 +237,477 @@ class Author(models.Model):
         """
         String representing the model object
         """
-        return '%s, %s' % (self.last_name, self.first_name) 
\ No newline at end of file
+        return '%s, %s' % (self.last_name, self.first_name) 
+
+class CatalogStats(models.Model):
+    """
+    Denormalized record counts shown on the index page. There is only ever one
+    row (pk=1); it is kept current by the signal handlers in catalog.signals and
+    can be rebuilt from scratch with `manage.py rebuild_catalog_stats`
+    """
+    num_books = models.IntegerField(default=0)
+    num_instances = models.IntegerField(default=0)
+    num_instances_available = models.IntegerField(default=0)
+    num_authors = models.IntegerField(default=0)
+    num_books_english = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'catalog stats'
+
+    def __str__(self):
+        """
+        String representing the model object
+        """
+        return 'Catalog stats (%s books, %s copies)' % (self.num_books, self.num_instances)
+
+    @staticmethod
+    def live_counts():
+        """
+        Counts everything the slow way (the same queries the index page used to run)
+        """
+        return {
+            'num_books': Book.objects.all().count(),
+            'num_instances': BookInstance.objects.all().count(),
+            'num_instances_available': BookInstance.objects.filter(status__exact='a').count(),
+            'num_authors': Author.objects.all().count(),
+            'num_books_english': Book.objects.filter(language__name='English').count(),
+        }
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Recomputes every counter from the live tables and stores the result
+        """
+        stats, created = cls.objects.update_or_create(pk=1, defaults=cls.live_counts())
+        return stats
+
+    @classmethod
+    def load(cls):
+        """
+        Returns the stats row, building it first if it doesn't exist yet
+        """
+        try:
+            return cls.objects.get(pk=1)
+        except cls.DoesNotExist:
+            return cls.rebuild()
+
+    @classmethod
+    def adjust(cls, **deltas):
+        """
+        Adds the given deltas to the counters in a single UPDATE, e.g.
+        CatalogStats.adjust(num_books=1, num_books_english=1)
+        """
+        deltas = {name: F(name) + delta for name, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        # if the row is missing we have nothing to adjust, so count from scratch
+        if not cls.objects.filter(pk=1).update(**deltas):
+            cls.rebuild()
+
+    @classmethod
+    def recount_english(cls):
+        """
+        Recounts English books only (needed when a Language is renamed or deleted)
+        """
+        english = Book.objects.filter(language__name='English').count()
+        if not cls.objects.filter(pk=1).update(num_books_english=english):
+            cls.rebuild()
+
+
+class BookAvailability(models.Model):
+    """
+    Denormalized number of copies of one book in each loan status, shown on the
+    book list and the book page. It is kept current by the signal handlers in
+    catalog.signals (and by the bulk paths that bypass them), and can be checked
+    and repaired with `manage.py check_book_availability`. Books with no copies
+    may have no row.
+    """
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='availability')
+    copies = models.IntegerField(default=0)
+    maintenance = models.IntegerField(default=0)
+    on_loan = models.IntegerField(default=0)
+    available = models.IntegerField(default=0)
+    reserved = models.IntegerField(default=0)
+    between_phases = models.IntegerField(default=0)
+    in_dimension_x = models.IntegerField(default=0)
+    not_provided = models.IntegerField(default=0)
+
+    # the counter for each BookInstance.LOAN_STATUS code
+    STATUS_FIELDS = {'m': 'maintenance', 'o': 'on_loan', 'a': 'available', 'r': 'reserved',
+                     'p': 'between_phases', 'x': 'in_dimension_x', 'k': 'not_provided'}
+    COUNT_FIELDS = ('copies', 'maintenance', 'on_loan', 'available', 'reserved',
+                    'between_phases', 'in_dimension_x', 'not_provided')
+    # books per query when rebuilding, under SQLite's limit on query parameters
+    BATCH_SIZE = 500
+
+    class Meta:
+        verbose_name_plural = 'book availability'
+
+    def __str__(self):
+        """
+        String representing the model object
+        """
+        return '%s: %s of %s available' % (self.book_id, self.available, self.copies)
+
+    def counts(self):
+        return {name: getattr(self, name) for name in self.COUNT_FIELDS}
+
+    def status_counts(self):
+        """
+        (status label, number of copies) for each status the book has copies in
+        """
+        return [(label, getattr(self, self.STATUS_FIELDS[code])) for code, label in BookInstance.LOAN_STATUS
+                if getattr(self, self.STATUS_FIELDS[code])]
+
+    @classmethod
+    def live_counts(cls, book_ids):
+        """
+        {book id: counts} counted from the BookInstance rows of these books (the
+        slow way), for the books that have copies
+        """
+        counts = {}
+        rows = (BookInstance.objects.filter(book_id__in=book_ids).order_by()
+                .values_list('book_id', 'status').annotate(number=models.Count('id')))
+        for book_id, status, number in rows:
+            book = counts.setdefault(book_id, dict.fromkeys(cls.COUNT_FIELDS, 0))
+            book['copies'] += number
+            if status in cls.STATUS_FIELDS:
+                book[cls.STATUS_FIELDS[status]] += number
+        return counts
+
+    @classmethod
+    def rebuild(cls, book_ids=None):
+        """
+        Recomputes the rows of these books (all books if None) from the copies
+        """
+        if book_ids is None:
+            cls.objects.all().delete()
+            book_ids = BookInstance.objects.exclude(book=None).order_by('book_id').values_list('book_id', flat=True).distinct()
+        book_ids = list(book_ids)
+        for start in range(0, len(book_ids), cls.BATCH_SIZE):
+            batch = book_ids[start:start + cls.BATCH_SIZE]
+            with transaction.atomic():
+                cls.objects.filter(book_id__in=batch).delete()
+                cls.objects.bulk_create([cls(book_id=book_id, **counts)
+                                         for book_id, counts in cls.live_counts(batch).items()])
+
+    @classmethod
+    def adjust(cls, deltas):
+        """
+        Applies {(book id, status): change in the number of copies} with one
+        UPDATE per book, e.g. {(1, 'o'): -1, (1, 'a'): 1} for a copy returned
+        """
+        books = {}
+        for (book_id, status), delta in deltas.items():
+            if book_id is None or not delta:
+                continue
+            changes = books.setdefault(book_id, Counter())
+            changes['copies'] += delta
+            if status in cls.STATUS_FIELDS:
+                changes[cls.STATUS_FIELDS[status]] += delta
+        for book_id, changes in books.items():
+            changes = {name: F(name) + delta for name, delta in changes.items() if delta}
+            # if the book has no row yet, count its copies from scratch
+            if changes and not cls.objects.filter(book_id=book_id).update(**changes):
+                cls.rebuild([book_id])
+
+    @classmethod
+    def inconsistencies(cls, book_ids):
+        """
+        (book id, stored counts, live counts) for each of these books whose row
+        doesn't match its copies
+        """
+        empty = dict.fromkeys(cls.COUNT_FIELDS, 0)
+        stored = {row.book_id: row.counts() for row in cls.objects.filter(book_id__in=book_ids)}
+        live = cls.live_counts(book_ids)
+        return [(book_id, stored.get(book_id, empty), live.get(book_id, empty)) for book_id in book_ids
+                if stored.get(book_id, empty) != live.get(book_id, empty)]
+
+
+class VisitCount(models.Model):
+    """
+    Number of index page visits per visitor ('user:<id>' for logged in users,
+    'visitor:<cookie>' for everyone else). Written in batches by catalog.visits
+    """
+    key = models.CharField(max_length=64, unique=True)
+    count = models.PositiveIntegerField(default=0)
+    last_flushed = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        """
+        String representing the model object
+        """
+        return '%s: %s' % (self.key, self.count)
+
+
+class CatalogVersion(models.Model):
+    """
+    A counter bumped (with the time) whenever anything in the catalog changes, so
+    that clients polling the JSON API can be answered 304 Not Modified after a
+    single one-row query. There is only ever one row (pk=1); it is kept current by
+    the signal handlers in catalog.signals and by code doing bulk changes.
+    """
+    version = models.PositiveIntegerField(default=0)
+    last_modified = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        """
+        String representing the model object
+        """
+        return 'Catalog version %s (%s)' % (self.version, self.last_modified)
+
+    @classmethod
+    def load(cls):
+        """
+        Returns the version row, creating it first if it doesn't exist yet
+        """
+        # a plain read first; get_or_create would count as a write and keep the
+        # request off the read replicas
+        try:
+            return cls.objects.get(pk=1)
+        except cls.DoesNotExist:
+            version, created = cls.objects.get_or_create(pk=1)
+            return version
+
+    @classmethod
+    def bump(cls):
+        """
+        Records that the catalog has changed, in a single UPDATE
+        """
+        if not cls.objects.filter(pk=1).update(version=F('version') + 1, last_modified=timezone.now()):
+            cls.objects.get_or_create(pk=1, defaults={'version': 1})
+
+
+class OverdueSnapshot(models.Model):
+    """
+    Number of overdue loans on a given day, recorded by `manage.py snapshot_overdue`
+    (run it daily, e.g. from cron) for the trend charts
+    """
+    date = models.DateField(unique=True)
+    overdue_loans = models.PositiveIntegerField(default=0)
+    overdue_borrowers = models.PositiveIntegerField(default=0)
+    loans = models.PositiveIntegerField(default=0, help_text='All copies on loan that day')
+
+    class Meta:
+        ordering = ['-date']
+
+    def __str__(self):
+        """
+        String representing the model object
+        """
+        return '%s: %s overdue of %s on loan' % (self.date, self.overdue_loans, self.loans)
+
+    @classmethod
+    def take(cls, today=None):
+        """
+        Counts today's overdue loans and stores them (replacing today's snapshot
+        if there already is one)
+        """
+        today = today or date.today()
+        overdue = BookInstance.objects.overdue(today)
+        snapshot, created = cls.objects.update_or_create(date=today, defaults={
+            'overdue_loans': overdue.count(),
+            'overdue_borrowers': overdue.exclude(borrower=None).order_by().values('borrower').distinct().count(),
+            'loans': BookInstance.objects.on_loan().count(),
+        })
+        return snapshot
+
+
+class RelatedBook(models.Model):
+    """
+    One of a book's "more like this" recommendations, ranked from 1, computed
+    offline by `manage.py recommend_books` (see catalog.recommendations)
+    """
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='related_books')
+    related = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ['book', 'rank']
+        unique_together = ('book', 'rank')
+
+    def __str__(self):
+        """
+        String representing the model object
+        """
+        return '%s: %s. %s' % (self.book_id, self.rank, self.related_id)
+
+
+class RecommendationSignature(models.Model):
+    """
+    A digest of what a book's recommendations were computed from (its author,
+    genres and borrowers), so an incremental run can tell which books changed
+    """
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    signature = models.BigIntegerField()
+
+
+class RecommendationRun(models.Model):
+    """
+    One run of `manage.py recommend_books`, with how long each step took
+    """
+    started = models.DateTimeField(default=timezone.now)
+    incremental = models.BooleanField(default=False)
+    books = models.PositiveIntegerField(default=0, help_text='Books in the catalog')
+    recomputed = models.PositiveIntegerField(default=0, help_text='Books whose recommendations were recomputed')
+    load_seconds = models.FloatField(default=0)
+    compute_seconds = models.FloatField(default=0)
+    store_seconds = models.FloatField(default=0)
+
+    class Meta:
+        ordering = ['-started']
+
+    def __str__(self):
+        """
+        String representing the model object
+        """
+        return '%s: %s of %s books in %.1f s' % (self.started, self.recomputed, self.books, self.total_seconds)
+
+    @property
+    def total_seconds(self):
+        return self.load_seconds + self.compute_seconds + self.store_seconds
+
+
+class LoanEvent(models.Model):
+    """
+    One step in a copy's circulation: lent, renewed, returned, or moved to
+    another status. Appended by catalog.circulation and never changed or
+    deleted. The copy, book and borrower aren't checked or indexed, so logging
+    is a single cheap INSERT, and the log outlives the rows it mentions.
+    """
+    CHECKOUT = 'c'
+    RENEWAL = 'n'
+    RETURN = 'r'
+    STATUS = 's'
+    KINDS = (
+        (CHECKOUT, 'Checkout'),
+        (RENEWAL, 'Renewal'),
+        (RETURN, 'Return'),
+        (STATUS, 'Status change'),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    time = models.DateTimeField(default=timezone.now)
+    kind = models.CharField(max_length=1, choices=KINDS)
+    copy = models.ForeignKey(BookInstance, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+                             related_name='+')
+    book = models.ForeignKey(Book, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+                             null=True, related_name='+')
+    borrower = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+                                 null=True, related_name='+')
+    # the copy's status and due date afterwards
+    status = models.CharField(max_length=1, choices=BookInstance.LOAN_STATUS)
+    due_back = models.DateField(null=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        """
+        String representing the model object
+        """
+        return '%s: %s of %s' % (self.time, self.get_kind_display(), self.copy_id)
+
+
+class LoanCounts(models.Model):
+    """
+    Number of checkouts, renewals and returns in one day, for the daily rollups
+    of the LoanEvent log written by `manage.py rollup_loans`
+    """
+    date = models.DateField()
+    checkouts = models.PositiveIntegerField(default=0)
+    renewals = models.PositiveIntegerField(default=0)
+    returns = models.PositiveIntegerField(default=0)
+
+    # the counter for each kind of LoanEvent; status changes aren't counted
+    KIND_FIELDS = {LoanEvent.CHECKOUT: 'checkouts', LoanEvent.RENEWAL: 'renewals', LoanEvent.RETURN: 'returns'}
+
+    class Meta:
+        abstract = True
+        ordering = ['-date']
+
+
+class DailyLoans(LoanCounts):
+    """
+    Circulation of the whole library in one day
+    """
+    class Meta(LoanCounts.Meta):
+        verbose_name_plural = 'daily loans'
+        unique_together = ('date',)
+
+    def __str__(self):
+        """
+        String representing the model object
+        """
+        return '%s: %s checkouts' % (self.date, self.checkouts)
+
+
+class DailyBookLoans(LoanCounts):
+    """
+    Circulation of one book's copies in one day
+    """
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+
+    class Meta(LoanCounts.Meta):
+        verbose_name_plural = 'daily book loans'
+        unique_together = ('book', 'date')
+        # the busiest books over a range of days
+        indexes = [models.Index(fields=['date', 'book'], name='daily_book_loans_date_idx')]
+
+    def __str__(self):
+        """
+        String representing the model object
+        """
+        return '%s, %s: %s checkouts' % (self.date, self.book_id, self.checkouts)
+
+
+class DailyGenreLoans(LoanCounts):
+    """
+    Circulation of the books in one genre in one day (by the genres the books
+    had when the day's events were rolled up)
+    """
+    genre = models.ForeignKey(Genre, on_delete=models.CASCADE, related_name='+')
+
+    class Meta(LoanCounts.Meta):
+        verbose_name_plural = 'daily genre loans'
+        unique_together = ('genre', 'date')
+        indexes = [models.Index(fields=['date', 'genre'], name='daily_genre_loans_date_idx')]
+
+    def __str__(self):
+        """
+        String representing the model object
+        """
+        return '%s, %s: %s checkouts' % (self.date, self.genre_id, self.checkouts)
+
+
+class LoanRollupMark(models.Model):
+    """
+    How far `manage.py rollup_loans` has got: the id of the last LoanEvent
+    counted in the daily rollups. There is only ever one row (pk=1).
+    """
+    last_event = models.BigIntegerField(default=0)
+    last_run = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        """
+        String representing the model object
+        """
+        return 'Loans rolled up to event %s (%s)' % (self.last_event, self.last_run)
+
+
+class ImportCheckpoint(models.Model):
+    """
+    How far `manage.py import_catalog` has got with a file: the number of input
+    rows already imported, saved in the same transaction as each chunk so it
+    never disagrees with what is in the catalog
+    """
+    source = models.CharField(max_length=255, unique=True, help_text='Absolute path of the file being imported')
+    rows_done = models.BigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        """
+        String representing the model object
+        """
+        return '%s: %s rows imported' % (self.source, self.rows_done)
@@ -0,0 +1,222 @@
+"""
+Keyset ("cursor") pagination for the catalog list views.
+
+OFFSET/LIMIT pagination has to count every row and skip over all the rows before
+the requested page, so deep pages get slower the deeper they are. Keyset
+pagination remembers the sort key of the last row shown and asks for the rows
+after it instead, which is an index range scan no matter how deep the page is,
+and it never needs a COUNT(*). The price is that pages have no numbers: you can
+only step to the next or previous page.
+
+Views opt in by mixing in CursorPaginationMixin and naming a stable ordering
+(ending in a unique field) in cursor_ordering. A request then uses keyset
+pagination when it passes a `cursor` parameter (an empty one means the first
+page), or always when settings.CATALOG_PAGINATION_MODE is 'keyset'. Otherwise
+the view paginates by page number as before.
+
+The admin change lists of the big tables use EstimatedCountPaginator instead,
+which takes the size of an unfiltered table from the database's bookkeeping
+rather than counting it.
+"""
+import base64
+import json
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.http import Http404
+from django.utils.functional import cached_property
+from django.utils.translation import ugettext as _
+
+
+def encode_cursor(direction, values):
+    """
+    Packs a direction ('n'ext or 'p'revious) and the key values of a row into an
+    opaque, URL-safe string
+    """
+    values = [value if value is None or isinstance(value, (int, float)) else str(value) for value in values]
+    data = json.dumps([direction] + values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, fields):
+    """
+    Unpacks a cursor made by encode_cursor, converting the values back to python
+    with the given model fields. Raises ValueError for anything malformed.
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8'))
+        direction, values = data[0], data[1:]
+    except (TypeError, ValueError, IndexError, UnicodeDecodeError):
+        raise ValueError('Malformed cursor')
+    if direction not in ('n', 'p') or len(values) != len(fields):
+        raise ValueError('Malformed cursor')
+    try:
+        return direction, [None if value is None else field.to_python(value) for field, value in zip(fields, values)]
+    except Exception:
+        raise ValueError('Malformed cursor')
+
+
+class CursorPage(object):
+    """
+    One page of keyset-paginated results. Quacks enough like a Page for the
+    templates (has_next, has_previous, object_list) but has no page numbers.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<CursorPage of %s>' % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginationMixin(object):
+    """
+    Adds keyset pagination to a ListView. cursor_ordering must end in a field
+    that is unique (usually 'id') so that every row has a distinct position.
+    """
+    cursor_ordering = ('id',)
+    cursor_param = 'cursor'
+
+    def uses_cursor_pagination(self):
+        if self.cursor_param in self.request.GET:
+            return True
+        return getattr(settings, 'CATALOG_PAGINATION_MODE', 'offset') == 'keyset'
+
+    def paginate_queryset(self, queryset, page_size):
+        # both modes share the same stable ordering
+        queryset = queryset.order_by(*self.cursor_ordering)
+        if not self.uses_cursor_pagination():
+            return super().paginate_queryset(queryset, page_size)
+
+        fields = [queryset.model._meta.get_field(name) for name in self.cursor_ordering]
+        cursor = self.request.GET.get(self.cursor_param)
+        direction, values = 'n', None
+        if cursor:
+            try:
+                direction, values = decode_cursor(cursor, fields)
+            except ValueError:
+                raise Http404(_('Invalid cursor'))
+
+        nulls_largest = connections[queryset.db].features.nulls_order_largest
+        if direction == 'n':
+            if values is not None:
+                queryset = queryset.filter(keyset_filter(fields, values, '>', nulls_largest))
+            rows = list(queryset[:page_size + 1])
+        else:
+            queryset = queryset.filter(keyset_filter(fields, values, '<', nulls_largest))
+            rows = list(queryset.reverse()[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if direction == 'p':
+            rows.reverse()
+
+        def key(row):
+            return [getattr(row, field.attname) for field in fields]
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or direction == 'p':
+                next_cursor = encode_cursor('n', key(rows[-1]))
+            if (has_more and direction == 'p') or (direction == 'n' and values is not None):
+                previous_cursor = encode_cursor('p', key(rows[0]))
+        page = CursorPage(rows, next_cursor, previous_cursor)
+        return (None, page, page.object_list, page.has_other_pages())
+
+
+def keyset_filter(fields, values, op, nulls_largest=False):
+    """
+    Builds the WHERE clause selecting rows strictly after ('>') or before ('<')
+    the row with the given key values in ascending order of fields, i.e.
+    (f1 > v1) OR (f1 = v1 AND f2 > v2) OR ...
+    NULLs sort as the smallest values unless nulls_largest, as in the database.
+    """
+    condition = Q(pk__in=[])
+    equal_so_far = Q()
+    for field, value in zip(fields, values):
+        condition |= equal_so_far & _compare(field, value, op, nulls_largest)
+        equal_so_far &= Q(**{'%s__isnull' % field.name: True}) if value is None else Q(**{field.name: value})
+    return condition
+
+
+def _compare(field, value, op, nulls_largest):
+    """
+    Q for `field op value` with NULLs ordered like the database orders them
+    """
+    nothing = Q(pk__in=[])
+    null = Q(**{'%s__isnull' % field.name: True})
+    # is the comparison looking towards the end of the ordering where NULLs are?
+    towards_nulls = (op == '>') == nulls_largest
+    if value is None:
+        return nothing if towards_nulls else ~null
+    lookup = Q(**{'%s__%s' % (field.name, 'gt' if op == '>' else 'lt'): value})
+    if towards_nulls and field.null:
+        return lookup | null
+    return lookup
+
+
+# tables smaller than this are counted exactly, it's cheap enough
+ESTIMATE_THRESHOLD = 10000
+
+
+def estimated_count(queryset):
+    """
+    A quick estimate of the number of rows in an unfiltered queryset's table,
+    from the database's own bookkeeping rather than a COUNT(*) that reads the
+    whole table. None if the queryset is filtered, or the database can't tell.
+    """
+    query = queryset.query
+    if query.where or query.distinct or query.low_mark or query.high_mark is not None:
+        return None
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # refreshed by VACUUM and ANALYZE (autovacuum keeps it close)
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'sqlite':
+            # rowids are handed out in increasing order, so this is exact until rows are deleted
+            cursor.execute('SELECT MAX(rowid) FROM %s' % connection.ops.quote_name(table))
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None:
+        # an empty SQLite table
+        return 0 if connection.vendor == 'sqlite' else None
+    # PostgreSQL says -1 for a table that has never been analyzed
+    return int(row[0]) if row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for the admin change lists of big tables: an unfiltered list is
+    counted with estimated_count(), so the page count (and the last page) may be
+    a little off, but showing the first page doesn't cost a COUNT(*) of the table.
+    Filtered lists are still counted exactly, with the filters' indexes.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = estimated_count(self.object_list)
+        if estimate is None or estimate < ESTIMATE_THRESHOLD:
+            return super().count
+        return estimate
@@ -0,0 +1,95 @@
+"""
+Query plans for the hot BookInstance queries.
+
+access_paths() builds the copy querysets the views, admin, API and export run,
+the same way they build them, so the query plan tests (and `manage.py benchmark
+indexes`) can check that each one is answered from an index rather than by
+reading the whole catalog_bookinstance table.
+
+Only SQLite's EXPLAIN QUERY PLAN output is understood.
+"""
+from django.contrib.admin.sites import site
+from django.db import connections
+from django.db.models import Count
+from django.test import RequestFactory
+
+from .models import BookInstance
+from .views import AllBooksLoanedListView, AuthorDetailView, LoanedBooksByUserListView
+
+COPY_TABLE = BookInstance._meta.db_table
+
+
+def explain(queryset):
+    """
+    The lines of the query plan for a queryset
+    """
+    connection = connections[queryset.db]
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [str(row[-1]) for row in cursor.fetchall()]
+
+
+def full_scans(plan, table=COPY_TABLE, limited=False, filtered=False):
+    """
+    The plan lines that read every row of table: a SCAN straight through the
+    table, or through a whole index. Walking an index in order is fine when the
+    query is limited and has no WHERE clause, as it stops after the first few
+    rows; a filtered query checks each row it walks past, and with a selective
+    filter that can be most of the index before the limit is reached. Filters
+    answered from an index show up as SEARCH lines, which aren't scans.
+    """
+    scans = []
+    for line in plan:
+        # older SQLites say "SCAN TABLE x", newer ones "SCAN x"
+        words = [word for word in line.split() if word != 'TABLE']
+        if words[:2] == ['SCAN', table] and not (limited and not filtered and 'INDEX' in words):
+            scans.append(line)
+    return scans
+
+
+def queryset_full_scans(queryset, table=COPY_TABLE):
+    return full_scans(explain(queryset), table, limited=queryset.query.high_mark is not None,
+                      filtered=bool(queryset.query.where))
+
+
+def view_queryset(view_class, user, **kwargs):
+    """
+    A list view's queryset for this user, ordered the way the view paginates it
+    """
+    view = view_class(**kwargs)
+    view.request = RequestFactory().get('/')
+    view.request.user = user
+    return view.get_queryset().order_by(*view.cursor_ordering)
+
+
+def access_paths(book, author, user):
+    """
+    {name: queryset} for every hot BookInstance query, for the given book,
+    author and borrower
+    """
+    admin = site._registry[BookInstance]
+    admin_request = RequestFactory().get('/')
+    admin_request.user = user
+    # the change list adds -pk to make the ordering deterministic
+    admin_ordering = list(admin.get_ordering(admin_request) or BookInstance._meta.ordering) + ['-pk']
+    author_view = AuthorDetailView()
+    author_view.object = author
+    return {
+        'my loans': view_queryset(LoanedBooksByUserListView, user)[:10],
+        'all loans': view_queryset(AllBooksLoanedListView, user)[:10],
+        'book detail copies': book.bookinstance_set.order_by('due_back', 'id'),
+        'book availability recount': BookInstance.objects.filter(book_id__in=[book.pk]).order_by()
+            .values_list('book_id', 'status').annotate(number=Count('id')),
+        'author detail books': author_view.get_books()[:10],
+        'overdue count': BookInstance.objects.overdue(),
+        'overdue by borrower': BookInstance.objects.overdue_by_borrower(),
+        'overdue loans of a page of borrowers': BookInstance.objects.overdue().filter(borrower_id__in=[user.pk])
+            .order_by('due_back', 'id'),
+        'admin copies': admin.get_queryset(admin_request).order_by(*admin_ordering)[:100],
+        'admin copies by status': admin.get_queryset(admin_request).filter(status='o')
+            .order_by(*admin_ordering)[:100],
+        'admin book inline': BookInstance.objects.filter(book=book),
+        'api copies of a book': BookInstance.objects.filter(book_id=book.pk).order_by('id')[:50],
+        'export loans': BookInstance.objects.on_loan().order_by('pk')[:5000],
+    }
@@ -0,0 +1,285 @@
+"""
+"More like this" recommendations for the book page, computed offline.
+
+Two books are related by what they have in common: each shared genre scores
+GENRE_WEIGHT, the same author AUTHOR_WEIGHT and each patron who borrowed (or
+has reserved or is waiting for) both BORROWER_WEIGHT. These are the co-occurrence
+counts of a books x features incidence matrix X, weighted: the scores are
+X . X^T. Working them out live on every page view would mean a join across the
+genre links and all the loans, so `manage.py recommend_books` computes the TOP_N
+highest scoring books for each book in one batch and stores them as RelatedBook
+rows, which the book page reads with a single query. Ties go to the lower book
+id, so runs are repeatable.
+
+With NumPy installed the scores are computed a block of books at a time with
+vectorized sparse (coordinate list) arithmetic; without it, book by book in pure
+Python, which gives the same results but is only practical for small catalogs.
+
+An incremental run (--changed) only recomputes the books whose author, genres or
+borrowers changed since the last run (going by a digest stored for each book in
+RecommendationSignature), and the books whose lists they may enter or leave.
+
+Borrowers are taken from the copies currently lent or reserved and the hold
+queue: the catalog keeps no history of past loans.
+"""
+import hashlib
+import time
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Min
+
+from . import fragments
+from .models import Book, BookInstance, Hold, RecommendationRun, RecommendationSignature, RelatedBook
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+TOP_N = 5
+
+GENRE_WEIGHT = 1
+AUTHOR_WEIGHT = 2
+BORROWER_WEIGHT = 3
+
+# scores held in memory at once (a block of books by all the books)
+BLOCK_CELLS = 4000000
+
+# ids per query, under SQLite's limit on query parameters
+BATCH_SIZE = 500
+
+
+class Incidence(object):
+    """
+    Which features each book has, as sets of (kind, value, weight)
+    """
+
+    def __init__(self, book_ids):
+        self.book_ids = sorted(book_ids)
+        self.position = {book_id: n for n, book_id in enumerate(self.book_ids)}
+        self.features = defaultdict(set)
+
+    def add(self, book_id, kind, value, weight):
+        if book_id in self.position and value is not None:
+            self.features[book_id].add((kind, value, weight))
+
+    def signature(self, book_id):
+        """
+        A 64 bit digest of the book's features
+        """
+        data = repr(sorted(self.features.get(book_id, ()))).encode('utf-8')
+        return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big', signed=True)
+
+    def columns(self):
+        """
+        The weight of each feature, by feature number, and the (book position,
+        feature number) pairs of the incidence matrix, as two parallel lists
+        """
+        numbers, weights, rows, cols = {}, [], [], []
+        for book_id, features in self.features.items():
+            for kind, value, weight in features:
+                number = numbers.get((kind, value))
+                if number is None:
+                    number = numbers[kind, value] = len(weights)
+                    weights.append(weight)
+                rows.append(self.position[book_id])
+                cols.append(number)
+        return weights, rows, cols
+
+
+def load():
+    """
+    The incidence of every book, from one query per kind of feature
+    """
+    incidence = Incidence(Book.objects.order_by().values_list('id', flat=True))
+    for book_id, author_id in Book.objects.exclude(author=None).order_by().values_list('id', 'author_id'):
+        incidence.add(book_id, 'author', author_id, AUTHOR_WEIGHT)
+    for book_id, genre_id in Book.genre.through.objects.order_by().values_list('book_id', 'genre_id'):
+        incidence.add(book_id, 'genre', genre_id, GENRE_WEIGHT)
+    for book_id, user_id in BookInstance.objects.exclude(borrower=None).order_by().values_list('book_id', 'borrower_id'):
+        incidence.add(book_id, 'borrower', user_id, BORROWER_WEIGHT)
+    for book_id, user_id in Hold.objects.order_by().values_list('book_id', 'patron_id'):
+        incidence.add(book_id, 'borrower', user_id, BORROWER_WEIGHT)
+    return incidence
+
+
+def top_related(incidence, book_ids, top_n=TOP_N):
+    """
+    {book id: [(related book id, score)] best first} for the given books
+    """
+    if np is None:
+        return {book_id: sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_n]
+                for book_id, scores in _python_scores(incidence, book_ids)}
+    count = len(incidence.book_ids)
+    # a later position ranks higher among equal scores, so lower ids win ties
+    tie_break = count - np.arange(count, dtype=np.int64)
+    k = min(top_n, count)
+    related = {}
+    for chunk, scores in _numpy_scores(incidence, book_ids):
+        keys = np.where(scores > 0, scores * (count + 1) + tie_break, -1)
+        best = np.argpartition(-keys, k - 1, axis=1)[:, :k] if k < count else np.tile(np.arange(count), (len(chunk), 1))
+        best_keys = np.take_along_axis(keys, best, axis=1)
+        ranked = np.take_along_axis(best, np.argsort(-best_keys, axis=1, kind='stable'), axis=1)
+        for row, position in enumerate(chunk):
+            related[incidence.book_ids[position]] = [(incidence.book_ids[other], int(scores[row, other]))
+                                                     for other in ranked[row] if scores[row, other] > 0]
+    return related
+
+
+def all_scores(incidence, book_ids):
+    """
+    (book id, {other book id: score}) for the given books, leaving out zeros
+    """
+    if np is None:
+        yield from _python_scores(incidence, book_ids)
+        return
+    for chunk, scores in _numpy_scores(incidence, book_ids):
+        for row, position in enumerate(chunk):
+            others = np.flatnonzero(scores[row])
+            yield incidence.book_ids[position], {incidence.book_ids[other]: int(scores[row, other]) for other in others}
+
+
+def _numpy_scores(incidence, book_ids):
+    """
+    (positions, scores) for blocks of the given books, where scores[n] is the
+    row of X . X^T for the book at positions[n], with its own score zeroed
+    """
+    weights, rows, cols = incidence.columns()
+    count = len(incidence.book_ids)
+    weights = np.array(weights, dtype=np.int64)
+    rows = np.array(rows, dtype=np.int64)
+    cols = np.array(cols, dtype=np.int64)
+    # the books having each feature, as a CSR-style index: books_of[starts[f]:ends[f]]
+    books_of = rows[np.argsort(cols, kind='stable')]
+    ends = np.cumsum(np.bincount(cols, minlength=len(weights)))
+    starts = ends - np.bincount(cols, minlength=len(weights))
+    # the features of each book, the same way
+    features_of = cols[np.argsort(rows, kind='stable')]
+    book_ends = np.cumsum(np.bincount(rows, minlength=count))
+    book_starts = book_ends - np.bincount(rows, minlength=count)
+
+    positions = np.array(sorted(incidence.position[book_id] for book_id in book_ids), dtype=np.int64)
+    block = max(1, BLOCK_CELLS // max(count, 1))
+    for start in range(0, len(positions), block):
+        chunk = positions[start:start + block]
+        # every (row in the block, feature) pair...
+        lengths = book_ends[chunk] - book_starts[chunk]
+        pair_rows = np.repeat(np.arange(len(chunk)), lengths)
+        pair_features = features_of[_ranges(book_starts[chunk], lengths)]
+        # ...joined with every book having that feature
+        fan_out = ends[pair_features] - starts[pair_features]
+        cell_rows = np.repeat(pair_rows, fan_out)
+        cell_books = books_of[_ranges(starts[pair_features], fan_out)]
+        cell_weights = np.repeat(weights[pair_features], fan_out)
+        scores = np.bincount(cell_rows * count + cell_books, weights=cell_weights,
+                             minlength=len(chunk) * count).reshape(len(chunk), count).astype(np.int64)
+        scores[np.arange(len(chunk)), chunk] = 0
+        yield chunk, scores
+
+
+def _ranges(starts, lengths):
+    """
+    The concatenation of range(start, start + length) for each pair, vectorized
+    """
+    total = int(lengths.sum())
+    if not total:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + np.arange(total, dtype=np.int64) - offsets
+
+
+def _python_scores(incidence, book_ids):
+    books_of = defaultdict(list)
+    for other, features in incidence.features.items():
+        for kind, value, weight in features:
+            books_of[kind, value].append(other)
+    for book_id in sorted(book_ids):
+        scores = Counter()
+        for kind, value, weight in incidence.features.get(book_id, ()):
+            for other in books_of[kind, value]:
+                if other != book_id:
+                    scores[other] += weight
+        yield book_id, scores
+
+
+def changed_books(incidence):
+    """
+    The books whose features differ from those of the last run, and their
+    signatures
+    """
+    stored = dict(RecommendationSignature.objects.values_list('book_id', 'signature'))
+    signatures = {book_id: incidence.signature(book_id) for book_id in incidence.book_ids}
+    return {book_id: signature for book_id, signature in signatures.items() if stored.get(book_id) != signature}
+
+
+def affected_books(incidence, changed, top_n=TOP_N):
+    """
+    The books whose recommendations may be different now that the changed
+    books are: those books themselves, the books that list one of them, and
+    the books one of them now scores high enough with to be listed on (the
+    scores are symmetric, so a changed book's row says where it now belongs)
+    """
+    affected = set(changed)
+    for start in range(0, len(changed), BATCH_SIZE):
+        affected.update(RelatedBook.objects.filter(related_id__in=changed[start:start + BATCH_SIZE])
+                        .order_by().values_list('book_id', flat=True))
+    # how many books each book lists, and the lowest score among them
+    listed = {book_id: (count, lowest) for book_id, count, lowest in RelatedBook.objects.order_by()
+              .values_list('book_id').annotate(Count('id'), Min('score'))}
+    for book_id, scores in all_scores(incidence, changed):
+        for other, score in scores.items():
+            count, lowest = listed.get(other, (0, 0))
+            if count < top_n or score >= lowest:
+                affected.add(other)
+    return affected & set(incidence.position)
+
+
+def store(related, signatures):
+    """
+    Replaces the recommendations of the books in related, and the stored
+    signatures of the books in signatures, in one transaction
+    """
+    book_ids = sorted(related)
+    with transaction.atomic():
+        for start in range(0, len(book_ids), BATCH_SIZE):
+            RelatedBook.objects.filter(book_id__in=book_ids[start:start + BATCH_SIZE]).delete()
+        RelatedBook.objects.bulk_create([
+            RelatedBook(book_id=book_id, related_id=other, rank=rank, score=score)
+            for book_id in book_ids for rank, (other, score) in enumerate(related[book_id], 1)])
+        changed = sorted(signatures)
+        for start in range(0, len(changed), BATCH_SIZE):
+            RecommendationSignature.objects.filter(book_id__in=changed[start:start + BATCH_SIZE]).delete()
+        RecommendationSignature.objects.bulk_create([
+            RecommendationSignature(book_id=book_id, signature=signature)
+            for book_id, signature in sorted(signatures.items())])
+    # the recommendations are part of the cached book pages
+    fragments.invalidate_books(book_ids)
+
+
+def recompute(incremental=False, top_n=TOP_N):
+    """
+    Computes and stores the recommendations (of every book, or with incremental
+    only of those affected by changes since the last run) and returns the
+    RecommendationRun recording it
+    """
+    run = RecommendationRun(incremental=incremental)
+    started = time.perf_counter()
+    incidence = load()
+    signatures = changed_books(incidence)
+    if incremental:
+        book_ids = affected_books(incidence, sorted(signatures), top_n)
+    else:
+        book_ids = set(incidence.book_ids)
+    run.load_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    related = top_related(incidence, book_ids, top_n)
+    run.compute_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    store(related, signatures)
+    run.store_seconds = time.perf_counter() - started
+    run.books, run.recomputed = len(incidence.book_ids), len(book_ids)
+    run.save()
+    return run
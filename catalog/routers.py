@@ -0,0 +1,136 @@
+"""
+Read replicas for the catalog's browsing pages.
+
+ReplicaRouter sends every write to the primary ('default') database, and the
+reads of read-only pages to a replica, so that browsing doesn't compete with the
+librarians' changes for the primary. A view opts in with a `read_replica = True`
+attribute on a class-based view or the read_replica() decorator on a function
+view (the JSON API's views all do). ReplicaRoutingMiddleware then sends its
+GET and HEAD requests' reads of the catalog's own tables to one of the replica
+aliases, picked at random per request. Reads still go to the primary:
+
+- for sessions, users and permissions, so that logging in takes effect at once,
+- for the home page's visit count, which adds the hits this process hasn't
+  written yet to the stored count (see catalog.visits),
+- in every other view (forms, the admin, the librarians' pages),
+- inside transactions, and for the rest of a request once it has written,
+- for STICKY_SECONDS after a visitor last wrote anything with a POST (renewed a
+  loan, edited a book, placed a hold), so they see their own changes even if the
+  replicas are behind. A cookie remembers the write rather than the session,
+  so that pinning a visitor doesn't itself write to the database.
+
+Replicas are kept in step by the database's own replication, not by Django, so
+nothing is ever migrated on them. To try it out locally, point the
+CATALOG_REPLICA_DB environment variable at a second SQLite file and copy the
+primary into it with `manage.py sync_replica` (again whenever the replica should
+catch up).
+
+Configure with the CATALOG_REPLICAS setting, e.g.
+{'ALIASES': ['replica'], 'STICKY_SECONDS': 15}. With no aliases everything goes
+to the primary, as it did before.
+"""
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.deprecation import MiddlewareMixin
+
+DEFAULT_STICKY_SECONDS = 15
+
+# holds the time (as a unix timestamp) until which the visitor reads from the primary
+PIN_COOKIE = 'catalog_primary_until'
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+_state = threading.local()
+
+
+def get_options():
+    options = getattr(settings, 'CATALOG_REPLICAS', {})
+    return options.get('ALIASES', []), options.get('STICKY_SECONDS', DEFAULT_STICKY_SECONDS)
+
+
+def read_replica(view):
+    """
+    Marks a function view as read-only, so its reads can go to a replica
+    """
+    view.read_replica = True
+    return view
+
+
+def start_request():
+    _state.replica = None
+    _state.wrote = False
+
+
+def use_replica(alias):
+    """
+    Sends this thread's reads to the alias (None for the primary) until the
+    request ends or something is written
+    """
+    _state.replica = alias
+
+
+def wrote():
+    return getattr(_state, 'wrote', False)
+
+
+def replica_in_use():
+    """
+    Whether this thread's reads of the catalog are going to a replica
+    """
+    return getattr(_state, 'replica', None) is not None and not wrote()
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        replica = getattr(_state, 'replica', None)
+        if (replica is None or model._meta.app_label != 'catalog' or wrote()
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return replica
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        aliases, sticky_seconds = get_options()
+        return db not in aliases
+
+
+class ReplicaRoutingMiddleware(MiddlewareMixin):
+    """
+    Picks the database each request reads from, see the module docstring
+    """
+
+    def process_request(self, request):
+        start_request()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        aliases, sticky_seconds = get_options()
+        view = getattr(view_func, 'view_class', view_func)
+        if not aliases or request.method not in SAFE_METHODS or not getattr(view, 'read_replica', False):
+            return None
+        try:
+            pinned = float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        if not pinned:
+            use_replica(random.choice(aliases))
+        return None
+
+    def process_response(self, request, response):
+        aliases, sticky_seconds = get_options()
+        if aliases and wrote() and request.method not in SAFE_METHODS:
+            response.set_cookie(PIN_COOKIE, '%.0f' % (time.time() + sticky_seconds), max_age=sticky_seconds,
+                httponly=True)
+        start_request()
+        return response
@@ -0,0 +1,203 @@
+"""
+Full-text search over books, backed by an SQLite FTS5 table.
+
+catalog_book_fts holds one row per book (rowid = book id) with the book's
+title, summary, ISBN and author's name. It is kept in sync by the signal
+handlers in catalog.signals and can be rebuilt with
+`manage.py rebuild_search_index`. Results are ranked with bm25, with matches in
+the title counting the most.
+
+On databases without FTS5 (not SQLite, or an SQLite built without it) search
+falls back to (slow) icontains lookups, so the site still works there. Whether a
+database has FTS5 is found out by trying it, once per process.
+"""
+import re
+
+from django.db import DatabaseError, connection
+from django.db.models import Q
+
+from .models import Book
+
+FTS_TABLE = 'catalog_book_fts'
+
+# bm25 weights for the title, summary, isbn and author columns
+RANK = 'bm25(%s, 10.0, 1.0, 5.0, 5.0)' % FTS_TABLE
+
+CREATE_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(title, summary, isbn, author, tokenize='unicode61')"
+    % FTS_TABLE)
+DROP_SQL = 'DROP TABLE IF EXISTS %s' % FTS_TABLE
+
+# copies books (selected by the WHERE clause that is appended) into the index
+INDEX_SQL = (
+    "INSERT INTO {fts}(rowid, title, summary, isbn, author) "
+    "SELECT b.id, b.title, b.summary, b.isbn, COALESCE(a.first_name || ' ' || a.last_name, '') "
+    "FROM catalog_book b LEFT JOIN catalog_author a ON a.id = b.author_id".format(fts=FTS_TABLE))
+
+
+# {database alias: whether it has FTS5}
+_fts5 = {}
+
+
+def search_available(using=connection):
+    if using.vendor != 'sqlite':
+        return False
+    if using.alias not in _fts5:
+        _fts5[using.alias] = has_fts5(using)
+    return _fts5[using.alias]
+
+
+def has_fts5(using):
+    """
+    True if FTS5 works on this SQLite database, either compiled in or loaded as
+    an extension
+    """
+    with using.cursor() as cursor:
+        try:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            if cursor.fetchone()[0]:
+                return True
+        except DatabaseError:
+            pass
+        try:
+            cursor.execute('CREATE VIRTUAL TABLE temp.catalog_fts5_probe USING fts5(probe)')
+        except DatabaseError:
+            return False
+        cursor.execute('DROP TABLE temp.catalog_fts5_probe')
+        return True
+
+
+def create_index(schema_editor):
+    """
+    Creates the FTS table (used by the migration)
+    """
+    if search_available(schema_editor.connection):
+        schema_editor.execute(CREATE_SQL)
+
+
+def drop_index(schema_editor):
+    if search_available(schema_editor.connection):
+        schema_editor.execute(DROP_SQL)
+
+
+def rebuild_index():
+    """
+    Empties the index and refills it from the book table. Returns the number of books indexed.
+    """
+    if not search_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s' % FTS_TABLE)
+        cursor.execute(INDEX_SQL)
+        return cursor.rowcount
+
+
+def index_books(book_ids):
+    """
+    (Re)indexes the books with these ids
+    """
+    book_ids = list(book_ids)
+    if not book_ids or not search_available():
+        return
+    with connection.cursor() as cursor:
+        # stay well below SQLite's limit on the number of query parameters
+        for start in range(0, len(book_ids), 500):
+            chunk = book_ids[start:start + 500]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute('DELETE FROM %s WHERE rowid IN (%s)' % (FTS_TABLE, placeholders), chunk)
+            cursor.execute('%s WHERE b.id IN (%s)' % (INDEX_SQL, placeholders), chunk)
+
+
+def index_author_books(author_id):
+    """
+    Reindexes every book by this author (after their name changed)
+    """
+    if not search_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s WHERE rowid IN (SELECT id FROM catalog_book WHERE author_id = %%s)' % FTS_TABLE,
+                       [author_id])
+        cursor.execute('%s WHERE b.author_id = %%s' % INDEX_SQL, [author_id])
+
+
+def remove_books(book_ids):
+    book_ids = list(book_ids)
+    if not book_ids or not search_available():
+        return
+    with connection.cursor() as cursor:
+        for start in range(0, len(book_ids), 500):
+            chunk = book_ids[start:start + 500]
+            cursor.execute('DELETE FROM %s WHERE rowid IN (%s)' % (FTS_TABLE, ', '.join(['%s'] * len(chunk))), chunk)
+
+
+def match_expression(query):
+    """
+    Turns what the user typed into an FTS5 query: every word must match, and the
+    last one may be a prefix (so results appear while typing). Returns '' if
+    there is nothing searchable in the query.
+    """
+    words = re.findall(r'\w+', query.lower())
+    if not words:
+        return ''
+    terms = ['"%s"' % word for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+class SearchResults(object):
+    """
+    Lazily evaluated, bm25-ranked search results. Supports count() and slicing,
+    which is all the Paginator needs, and fetches just the requested slice.
+    """
+    model = Book
+
+    def __init__(self, query):
+        self.query = query
+        self.match = match_expression(query)
+        self._count = None
+
+    def __repr__(self):
+        return '<SearchResults for %r>' % self.query
+
+    def count(self):
+        if self._count is None:
+            if not self.match:
+                self._count = 0
+            elif search_available():
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT COUNT(*) FROM %s WHERE %s MATCH %%s' % (FTS_TABLE, FTS_TABLE), [self.match])
+                    self._count = cursor.fetchone()[0]
+            else:
+                self._count = self.fallback_queryset().count()
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        if not self.match or (stop is not None and stop <= start):
+            return []
+        if not search_available():
+            return list(self.fallback_queryset()[start:stop])
+        limit = -1 if stop is None else stop - start
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT rowid FROM %s WHERE %s MATCH %%s ORDER BY %s LIMIT %%s OFFSET %%s' % (FTS_TABLE, FTS_TABLE, RANK),
+                [self.match, limit, start])
+            ids = [row[0] for row in cursor.fetchall()]
+        books = Book.objects.select_related('author').in_bulk(ids)
+        return [books[book_id] for book_id in ids if book_id in books]
+
+    def fallback_queryset(self):
+        condition = Q()
+        for word in re.findall(r'\w+', self.query):
+            condition &= (Q(title__icontains=word) | Q(summary__icontains=word) | Q(isbn__icontains=word) |
+                          Q(author__first_name__icontains=word) | Q(author__last_name__icontains=word))
+        return Book.objects.select_related('author').filter(condition).order_by('title', 'id')
+
+
+def search_books(query):
+    return SearchResults(query)
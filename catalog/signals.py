@@ -0,0 +1,303 @@
+"""
+Signal handlers that keep the denormalized catalog tables in step with the
+models they summarize.
+
+Note that QuerySet.update() and bulk_create() don't send these signals, so code
+using them has to bring the summaries up to date itself (or run the matching
+rebuild management command afterwards).
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from . import autocomplete, circulation, facets, fragments, search
+from .models import (Author, Book, BookAvailability, BookInstance, CatalogStats, CatalogVersion, Genre, Language,
+                     RelatedBook)
+
+
+def is_english(language_id):
+    """
+    True if the language with this id is named English
+    """
+    return language_id is not None and Language.objects.filter(pk=language_id, name='English').exists()
+
+
+@receiver(pre_save, sender=Author)
+@receiver(pre_save, sender=Book)
+@receiver(pre_save, sender=BookInstance)
+def remember_old_state(sender, instance, **kwargs):
+    """
+    Stashes the row as it is in the database before an update, so the post_save
+    handlers can work out what actually changed
+    """
+    instance._old_state = None
+    if not instance._state.adding:
+        fields = [f.attname for f in sender._meta.concrete_fields if not f.primary_key]
+        instance._old_state = sender.objects.filter(pk=instance.pk).values(*fields).first()
+
+
+@receiver(post_save, sender=Book)
+def count_saved_book(sender, instance, created, **kwargs):
+    old = getattr(instance, '_old_state', None)
+    if created or old is None:
+        CatalogStats.adjust(num_books=1, num_books_english=int(is_english(instance.language_id)))
+    elif old['language_id'] != instance.language_id:
+        CatalogStats.adjust(num_books_english=int(is_english(instance.language_id)) - int(is_english(old['language_id'])))
+
+
+@receiver(post_delete, sender=Book)
+def count_deleted_book(sender, instance, **kwargs):
+    CatalogStats.adjust(num_books=-1, num_books_english=-int(is_english(instance.language_id)))
+
+
+@receiver(post_save, sender=BookInstance)
+def count_saved_copy(sender, instance, created, **kwargs):
+    old = getattr(instance, '_old_state', None)
+    available = int(instance.status == 'a')
+    if created or old is None:
+        CatalogStats.adjust(num_instances=1, num_instances_available=available)
+    else:
+        CatalogStats.adjust(num_instances_available=available - int(old['status'] == 'a'))
+
+
+@receiver(post_delete, sender=BookInstance)
+def count_deleted_copy(sender, instance, **kwargs):
+    CatalogStats.adjust(num_instances=-1, num_instances_available=-int(instance.status == 'a'))
+
+
+@receiver(post_save, sender=BookInstance)
+def count_saved_copy_for_book(sender, instance, created, **kwargs):
+    # a copy moving to another status or another book leaves one count and joins another
+    old = getattr(instance, '_old_state', None)
+    deltas = Counter({(instance.book_id, instance.status): 1})
+    if not created and old is not None:
+        deltas[old['book_id'], old['status']] -= 1
+    BookAvailability.adjust(deltas)
+
+
+@receiver(post_delete, sender=BookInstance)
+def count_deleted_copy_for_book(sender, instance, **kwargs):
+    BookAvailability.adjust({(instance.book_id, instance.status): -1})
+
+
+@receiver(post_save, sender=Author)
+def count_saved_author(sender, instance, created, **kwargs):
+    if created:
+        CatalogStats.adjust(num_authors=1)
+
+
+@receiver(post_delete, sender=Author)
+def count_deleted_author(sender, instance, **kwargs):
+    CatalogStats.adjust(num_authors=-1)
+
+
+@receiver(post_save, sender=Language)
+@receiver(post_delete, sender=Language)
+def recount_english_books(sender, instance, **kwargs):
+    # renaming or deleting a language can change which books count as English
+    CatalogStats.recount_english()
+
+
+@receiver(post_save, sender=Book)
+def index_saved_book(sender, instance, **kwargs):
+    search.index_books([instance.pk])
+
+
+@receiver(post_delete, sender=Book)
+def unindex_deleted_book(sender, instance, **kwargs):
+    search.remove_books([instance.pk])
+
+
+@receiver(post_save, sender=Author)
+def index_author_books(sender, instance, created, **kwargs):
+    # the author's name is part of every one of their books' index entries
+    if not created:
+        search.index_author_books(instance.pk)
+
+
+@receiver(pre_delete, sender=Author)
+def remember_author_books(sender, instance, **kwargs):
+    # by post_delete the books no longer point at the author
+    instance._book_ids = list(instance.book_set.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Author)
+def index_orphaned_books(sender, instance, **kwargs):
+    search.index_books(getattr(instance, '_book_ids', []))
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=BookInstance)
+@receiver(post_delete, sender=BookInstance)
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+@receiver(post_save, sender=Language)
+@receiver(post_delete, sender=Language)
+def bump_catalog_version(sender, **kwargs):
+    CatalogVersion.bump()
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def bump_catalog_version_for_genres(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        CatalogVersion.bump()
+
+
+def author_ids_of(book_ids):
+    return set(Book.objects.filter(pk__in=[pk for pk in book_ids if pk is not None]).values_list('author_id', flat=True))
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_book_pages(sender, instance, **kwargs):
+    # the book's page, and its author's (and old author's) list of books
+    old = getattr(instance, '_old_state', None) or {}
+    fragments.invalidate_books([instance.pk])
+    fragments.invalidate_authors([instance.author_id, old.get('author_id')])
+
+
+@receiver(post_save, sender=BookInstance)
+@receiver(post_delete, sender=BookInstance)
+def invalidate_copy_pages(sender, instance, **kwargs):
+    # copies are listed on the book's page and counted on its author's
+    old = getattr(instance, '_old_state', None) or {}
+    book_ids = {instance.book_id, old.get('book_id')}
+    fragments.invalidate_books(book_ids)
+    fragments.invalidate_authors(author_ids_of(book_ids))
+
+
+@receiver(post_save, sender=Author)
+def invalidate_author_pages(sender, instance, created, **kwargs):
+    fragments.invalidate_authors([instance.pk])
+    if not created:
+        # the name is shown on each of their books' pages
+        fragments.invalidate_books(instance.book_set.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Author)
+def invalidate_deleted_author_pages(sender, instance, **kwargs):
+    fragments.invalidate_authors([instance.pk])
+    fragments.invalidate_books(getattr(instance, '_book_ids', []))
+
+
+@receiver(pre_delete, sender=Genre)
+@receiver(pre_delete, sender=Language)
+def remember_books(sender, instance, **kwargs):
+    # by post_delete the books no longer refer to the genre or language
+    instance._book_ids = list(instance.book_set.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_save, sender=Language)
+def invalidate_named_pages(sender, instance, created, **kwargs):
+    if not created:
+        fragments.invalidate_books(instance.book_set.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Genre)
+@receiver(post_delete, sender=Language)
+def invalidate_deleted_named_pages(sender, instance, **kwargs):
+    fragments.invalidate_books(getattr(instance, '_book_ids', []))
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def invalidate_genre_pages(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        # book.genre.add(...) and friends
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            fragments.invalidate_books([instance.pk])
+    elif action == 'pre_clear':
+        instance._book_ids = list(instance.book_set.values_list('id', flat=True))
+    elif action == 'post_clear':
+        fragments.invalidate_books(getattr(instance, '_book_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        # genre.book_set.add(...): pk_set holds the books
+        fragments.invalidate_books(pk_set)
+
+
+@receiver(post_save, sender=Book)
+@receiver(pre_delete, sender=Book)
+def invalidate_recommending_books(sender, instance, created=False, **kwargs):
+    # the book's title is listed on the pages of the books it is recommended on
+    if not created:
+        fragments.invalidate_books(RelatedBook.objects.filter(related=instance).values_list('book_id', flat=True))
+
+
+@receiver(post_save, sender=BookInstance)
+@receiver(post_delete, sender=BookInstance)
+def invalidate_borrowed_books(sender, instance, **kwargs):
+    # the list of loans of whoever borrows the copy now, and of whoever borrowed it before
+    old = getattr(instance, '_old_state', None) or {}
+    fragments.invalidate_borrowers([instance.borrower_id, old.get('borrower_id')])
+
+
+@receiver(post_save, sender=Book)
+@receiver(pre_delete, sender=Book)
+def invalidate_borrowers_of_book(sender, instance, created=False, **kwargs):
+    # the title is shown in the lists of loans of everyone borrowing a copy (and by
+    # post_delete the copies no longer point at the book)
+    if not created:
+        fragments.invalidate_borrowers(
+            instance.bookinstance_set.exclude(borrower=None).order_by().values_list('borrower_id', flat=True))
+
+
+def update_autocomplete(old_entries, new_entries):
+    # the index is this process's memory, which a rollback wouldn't put back
+    transaction.on_commit(lambda: autocomplete.update(old_entries, new_entries))
+
+
+@receiver(post_save, sender=Book)
+def autocomplete_saved_book(sender, instance, **kwargs):
+    old = getattr(instance, '_old_state', None)
+    update_autocomplete(autocomplete.book_entries(instance.pk, old['title']) if old else [],
+                        autocomplete.book_entries(instance.pk, instance.title))
+
+
+@receiver(post_delete, sender=Book)
+def autocomplete_deleted_book(sender, instance, **kwargs):
+    update_autocomplete(autocomplete.book_entries(instance.pk, instance.title), [])
+
+
+@receiver(post_save, sender=Author)
+def autocomplete_saved_author(sender, instance, **kwargs):
+    old = getattr(instance, '_old_state', None)
+    update_autocomplete(
+        autocomplete.author_entries(instance.pk, old['first_name'], old['last_name']) if old else [],
+        autocomplete.author_entries(instance.pk, instance.first_name, instance.last_name))
+
+
+@receiver(post_delete, sender=Author)
+def autocomplete_deleted_author(sender, instance, **kwargs):
+    update_autocomplete(autocomplete.author_entries(instance.pk, instance.first_name, instance.last_name), [])
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+@receiver(post_save, sender=Language)
+@receiver(post_delete, sender=Language)
+def invalidate_book_facets(sender, **kwargs):
+    facets.invalidate_books()
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def invalidate_genre_facets(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        facets.invalidate_books()
+
+
+@receiver(post_save, sender=BookInstance)
+@receiver(post_delete, sender=BookInstance)
+def invalidate_copy_facets(sender, **kwargs):
+    facets.invalidate_copies()
+
+
+@receiver(post_save, sender=BookInstance)
+def log_copy_circulation(sender, instance, **kwargs):
+    circulation.log_saved(instance)
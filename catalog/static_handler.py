@@ -0,0 +1,120 @@
+"""
+A WSGI wrapper serving the collected static files (STATIC_ROOT) before the
+request ever reaches Django, for deployments without a web server in front to
+do it. djmdn2/wsgi.py wraps the Django application in it.
+
+For each file it sends the smallest copy the browser accepts, going by
+Accept-Encoding: the .br or .gz file collectstatic wrote next to it (see
+catalog.assets), or the file itself. Responses carry Vary: Accept-Encoding, an
+ETag and Last-Modified, and conditional requests get 304 Not Modified. Files
+with a content hash in their name never change, so they may be cached for a
+year ("immutable"); anything else, e.g. a file linked without {% static %},
+only for a short while.
+
+Paths outside STATIC_URL, files that don't exist and requests other than GET
+and HEAD are passed on to the application.
+"""
+import mimetypes
+import os
+import re
+from email.utils import formatdate, parsedate_tz, mktime_tz
+from wsgiref.util import FileWrapper
+
+# ManifestStaticFilesStorage's names: style.3f1a9c2b7d4e.css
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^/.]+$')
+
+HASHED_MAX_AGE = 365 * 24 * 60 * 60
+UNHASHED_MAX_AGE = 60
+
+# the encodings we have precompressed copies for, best first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+BLOCK_SIZE = 64 * 1024
+
+
+def accepted_encodings(header):
+    """
+    The encodings an Accept-Encoding header allows (those not given q=0)
+    """
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding and quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class PrecompressedStaticFiles:
+
+    def __init__(self, application, root, prefix):
+        self.application = application
+        self.root = os.path.realpath(root) if root else None
+        self.prefix = prefix
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if (self.root is None or not path.startswith(self.prefix)
+                or environ['REQUEST_METHOD'] not in ('GET', 'HEAD')):
+            return self.application(environ, start_response)
+        filename = self.find(path[len(self.prefix):])
+        if filename is None:
+            return self.application(environ, start_response)
+        return self.serve(environ, start_response, filename)
+
+    def find(self, name):
+        """
+        The file under root the URL path names, or None (for anything that
+        would resolve outside root, too)
+        """
+        filename = os.path.realpath(os.path.join(self.root, name))
+        if not filename.startswith(self.root + os.sep) or not os.path.isfile(filename):
+            return None
+        return filename
+
+    def serve(self, environ, start_response, filename):
+        content_type, _ = mimetypes.guess_type(filename)
+        accepted = accepted_encodings(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        encoding, served = None, filename
+        for coding, suffix in ENCODINGS:
+            if (coding in accepted or '*' in accepted) and os.path.isfile(filename + suffix):
+                encoding, served = coding, filename + suffix
+                break
+        stat = os.stat(served)
+        etag = '"%x-%x%s"' % (int(stat.st_mtime), stat.st_size, '-' + encoding if encoding else '')
+        max_age = HASHED_MAX_AGE if HASHED_NAME.search(filename) else UNHASHED_MAX_AGE
+        headers = [
+            ('Vary', 'Accept-Encoding'),
+            ('ETag', etag),
+            ('Last-Modified', formatdate(stat.st_mtime, usegmt=True)),
+            ('Cache-Control', 'public, max-age=%d%s' % (max_age, ', immutable' if max_age == HASHED_MAX_AGE else '')),
+        ]
+        if self.not_modified(environ, etag, stat.st_mtime):
+            start_response('304 Not Modified', headers)
+            return []
+        headers += [('Content-Type', content_type or 'application/octet-stream'),
+                    ('Content-Length', str(stat.st_size))]
+        if encoding:
+            headers.append(('Content-Encoding', encoding))
+        start_response('200 OK', headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+        file_wrapper = environ.get('wsgi.file_wrapper', FileWrapper)
+        return file_wrapper(open(served, 'rb'), BLOCK_SIZE)
+
+    def not_modified(self, environ, etag, mtime):
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            return if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
+        if_modified_since = environ.get('HTTP_IF_MODIFIED_SINCE')
+        if if_modified_since:
+            parsed = parsedate_tz(if_modified_since)
+            return parsed is not None and int(mtime) <= mktime_tz(parsed)
+        return False
@@ -0,0 +1,85 @@
+from django import template
+from django.utils.html import format_html
+
+from catalog import assets, fragments
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def url_replace(context, **kwargs):
+    """
+    The current query string with some parameters replaced, e.g. {% url_replace page=3 %}
+    (parameters set to None are removed), so links keep the rest of the query
+    """
+    query = context['request'].GET.copy()
+    for key, value in kwargs.items():
+        if value is None:
+            query.pop(key, None)
+        else:
+            query[key] = value
+    return query.urlencode()
+
+
+@register.simple_tag(takes_context=True)
+def url_replace_facet(context, dimension, value):
+    """
+    The current query string with one facet filter set to value (or removed,
+    for None), back at the first page, e.g. {% url_replace_facet 'genre' genre.pk %}
+    """
+    query = context['request'].GET.copy()
+    for key in (dimension, 'cursor', 'page'):
+        query.pop(key, None)
+    if value is not None:
+        query[dimension] = value
+    return query.urlencode()
+
+
+@register.simple_tag
+def vendored(path):
+    """
+    The URL of a third-party static file, e.g. {% vendored 'vendor/jquery/1.12.4/jquery.min.js' %}:
+    our own copy once `manage.py vendor_static` has fetched it, the CDN until then
+    """
+    return assets.vendored_url(path)
+
+
+@register.simple_tag
+def vendored_integrity(path):
+    """
+    The integrity and crossorigin attributes for a {% vendored %} tag that falls
+    back to the CDN, so the browser checks the file against its pinned hash
+    """
+    sri = assets.vendored_integrity(path)
+    return format_html(' integrity="{}" crossorigin="anonymous"', sri) if sri else ''
+
+
+class CacheFragmentNode(template.Node):
+
+    def __init__(self, nodelist, kind, pk, vary_on):
+        self.nodelist = nodelist
+        self.kind = kind
+        self.pk = pk
+        self.vary_on = vary_on
+
+    def render(self, context):
+        vary_on = [value.resolve(context) for value in self.vary_on]
+        return fragments.get_or_render(self.kind.resolve(context), self.pk.resolve(context),
+                                       lambda: self.nodelist.render(context), vary_on)
+
+
+@register.tag
+def cachefragment(parser, token):
+    """
+    Caches the enclosed part of a book or author page until something shown on
+    that page changes (see catalog.fragments), e.g.
+    {% cachefragment "author" author.pk page_obj.number %}...{% endcachefragment %}
+    Values after the primary key are for pages that have several variants.
+    """
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError("'%s' takes at least two arguments (kind and primary key)" % bits[0])
+    nodelist = parser.parse(('endcachefragment',))
+    parser.delete_first_token()
+    kind, pk = parser.compile_filter(bits[1]), parser.compile_filter(bits[2])
+    return CacheFragmentNode(nodelist, kind, pk, [parser.compile_filter(bit) for bit in bits[3:]])
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class CatalogTestRunner(DiscoverRunner):
+    """
+    Runs the tests with the settings they need in place of the production ones:
+    a fragment cache that never holds anything, so rows reusing an id can't see
+    another test's pages (tests of the cache itself switch to locmem), static
+    files linked by their plain names as nothing is collected, and views over
+    their query budget failing the test
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.test_settings = override_settings(
+            CACHES=dict(settings.CACHES, catalog={'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}),
+            STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+            CATALOG_SQL_INSTRUMENTATION=dict(getattr(settings, 'CATALOG_SQL_INSTRUMENTATION', {}), RAISE=True),
+        )
+        self.test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.test_settings.disable()
+        super().teardown_test_environment(**kwargs)
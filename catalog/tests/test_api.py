@@ -0,0 +1,128 @@
+from django.test import TestCase
+
+import datetime
+from django.core.urlresolvers import reverse
+
+from catalog.models import Author, Book, BookAvailability, BookInstance, CatalogVersion, Genre, Language
+
+class CatalogApiTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='John', last_name='Tolkien', date_of_birth=datetime.date(1892, 1, 3))
+        english = Language.objects.create(name='English')
+        cls.fantasy = Genre.objects.create(name='Fantasy')
+        adventure = Genre.objects.create(name='Adventure')
+        cls.books = []
+        for n in range(5):
+            book = Book.objects.create(title='Book %s' % n, summary='Summary', isbn='123', author=cls.author,
+                language=english)
+            book.genre.set([cls.fantasy, adventure] if n % 2 else [cls.fantasy])
+            BookInstance.objects.create(book=book, imprint='Imprint', status='o', due_back=datetime.date(2020, 1, n + 1))
+            BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+            cls.books.append(book)
+        cls.orphan = Book.objects.create(title='No author', summary='', isbn='')
+
+    def get(self, name, *args, **params):
+        return self.client.get(reverse(name, args=args), params)
+
+    def test_book_list_pages_by_id(self):
+        response = self.get('api-books', limit=4)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        data = response.json()
+        self.assertEqual([b['title'] for b in data['results']], ['Book 0', 'Book 1', 'Book 2', 'Book 3'])
+        self.assertEqual(data['results'][1]['genres'], ['Adventure', 'Fantasy'])
+        self.assertEqual(data['results'][0]['author']['last_name'], 'Tolkien')
+        self.assertEqual(data['results'][0]['language'], 'English')
+
+        data = self.client.get(data['next']).json()
+        self.assertEqual([b['title'] for b in data['results']], ['Book 4', 'No author'])
+        self.assertIsNone(data['results'][1]['author'])
+        self.assertIsNone(data['next'])
+
+    def test_book_list_filters(self):
+        data = self.get('api-books', author=self.author.pk).json()
+        self.assertEqual(len(data['results']), 5)
+        self.assertEqual(self.get('api-books', author='x').status_code, 400)
+
+    def test_list_query_count_does_not_grow_with_page_size(self):
+        # version, books, genres
+        with self.assertNumQueries(3):
+            self.get('api-books', limit=2)
+        with self.assertNumQueries(3):
+            self.get('api-books', limit=200)
+
+    def test_book_detail(self):
+        book = self.books[1]
+        data = self.get('api-book-detail', book.pk).json()
+        self.assertEqual(data['summary'], 'Summary')
+        self.assertEqual([(c['status'], c['due_back']) for c in data['copies']], [('a', None), ('o', '2020-01-02')])
+        self.assertEqual(self.get('api-book-detail', 9999).status_code, 404)
+
+    def test_authors_and_copies(self):
+        data = self.get('api-authors').json()
+        self.assertEqual(data['results'][0]['date_of_birth'], '1892-01-03')
+        data = self.get('api-author-detail', self.author.pk).json()
+        self.assertEqual(len(data['books']), 5)
+
+        data = self.get('api-copies', status='o', limit=3).json()
+        self.assertEqual(len(data['results']), 3)
+        data = self.client.get(data['next']).json()
+        self.assertEqual(len(data['results']), 2)
+        self.assertEqual(self.get('api-copies', status='?').status_code, 400)
+
+        copy = BookInstance.objects.filter(book=self.books[0]).first()
+        self.assertEqual(self.get('api-copy-detail', copy.pk).json()['imprint'], 'Imprint')
+        self.assertEqual(self.get('api-copy-detail', 'not-a-uuid').status_code, 404)
+
+    def test_availability(self):
+        data = self.get('api-availability').json()
+        self.assertEqual(len(data['results']), 6)
+        self.assertEqual(data['results'][5]['copies'], 0)
+        first = data['results'][0]
+        self.assertEqual((first['book_id'], first['copies'], first['available'], first['on_loan']), (self.books[0].pk, 2, 1, 1))
+        self.assertEqual(first['next_due'], '2020-01-01')
+
+        data = self.get('api-availability-detail', self.books[2].pk).json()
+        self.assertEqual(data['by_status'], {'a': 1, 'o': 1})
+        self.assertEqual(data['next_due'], '2020-01-03')
+        data = self.get('api-availability-detail', self.orphan.pk).json()
+        self.assertEqual((data['copies'], data['next_due']), (0, None))
+
+    def test_availability_reads_the_summary(self):
+        # version, book with its summary, next due date
+        with self.assertNumQueries(3):
+            self.get('api-availability-detail', self.books[0].pk)
+        BookAvailability.objects.filter(book=self.books[0]).update(copies=3, reserved=1)
+        data = self.get('api-availability-detail', self.books[0].pk).json()
+        self.assertEqual((data['copies'], data['by_status']), (3, {'a': 1, 'o': 1, 'r': 1}))
+        self.assertEqual(self.get('api-availability').json()['results'][0]['copies'], 3)
+
+    def test_conditional_get(self):
+        url = reverse('api-books')
+        response = self.client.get(url)
+        self.assertTrue(response.has_header('ETag'))
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        # a repeat poll is answered from the version row alone
+        with self.assertNumQueries(1):
+            repeat = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(repeat.status_code, 304)
+        self.assertEqual(repeat.content, b'')
+        repeat = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(repeat.status_code, 304)
+
+        # any change to the catalog makes the old validators stale
+        BookInstance.objects.filter(book=self.books[0], status='a').first().delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_version_follows_changes(self):
+        version = CatalogVersion.load().version
+        self.books[0].genre.remove(self.fantasy)
+        self.assertEqual(CatalogVersion.load().version, version + 1)
+        self.author.first_name = 'J. R. R.'
+        self.author.save()
+        self.assertEqual(CatalogVersion.load().version, version + 2)
+
+    def test_read_only(self):
+        self.assertEqual(self.client.post(reverse('api-books')).status_code, 405)
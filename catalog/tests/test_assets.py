@@ -0,0 +1,197 @@
+from django.test import SimpleTestCase
+
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock, skipIf
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import override_settings
+from django.utils.six import StringIO
+
+from catalog import assets, checks
+from catalog.templatetags.catalog_extras import vendored_integrity
+from catalog.static_handler import PrecompressedStaticFiles, accepted_encodings
+
+STYLE = b'body { background: url("../img/logo.png"); }\n' + b'.row { margin: 0 auto; }\n' * 40
+
+
+class AssetsTestMixin:
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def write(self, path, content):
+        path = os.path.join(self.dir, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+
+
+class CollectStaticTest(AssetsTestMixin, SimpleTestCase):
+
+    def test_hashed_names_and_compressed_copies(self):
+        self.write('source/css/style.css', STYLE)
+        self.write('source/img/logo.png', b'\x89PNG' + b'\x00' * 1000)
+        self.write('source/js/tiny.js', b'var x;')
+        root = os.path.join(self.dir, 'root')
+        with override_settings(STATIC_ROOT=root, STATICFILES_DIRS=[os.path.join(self.dir, 'source')],
+                               STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+                               STATICFILES_STORAGE='catalog.assets.CompressedManifestStaticFilesStorage'):
+            call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(root, 'staticfiles.json')) as manifest:
+            paths = json.load(manifest)['paths']
+        css, png = paths['css/style.css'], paths['img/logo.png']
+        self.assertRegex(css, r'^css/style\.[0-9a-f]{12}\.css$')
+        with gzip.open(os.path.join(root, css + '.gz')) as compressed:
+            content = compressed.read()
+        # the copy has the url() rewritten to the hashed image name, like the original
+        self.assertIn(png.split('/')[-1].encode(), content)
+        with open(os.path.join(root, css), 'rb') as original:
+            self.assertEqual(content, original.read())
+        # images are compressed already, and tiny files aren't worth it
+        self.assertFalse(os.path.exists(os.path.join(root, png + '.gz')))
+        self.assertFalse(os.path.exists(os.path.join(root, paths['js/tiny.js'] + '.gz')))
+        self.assertEqual(os.path.exists(os.path.join(root, css + '.br')), assets.brotli is not None)
+
+    def test_gzip_is_reproducible(self):
+        self.assertEqual(assets.gzip_compress(STYLE), assets.gzip_compress(STYLE))
+
+
+class StaticHandlerTest(AssetsTestMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write('root/css/style.0123456789ab.css', STYLE)
+        self.write('root/css/style.0123456789ab.css.gz', assets.gzip_compress(STYLE))
+        self.write('root/css/style.css', STYLE)
+        self.write('secret.txt', b'secret')
+        self.app = PrecompressedStaticFiles(self.django, os.path.join(self.dir, 'root'), '/static/')
+
+    def django(self, environ, start_response):
+        start_response('404 Not Found', [('Content-Type', 'text/plain')])
+        return [b'from django']
+
+    def get(self, path, method='GET', **headers):
+        environ = {'REQUEST_METHOD': method, 'PATH_INFO': path}
+        environ.update(('HTTP_' + name.upper(), value) for name, value in headers.items())
+        response = {}
+
+        def start_response(status, headers):
+            response.update(status=status, headers=dict(headers))
+        body = b''.join(self.app(environ, start_response))
+        return response['status'], response['headers'], body
+
+    def test_sends_the_compressed_copy_when_accepted(self):
+        status, headers, body = self.get('/static/css/style.0123456789ab.css', accept_encoding='gzip, deflate')
+        self.assertEqual((status, headers['Content-Encoding'], headers['Content-Type']), ('200 OK', 'gzip', 'text/css'))
+        self.assertEqual(gzip.decompress(body), STYLE)
+        self.assertEqual(headers['Content-Length'], str(len(body)))
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(headers['Cache-Control'], 'public, max-age=31536000, immutable')
+
+        status, headers, body = self.get('/static/css/style.0123456789ab.css', accept_encoding='gzip;q=0')
+        self.assertNotIn('Content-Encoding', headers)
+        self.assertEqual(body, STYLE)
+
+    def test_prefers_brotli(self):
+        self.write('root/css/style.0123456789ab.css.br', b'brotli bytes')
+        status, headers, body = self.get('/static/css/style.0123456789ab.css', accept_encoding='gzip, br')
+        self.assertEqual((headers['Content-Encoding'], body), ('br', b'brotli bytes'))
+
+    def test_unhashed_names_are_cached_briefly(self):
+        status, headers, body = self.get('/static/css/style.css')
+        self.assertEqual(headers['Cache-Control'], 'public, max-age=60')
+
+    def test_conditional_requests(self):
+        status, headers, body = self.get('/static/css/style.0123456789ab.css', accept_encoding='gzip')
+        status, headers, body = self.get('/static/css/style.0123456789ab.css', accept_encoding='gzip',
+            if_none_match=headers['ETag'])
+        self.assertEqual((status, body), ('304 Not Modified', b''))
+        # the plain file's etag isn't the compressed copy's
+        status, headers, body = self.get('/static/css/style.0123456789ab.css', if_none_match=headers['ETag'])
+        self.assertEqual(status, '200 OK')
+        status, headers, body = self.get('/static/css/style.css', if_modified_since=headers['Last-Modified'])
+        self.assertEqual(status, '304 Not Modified')
+
+    def test_head(self):
+        status, headers, body = self.get('/static/css/style.css', method='HEAD')
+        self.assertEqual((status, headers['Content-Length'], body), ('200 OK', str(len(STYLE)), b''))
+
+    def test_everything_else_goes_to_django(self):
+        for path, method in [('/static/css/missing.css', 'GET'), ('/static/../secret.txt', 'GET'),
+                             ('/static/css/', 'GET'), ('/catalog/', 'GET'), ('/static/css/style.css', 'POST')]:
+            self.assertEqual(self.get(path, method)[2], b'from django')
+
+    def test_accepted_encodings(self):
+        self.assertEqual(accepted_encodings('gzip, deflate, br'), {'gzip', 'deflate', 'br'})
+        self.assertEqual(accepted_encodings('br;q=0, gzip;q=0.5, identity'), {'gzip', 'identity'})
+        self.assertEqual(accepted_encodings(''), set())
+
+
+class VendorStaticTest(AssetsTestMixin, SimpleTestCase):
+
+    def test_copies_from_a_mirror_checking_hashes(self):
+        content = b'/*! jQuery */'
+        self.write('mirror/vendor/jquery.min.js', content)
+        destination = os.path.join(self.dir, 'static')
+        pinned = [('vendor/jquery.min.js', 'https://example.com/jquery.min.js', assets.integrity(content))]
+        with mock.patch('catalog.management.commands.vendor_static.VENDOR_ASSETS', pinned), \
+                mock.patch('catalog.management.commands.vendor_static.STATIC_DIR', destination):
+            call_command('vendor_static', source=os.path.join(self.dir, 'mirror'), stdout=StringIO())
+            with open(os.path.join(destination, 'vendor/jquery.min.js'), 'rb') as vendored:
+                self.assertEqual(vendored.read(), content)
+
+            self.write('mirror/vendor/jquery.min.js', b'tampered')
+            with self.assertRaisesMessage(CommandError, 'does not match its pinned hash'):
+                call_command('vendor_static', source=os.path.join(self.dir, 'mirror'), force=True, stdout=StringIO())
+
+    def test_prints_the_hash_to_pin(self):
+        self.write('mirror/vendor/font.woff', b'wOFF')
+        out = StringIO()
+        with mock.patch('catalog.management.commands.vendor_static.VENDOR_ASSETS',
+                        [('vendor/font.woff', 'https://example.com/font.woff', None)]), \
+                mock.patch('catalog.management.commands.vendor_static.STATIC_DIR', os.path.join(self.dir, 'static')):
+            with self.assertRaisesMessage(CommandError, 'has no pinned hash'):
+                call_command('vendor_static', source=os.path.join(self.dir, 'mirror'), stdout=StringIO())
+            self.assertFalse(os.path.exists(os.path.join(self.dir, 'static/vendor/font.woff')))
+            call_command('vendor_static', source=os.path.join(self.dir, 'mirror'), no_verify=True, stdout=out)
+        self.assertIn('pin %s in VENDOR_ASSETS' % assets.integrity(b'wOFF'), out.getvalue())
+
+    def test_checks(self):
+        content = b'/*! jQuery */'
+        pinned = [('vendor/jquery.min.js', 'https://example.com/jquery.min.js', assets.integrity(content)),
+                  ('vendor/font.woff', 'https://example.com/font.woff', None)]
+        with mock.patch('catalog.checks.VENDOR_ASSETS', pinned), \
+                override_settings(STATICFILES_DIRS=[os.path.join(self.dir, 'static')]):
+            self.assertEqual([error.id for error in checks.check_vendored_files(None)], ['catalog.W001'])
+            self.assertEqual([error.id for error in checks.check_vendored_files_for_deploy(None)],
+                             ['catalog.E001', 'catalog.E003'])
+            self.write('static/vendor/jquery.min.js', content)
+            self.write('static/vendor/font.woff', b'wOFF')
+            self.assertEqual(checks.check_vendored_files(None), [])
+            self.assertEqual([error.id for error in checks.check_vendored_files_for_deploy(None)], ['catalog.E003'])
+            self.write('static/vendor/jquery.min.js', b'tampered')
+            self.assertEqual([error.id for error in checks.check_vendored_files(None)], ['catalog.E002'])
+
+    @skipIf(all(os.path.exists(os.path.join(os.path.dirname(assets.__file__), 'static', path))
+                for path, url, sri in assets.VENDOR_ASSETS), 'the files are vendored')
+    def test_falls_back_to_the_cdn(self):
+        self.assertEqual(assets.vendored_url('vendor/jquery/1.12.4/jquery.min.js'),
+            'https://code.jquery.com/jquery-1.12.4.min.js')
+        # which the browser checks against the pinned hash
+        self.assertEqual(vendored_integrity('vendor/jquery/1.12.4/jquery.min.js'),
+            ' integrity="sha256-ZosEbRLbNQzLpnKIkEdrPv7lOy9C27hHQ+Xp8a4MxAQ=" crossorigin="anonymous"')
+
+    def test_own_copies_are_not_checked(self):
+        self.write('static/vendor/jquery/1.12.4/jquery.min.js', b'/*! jQuery */')
+        assets.is_vendored.cache_clear()
+        self.addCleanup(assets.is_vendored.cache_clear)
+        with override_settings(STATICFILES_DIRS=[os.path.join(self.dir, 'static')]):
+            self.assertEqual(assets.vendored_url('vendor/jquery/1.12.4/jquery.min.js'),
+                             '/static/vendor/jquery/1.12.4/jquery.min.js')
+            self.assertEqual(vendored_integrity('vendor/jquery/1.12.4/jquery.min.js'), '')
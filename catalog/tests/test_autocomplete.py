@@ -0,0 +1,127 @@
+from django.test import SimpleTestCase, TransactionTestCase
+
+from django.core.urlresolvers import reverse
+from django.db import transaction
+
+from catalog import autocomplete
+from catalog.models import Author, Book
+
+
+class PrefixIndexTest(SimpleTestCase):
+
+    def index(self, max_bytes=autocomplete.DEFAULT_MAX_BYTES):
+        entries = (autocomplete.book_entries(1, 'The Hobbit') + autocomplete.book_entries(2, 'Hobbies for Everyone')
+                   + autocomplete.book_entries(3, 'Les Misérables')
+                   + autocomplete.author_entries(4, 'Frank', 'Herbert'))
+        return autocomplete.PrefixIndex(entries, max_bytes)
+
+    def test_normalize(self):
+        self.assertEqual(autocomplete.normalize('  Les Misérables: Vol. 1 '), 'les miserables vol 1')
+        self.assertEqual(len(autocomplete.normalize('x' * 100)), autocomplete.KEY_LENGTH)
+
+    def test_lookup(self):
+        index = self.index()
+        self.assertEqual(index.lookup('hobb'), [('b', 2, 'Hobbies for Everyone'), ('b', 1, 'The Hobbit')])
+        self.assertEqual(index.lookup('THE HOB'), [('b', 1, 'The Hobbit')])
+        self.assertEqual(index.lookup('misera'), [])
+        self.assertEqual(index.lookup('les misé'), [('b', 3, 'Les Misérables')])
+        # an author is listed once, however many of their names match
+        self.assertEqual(index.lookup('h', limit=10).count(('a', 4, 'Herbert, Frank')), 1)
+        self.assertEqual(index.lookup('frank h'), [('a', 4, 'Herbert, Frank')])
+        self.assertEqual(len(index.lookup('h', limit=2)), 2)
+        self.assertEqual(index.lookup(' ?! '), [])
+
+    def test_add_and_remove(self):
+        index = self.index()
+        index.remove(autocomplete.book_entries(1, 'The Hobbit'))
+        index.add(autocomplete.book_entries(1, 'The Hobbit, or There and Back Again'))
+        self.assertEqual(index.lookup('hobbit'), [('b', 1, 'The Hobbit, or There and Back Again')])
+        many = ['title %03d\0Title %03d\0b%d' % (n, n, n + 10) for n in range(autocomplete.INSERT_LIMIT + 1)]
+        index.add(many)
+        self.assertEqual(index.entries, sorted(index.entries))
+        self.assertEqual(index.lookup('title 05', 20), [('b', n + 10, 'Title %03d' % n) for n in range(50, 60)])
+
+    def test_memory_cap(self):
+        full = self.index()
+        max_bytes = dict(full.sizes, b=full.sizes['b'] - 1)
+        with self.assertLogs('catalog.autocomplete', 'WARNING') as logs:
+            index = self.index(max_bytes=max_bytes)
+        self.assertIn('left out 1', logs.output[0])
+        self.assertEqual((len(index), index.dropped), (len(full) - 1, {'b': 1, 'a': 0}))
+        self.assertLessEqual(index.sizes['b'], max_bytes['b'])
+        with self.assertLogs('catalog.autocomplete', 'WARNING'):
+            index.add(autocomplete.book_entries(5, 'Dune ' * 30))
+        self.assertEqual(index.lookup('dune'), [])
+
+    def test_titles_do_not_crowd_out_names(self):
+        # titles come first when the index is built, and fill their cap
+        with self.assertLogs('catalog.autocomplete', 'WARNING'):
+            index = self.index(max_bytes={'b': 0, 'a': autocomplete.DEFAULT_MAX_NAME_BYTES})
+        self.assertEqual(index.lookup('h'), [('a', 4, 'Herbert, Frank')])
+        index.add(autocomplete.author_entries(5, 'John', 'Tolkien'))
+        self.assertEqual(index.lookup('tolk'), [('a', 5, 'Tolkien, John')])
+
+
+class AutocompleteViewTest(TransactionTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='John', last_name='Tolkien')
+        cls.book = Book.objects.create(title='The Hobbit', summary='', isbn='', author=cls.author)
+
+    def setUp(self):
+        # real transactions, since the index only changes when a change commits
+        self.setUpTestData()
+        autocomplete.reset_index()
+        self.addCleanup(autocomplete.reset_index)
+
+    def suggest(self, q, **params):
+        return self.client.get(reverse('api-autocomplete'), dict(params, q=q)).json()['results']
+
+    def test_suggestions_come_from_memory(self):
+        # one query to build the index, then none
+        with self.assertNumQueries(1):
+            results = self.suggest('hob')
+        self.assertEqual(results, [{'type': 'book', 'id': self.book.pk, 'label': 'The Hobbit',
+                                    'url': self.book.get_absolute_url()}])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest('tolk')[0]['label'], 'Tolkien, John')
+
+    def test_signals_keep_the_index_up_to_date(self):
+        self.suggest('hob')
+        book = Book.objects.get(pk=self.book.pk)
+        book.title = 'Farmer Giles of Ham'
+        book.save()
+        self.assertEqual(self.suggest('hob'), [])
+        self.assertEqual(self.suggest('farmer')[0]['id'], self.book.pk)
+        author = Author.objects.get(pk=self.author.pk)
+        author.last_name = 'Tolkien, J. R. R.'
+        author.save()
+        self.assertEqual(self.suggest('tolk')[0]['label'], 'Tolkien, J. R. R., John')
+        Book.objects.create(title='Dune', summary='', isbn='')
+        self.assertEqual(len(self.suggest('dun')), 1)
+        book.delete()
+        self.assertEqual(self.suggest('farmer'), [])
+
+    def test_rolled_back_changes_leave_the_index_alone(self):
+        self.suggest('hob')
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                Book.objects.create(title='Dune', summary='', isbn='')
+                book = Book.objects.get(pk=self.book.pk)
+                book.title = 'Farmer Giles of Ham'
+                book.save()
+                Author.objects.get(pk=self.author.pk).delete()
+                raise RuntimeError('the form failed')
+        self.assertEqual(self.suggest('dun'), [])
+        self.assertEqual(self.suggest('farmer'), [])
+        self.assertEqual(self.suggest('hob')[0]['id'], self.book.pk)
+        self.assertEqual(self.suggest('tolk')[0]['label'], 'Tolkien, John')
+
+    def test_limit(self):
+        for n in range(30):
+            Book.objects.create(title='Hobbit %02d' % n, summary='', isbn='')
+        self.assertEqual(len(self.suggest('hob')), 10)
+        self.assertEqual(len(self.suggest('hob', limit=100)), 25)
+        resp = self.client.get(reverse('api-autocomplete'), {'q': 'hob', 'limit': 'many'})
+        self.assertEqual(resp.status_code, 400)
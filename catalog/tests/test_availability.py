@@ -0,0 +1,88 @@
+from django.test import TestCase
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.urlresolvers import reverse
+from django.utils.six import StringIO
+
+from catalog import loans
+from catalog.models import Author, Book, BookAvailability, BookInstance
+
+class BookAvailabilityTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='John', last_name='Tolkien')
+        cls.hobbit = Book.objects.create(title='The Hobbit', summary='', isbn='', author=cls.author)
+        cls.dune = Book.objects.create(title='Dune', summary='', isbn='', author=cls.author)
+
+    def add_copy(self, book, status):
+        return BookInstance.objects.create(book=book, imprint='Imprint', status=status)
+
+    def counts(self, book):
+        counts = BookAvailability.objects.get(book=book).counts()
+        return {name: number for name, number in counts.items() if number}
+
+    def assertConsistent(self):
+        book_ids = list(Book.objects.values_list('pk', flat=True))
+        self.assertEqual(BookAvailability.inconsistencies(book_ids), [])
+
+    def test_follows_copy_changes(self):
+        copy = self.add_copy(self.hobbit, 'a')
+        self.add_copy(self.hobbit, 'm')
+        self.assertEqual(self.counts(self.hobbit), {'copies': 2, 'available': 1, 'maintenance': 1})
+
+        copy.status = 'o'
+        copy.save()
+        self.assertEqual(self.counts(self.hobbit), {'copies': 2, 'on_loan': 1, 'maintenance': 1})
+
+        # moving a copy to another book
+        copy.book = self.dune
+        copy.save()
+        self.assertEqual(self.counts(self.hobbit), {'copies': 1, 'maintenance': 1})
+        self.assertEqual(self.counts(self.dune), {'copies': 1, 'on_loan': 1})
+
+        copy.delete()
+        self.assertEqual(self.counts(self.dune), {})
+        self.assertConsistent()
+
+    def test_bulk_returns_are_counted(self):
+        on_loan = [self.add_copy(self.hobbit, 'o'), self.add_copy(self.dune, 'o')]
+        loans.mark_returned([str(copy.pk) for copy in on_loan])
+        self.assertEqual(self.counts(self.hobbit), {'copies': 1, 'available': 1})
+        self.assertConsistent()
+
+    def test_deleting_a_book_drops_its_row(self):
+        self.add_copy(self.hobbit, 'a')
+        Book.objects.get(pk=self.hobbit.pk).delete()
+        self.assertFalse(BookAvailability.objects.filter(book_id=self.hobbit.pk).exists())
+
+    def test_check_and_repair_command(self):
+        self.add_copy(self.hobbit, 'a')
+        self.add_copy(self.dune, 'o')
+        out = StringIO()
+        call_command('check_book_availability', stdout=out)
+        self.assertIn('Checked 2 books, 0 with wrong', out.getvalue())
+
+        # copies changed behind the summary's back
+        BookInstance.objects.filter(book=self.hobbit).update(status='o')
+        BookAvailability.objects.filter(book=self.dune).delete()
+        with self.assertRaisesMessage(CommandError, '2 books have wrong availability counts'):
+            call_command('check_book_availability', stdout=out)
+        call_command('check_book_availability', '--repair', stdout=out)
+        self.assertIn('Recounted 2 books', out.getvalue())
+        self.assertEqual(self.counts(self.hobbit), {'copies': 1, 'on_loan': 1})
+        self.assertConsistent()
+
+    def test_book_list_shows_availability_without_a_query_per_book(self):
+        self.add_copy(self.hobbit, 'a')
+        self.add_copy(self.hobbit, 'o')
+        # count and the page (with authors and availability), and the facet counts
+        with self.assertNumQueries(5):
+            resp = self.client.get(reverse('books'))
+        self.assertContains(resp, '1 of 2 available')
+        self.assertContains(resp, 'no copies')
+        for n in range(10):
+            self.add_copy(Book.objects.create(title='Book %s' % n, summary='', isbn='', author=self.author), 'a')
+        with self.assertNumQueries(5):
+            self.client.get(reverse('books'))
@@ -0,0 +1,41 @@
+from django.test import TestCase
+
+from django.test import override_settings
+from django.utils.six import StringIO
+
+from catalog import urls
+from catalog.benchmarks import compare_results, endpoints, seed_catalog
+from catalog.visits import reset_visit_buffer
+
+@override_settings(CATALOG_VISIT_BUFFER={'FLUSH_EVERY': 100, 'FLUSH_INTERVAL': None})
+class EndpointBenchmarkTest(TestCase):
+    
+    def tearDown(self):
+        reset_visit_buffer()
+        
+    def test_covers_every_url_against_a_small_catalog(self):
+        seed_catalog(books=30, copies_per_book=3, borrowers=5)
+        book, author, loan, borrower = endpoints.sample_objects()
+        covered = {entry[1] for entry in endpoints.endpoints(book, author, loan)}
+        self.assertEqual({pattern.name for pattern in urls.urlpatterns} - covered, set())
+        
+        out = StringIO()
+        results = endpoints.run(out, {'repeat': 1})
+        for label, result in results.items():
+            self.assertIn(result['status'], (200, 302), label)
+            self.assertGreater(result['queries'], 0, label)
+        self.assertEqual(results['renew-book-librarian POST']['status'], 302)
+        
+    def test_compare_results(self):
+        baseline = {'results': {
+            'fast': {'median': 10.0, 'p95': 12.0, 'queries': 3, 'status': 200},
+            'gone': {'median': 1.0, 'p95': 1.0, 'queries': 1, 'status': 200},
+        }}
+        same = {'fast': {'median': 11.0, 'p95': 12.5, 'queries': 3, 'status': 200}}
+        self.assertEqual(compare_results(same, baseline), ['gone: missing from this run'])
+        slower = {'fast': {'median': 20.0, 'p95': 12.0, 'queries': 4, 'status': 500},
+                  'gone': {'median': 1.5, 'p95': 1.5, 'queries': 1, 'status': 200}}
+        regressions = compare_results(slower, baseline)
+        self.assertEqual(len(regressions), 3)
+        self.assertTrue(regressions[0].startswith('fast: median 20.00 ms'))
+        self.assertEqual(regressions[1:], ['fast: 4 queries, baseline 3', 'fast: status 500, baseline 200'])
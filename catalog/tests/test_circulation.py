@@ -0,0 +1,141 @@
+from django.test import TestCase
+
+import datetime
+from django.contrib.auth.models import Permission, User
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from catalog import circulation, holds, loans
+from catalog.models import (Book, BookInstance, DailyBookLoans, DailyGenreLoans, DailyLoans, Genre, LoanEvent,
+                            LoanRollupMark)
+
+
+class CirculationTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fantasy = Genre.objects.create(name='Fantasy')
+        cls.epic = Genre.objects.create(name='Epic')
+        cls.hobbit = Book.objects.create(title='The Hobbit', summary='', isbn='')
+        cls.hobbit.genre.set([cls.fantasy])
+        cls.lotr = Book.objects.create(title='The Lord of the Rings', summary='', isbn='')
+        cls.lotr.genre.set([cls.fantasy, cls.epic])
+        cls.alice = User.objects.create_user(username='alice', password='12345')
+        cls.bob = User.objects.create_user(username='bob', password='12345')
+        cls.librarian = User.objects.create_user(username='librarian', password='12345')
+        cls.librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+        cls.due = datetime.date.today() + datetime.timedelta(weeks=3)
+
+    def lend(self, book, borrower):
+        return BookInstance.objects.create(book=book, imprint='Imprint', status='o', borrower=borrower, due_back=self.due)
+
+    def events(self):
+        return list(LoanEvent.objects.values_list('kind', 'borrower_id', 'status'))
+
+    def rollup(self):
+        # everything logged so far has settled
+        return circulation.rollup(now=timezone.now() + circulation.SETTLE * 2)
+
+    def test_saving_a_copy_logs_what_changed(self):
+        copy = BookInstance.objects.create(book=self.hobbit, imprint='Imprint', status='a')
+        copy.status, copy.borrower, copy.due_back = 'o', self.alice, self.due
+        copy.save()
+        copy.due_back += datetime.timedelta(days=7)
+        copy.save()
+        # nothing about its circulation changed
+        copy.imprint = 'Another imprint'
+        copy.save()
+        copy.borrower = self.bob
+        copy.save()
+        copy.status, copy.borrower, copy.due_back = 'a', None, None
+        copy.save()
+        copy.status = 'm'
+        copy.save()
+        self.assertEqual(self.events(), [
+            (LoanEvent.CHECKOUT, self.alice.pk, 'o'), (LoanEvent.RENEWAL, self.alice.pk, 'o'),
+            (LoanEvent.RETURN, self.alice.pk, 'o'), (LoanEvent.CHECKOUT, self.bob.pk, 'o'),
+            (LoanEvent.RETURN, self.bob.pk, 'a'), (LoanEvent.STATUS, None, 'm')])
+
+    def test_bulk_changes_log_with_one_insert(self):
+        copies = [self.lend(self.hobbit, self.alice), self.lend(self.lotr, self.bob)]
+        LoanEvent.objects.all().delete()
+        with CaptureQueriesContext(connection) as queries:
+            loans.renew([copy.pk for copy in copies], self.due + datetime.timedelta(days=7))
+        self.assertEqual(sum('INSERT INTO "catalog_loanevent"' in query['sql'] for query in queries), 1)
+        loans.mark_returned([copy.pk for copy in copies])
+        self.assertEqual(sorted(self.events()), [
+            (LoanEvent.RENEWAL, self.alice.pk, 'o'), (LoanEvent.RENEWAL, self.bob.pk, 'o'),
+            (LoanEvent.RETURN, self.alice.pk, 'a'), (LoanEvent.RETURN, self.bob.pk, 'a')])
+
+    def test_holds_log_reserving_and_collecting(self):
+        BookInstance.objects.create(book=self.hobbit, imprint='Imprint', status='a')
+        hold = holds.place(self.hobbit, self.alice)
+        holds.collect(hold)
+        self.assertEqual(self.events(), [(LoanEvent.STATUS, self.alice.pk, 'r'), (LoanEvent.CHECKOUT, self.alice.pk, 'o')])
+
+    def test_rollup_counts_per_day_book_and_genre(self):
+        copy = self.lend(self.hobbit, self.alice)
+        self.lend(self.lotr, self.bob)
+        loans.renew([copy.pk], self.due + datetime.timedelta(days=7))
+        self.assertEqual(self.rollup(), 3)
+        today = timezone.localtime(timezone.now()).date()
+        self.assertEqual(DailyLoans.objects.values_list('date', 'checkouts', 'renewals', 'returns').get(),
+                         (today, 2, 1, 0))
+        self.assertEqual(set(DailyBookLoans.objects.values_list('book', 'checkouts', 'renewals')),
+                         {(self.hobbit.pk, 1, 1), (self.lotr.pk, 1, 0)})
+        self.assertEqual(set(DailyGenreLoans.objects.values_list('genre', 'checkouts', 'renewals')),
+                         {(self.fantasy.pk, 2, 1), (self.epic.pk, 1, 0)})
+
+        # the next run starts after the last event counted
+        loans.mark_returned([copy.pk])
+        self.assertEqual(self.rollup(), 1)
+        self.assertEqual(DailyBookLoans.objects.get(book=self.hobbit).returns, 1)
+        self.assertEqual(DailyLoans.objects.get().checkouts, 2)
+        self.assertEqual(LoanRollupMark.objects.get().last_event, LoanEvent.objects.latest('pk').pk)
+        # savepoint, the mark, the new events (none), moving the mark on, release
+        with self.assertNumQueries(5):
+            self.assertEqual(self.rollup(), 0)
+
+    def test_rollup_in_batches_leaves_recent_events(self):
+        for n in range(5):
+            self.lend(self.hobbit, self.alice)
+        # not settled yet
+        self.assertEqual(circulation.rollup(), 0)
+        self.assertEqual(circulation.rollup(now=timezone.now() + circulation.SETTLE * 2, batch_size=2), 5)
+        self.assertEqual(DailyBookLoans.objects.get().checkouts, 5)
+
+    def test_rollup_skips_deleted_books(self):
+        copy = self.lend(self.lotr, self.alice)
+        Book.objects.filter(pk=self.lotr.pk).delete()
+        self.assertEqual(self.rollup(), 1)
+        self.assertEqual(DailyLoans.objects.get().checkouts, 1)
+        self.assertFalse(DailyBookLoans.objects.exists())
+        self.assertTrue(LoanEvent.objects.filter(copy_id=copy.pk).exists())
+
+    def test_command(self):
+        out = StringIO()
+        call_command('rollup_loans', stdout=out)
+        self.assertIn('Rolled up 0 loan events', out.getvalue())
+
+    def test_stats_page_reads_only_the_rollups(self):
+        self.lend(self.hobbit, self.alice)
+        self.lend(self.hobbit, self.bob)
+        self.lend(self.lotr, self.bob)
+        self.rollup()
+        resp = self.client.get(reverse('circulation-stats'))
+        self.assertEqual(resp.status_code, 302)
+        self.client.login(username='librarian', password='12345')
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(reverse('circulation-stats'), {'days': '7'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse([query for query in queries if 'catalog_loanevent' in query['sql']])
+        self.assertEqual(len(resp.context['daily']), 7)
+        self.assertEqual(resp.context['totals'], {'checkouts': 3, 'renewals': 0, 'returns': 0})
+        self.assertEqual([(row['book__title'], row['checked_out']) for row in resp.context['top_books']],
+                         [('The Hobbit', 2), ('The Lord of the Rings', 1)])
+        self.assertEqual([(row['genre__name'], row['checked_out']) for row in resp.context['top_genres']],
+                         [('Fantasy', 3), ('Epic', 1)])
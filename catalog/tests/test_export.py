@@ -0,0 +1,91 @@
+from django.test import TestCase
+
+import csv
+import datetime
+import gzip
+import io
+import json
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+
+from catalog import export
+from catalog.models import Author, Book, BookInstance, Genre, Language
+
+class ExportTest(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='John', last_name='Tolkien')
+        english = Language.objects.create(name='English')
+        fantasy = Genre.objects.create(name='Fantasy')
+        adventure = Genre.objects.create(name='Adventure')
+        cls.borrower = User.objects.create_user(username='borrower', password='12345')
+        for n in range(7):
+            book = Book.objects.create(title='Book %s' % n, summary='Summary, "quoted"', isbn='123', author=author,
+                language=english)
+            book.genre.set([fantasy, adventure] if n % 2 else [fantasy])
+            BookInstance.objects.create(book=book, imprint='Imprint', status='o', borrower=cls.borrower,
+                due_back=datetime.date(2020, 1, n + 1))
+            BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+        Book.objects.create(title='No author', summary='', isbn='')
+            
+    def read(self, table, fmt, compress=False, chunk_size=3):
+        data = b''.join(export.export(table, fmt, compress, chunk_size=chunk_size))
+        if compress:
+            data = gzip.decompress(data)
+        text = data.decode('utf-8')
+        if fmt == 'csv':
+            return list(csv.DictReader(io.StringIO(text)))
+        return [json.loads(line) for line in text.splitlines()]
+        
+    def test_books_csv_has_denormalized_names(self):
+        rows = self.read('books', 'csv')
+        self.assertEqual(len(rows), 8)
+        self.assertEqual(rows[1]['author_last_name'], 'Tolkien')
+        self.assertEqual(rows[1]['language'], 'English')
+        self.assertEqual(rows[1]['genres'], 'Adventure|Fantasy')
+        self.assertEqual(rows[1]['summary'], 'Summary, "quoted"')
+        self.assertEqual(rows[7]['author_last_name'], '')
+        
+    def test_jsonl_and_gzip(self):
+        self.assertEqual(self.read('books', 'jsonl', compress=True), self.read('books', 'jsonl'))
+        rows = self.read('loans', 'jsonl')
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(rows[0]['borrower'], 'borrower')
+        self.assertEqual(len(self.read('copies', 'csv')), 14)
+        
+    def test_values_are_written_as_json_dumps_would(self):
+        Book.objects.create(title='Ænima ☃', summary='Line\nbreak \\ "quoted" \t', isbn='')
+        lines = b''.join(export.export('books', 'jsonl')).decode('utf-8').splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual(lines, [json.dumps(row, ensure_ascii=False, separators=(',', ':')) for row in rows])
+        self.assertEqual(rows[-1]['title'], 'Ænima ☃')
+        self.assertIsNone(rows[-1]['author_first_name'])
+        self.assertEqual(rows[1]['genres'], ['Adventure', 'Fantasy'])
+        loan = BookInstance.objects.filter(status='o').order_by('pk').first()
+        for row in (self.read('loans', 'jsonl')[0], self.read('loans', 'csv')[0]):
+            self.assertEqual(row['id'], str(loan.pk))
+            self.assertEqual(row['due_back'], str(loan.due_back))
+            self.assertEqual(str(row['borrower_id']), str(self.borrower.pk))
+
+    def test_queries_per_chunk_not_per_row(self):
+        # the genre names, then two queries (books, genre links) per chunk of
+        # three books
+        with self.assertNumQueries(7):
+            self.read('books', 'csv', chunk_size=3)
+        with self.assertNumQueries(3):
+            self.read('books', 'csv', chunk_size=100)
+            
+    def test_export_view_is_staff_only(self):
+        url = reverse('export-catalog', kwargs={'table': 'books', 'fmt': 'csv', 'compress': '.gz'})
+        self.client.login(username='borrower', password='12345')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        
+        User.objects.create_user(username='staff', password='12345', is_staff=True)
+        self.client.login(username='staff', password='12345')
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'application/gzip')
+        self.assertIn('books.csv.gz', resp['Content-Disposition'])
+        text = gzip.decompress(b''.join(resp.streaming_content)).decode('utf-8')
+        self.assertEqual(len(list(csv.DictReader(io.StringIO(text)))), 8)
@@ -0,0 +1,94 @@
+from django.test import TransactionTestCase
+
+from django.core.urlresolvers import reverse
+from django.test import override_settings
+
+from catalog import facets, fragments
+from catalog.models import Author, Book, BookInstance, Genre, Language
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'catalog': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-facets'},
+})
+class FacetTest(TransactionTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='John', last_name='Tolkien')
+        cls.english = Language.objects.create(name='English')
+        cls.french = Language.objects.create(name='French')
+        cls.fantasy = Genre.objects.create(name='Fantasy')
+        cls.epic = Genre.objects.create(name='Epic')
+        cls.books = []
+        for n in range(12):
+            book = Book.objects.create(title='Book %02d' % n, summary='', isbn='', author=author,
+                                       language=cls.english if n % 3 else cls.french)
+            book.genre.set([cls.fantasy] if n % 2 else [cls.fantasy, cls.epic])
+            cls.books.append(book)
+        # the even books have a copy on the shelf
+        cls.copy = BookInstance.objects.create(book=cls.books[0], status='a')
+        for book in cls.books[2::2]:
+            BookInstance.objects.create(book=book, status='a')
+
+    def setUp(self):
+        # real transactions, since versions are only bumped when a change commits
+        self.setUpTestData()
+        fragments.get_cache().clear()
+
+    def get(self, **params):
+        return self.client.get(reverse('books'), params)
+
+    def counts(self, resp):
+        return {dimension: [(label, count) for value, label, count in choices]
+                for dimension, selected, choices in resp.context['facets']}
+
+    def test_counts(self):
+        self.assertEqual(self.counts(self.get()), {
+            'genre': [('Epic', 6), ('Fantasy', 12)],
+            'language': [('English', 8), ('French', 4)],
+            'available': [('Available now', 6)],
+        })
+        # each dimension is counted with the other dimensions' filters
+        resp = self.get(genre=self.epic.pk, available='1')
+        self.assertEqual(self.counts(resp), {
+            'genre': [('Epic', 6), ('Fantasy', 6)],
+            'language': [('English', 4), ('French', 2)],
+            'available': [('Available now', 6)],
+        })
+        self.assertEqual(len(resp.context['book_list']), 6)
+        resp = self.get(language=self.french.pk, genre=self.fantasy.pk)
+        self.assertEqual([book.title for book in resp.context['book_list']], ['Book 00', 'Book 03', 'Book 06', 'Book 09'])
+        self.assertEqual(self.counts(resp)['available'], [('Available now', 2)])
+
+    def test_filters_survive_pagination(self):
+        resp = self.get(genre=self.fantasy.pk, cursor='')
+        self.assertEqual(len(resp.context['book_list']), 10)
+        next_page = self.get(genre=self.fantasy.pk, cursor=resp.context['page_obj'].next_cursor)
+        self.assertEqual([book.title for book in next_page.context['book_list']], ['Book 10', 'Book 11'])
+        self.assertContains(resp, 'genre=%s' % self.fantasy.pk)
+        # choosing another facet starts from the first page again
+        self.assertNotContains(resp, 'cursor=&amp;language')
+
+    def test_bad_filters_are_ignored(self):
+        self.assertEqual(len(self.get(genre='fantasy', available='yes').context['book_list']), 10)
+
+    def test_counts_are_cached_until_books_or_copies_change(self):
+        self.get()
+        # just the count and the page
+        with self.assertNumQueries(2):
+            self.get()
+        # lending a copy only recounts availability
+        copy = BookInstance.objects.get(pk=self.copy.pk)
+        copy.status = 'o'
+        copy.save()
+        with self.assertNumQueries(3):
+            self.assertEqual(self.counts(self.get())['available'], [('Available now', 5)])
+        # changing a book's genres recounts everything
+        Book.objects.get(pk=self.books[1].pk).genre.add(self.epic)
+        with self.assertNumQueries(5):
+            self.assertEqual(self.counts(self.get())['genre'][0], ('Epic', 7))
+
+    def test_parse_filters(self):
+        self.assertEqual(facets.parse_filters({'genre': '3', 'language': 'x', 'available': '1'}),
+                         {'genre': 3, 'available': 1})
@@ -0,0 +1,242 @@
+from django.test import TransactionTestCase
+
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db import transaction
+from django.test import override_settings
+
+from catalog import fragments, loans
+from catalog.models import Author, Book, BookInstance, Genre, Language
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'catalog': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-fragments'},
+})
+class FragmentCacheTest(TransactionTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='John', last_name='Tolkien')
+        cls.other_author = Author.objects.create(first_name='Frank', last_name='Herbert')
+        cls.english = Language.objects.create(name='English')
+        cls.fantasy = Genre.objects.create(name='Fantasy')
+        cls.book = Book.objects.create(title='The Hobbit', summary='There and back again', isbn='123',
+            author=cls.author, language=cls.english)
+        cls.book.genre.add(cls.fantasy)
+        cls.copy = BookInstance.objects.create(book=cls.book, imprint='Allen', status='a')
+        cls.other = Book.objects.create(title='Dune', summary='Spice', isbn='456', author=cls.other_author)
+
+    def setUp(self):
+        # real transactions, since versions are only bumped when a change commits
+        self.setUpTestData()
+        fragments.get_cache().clear()
+        fragments.reset_fragment_metrics()
+
+    def book_page(self, book=None):
+        return self.client.get(reverse('book-detail', args=[(book or self.book).pk])).content.decode()
+
+    def author_page(self, author=None, page=None):
+        url = reverse('author-detail', args=[(author or self.author).pk])
+        return self.client.get(url + ('?page=%s' % page if page else '')).content.decode()
+
+    def warm(self):
+        self.book_page()
+        self.book_page(self.other)
+        self.author_page()
+        self.author_page(self.other_author)
+        fragments.reset_fragment_metrics()
+
+    def metrics(self, kind):
+        metrics = fragments.fragment_metrics()[kind]
+        return metrics['hits'], metrics['misses']
+
+    def test_hits_skip_the_content_queries(self):
+        with self.assertNumQueries(4):
+            self.book_page()
+        # just the book itself, for the page title and the 404 check
+        with self.assertNumQueries(1):
+            self.assertIn('Allen', self.book_page())
+        self.assertEqual(self.metrics('book'), (1, 1))
+        self.assertEqual(fragments.fragment_metrics()['book']['hit_ratio'], 0.5)
+
+    def test_author_pages_vary_on_page_number(self):
+        for n in range(12):
+            Book.objects.create(title='Book %02d' % n, summary='', isbn='', author=self.author)
+        self.assertIn('Book 00', self.author_page())
+        self.assertIn('The Hobbit', self.author_page(page=2))
+        self.assertEqual(self.metrics('author'), (0, 2))
+        self.author_page(page=2)
+        self.assertEqual(self.metrics('author'), (1, 2))
+
+    def test_copy_changes_invalidate_book_and_author(self):
+        self.warm()
+        copy = BookInstance.objects.get(pk=self.copy.pk)
+        copy.status = 'o'
+        copy.save()
+        self.assertIn('On Loan', self.book_page())
+        self.assertIn('0 available', self.author_page())
+        self.book_page(self.other)
+        self.author_page(self.other_author)
+        self.assertEqual(self.metrics('book'), (1, 1))
+        self.assertEqual(self.metrics('author'), (1, 1))
+
+    def test_moving_a_book_invalidates_both_authors(self):
+        self.warm()
+        book = Book.objects.get(pk=self.book.pk)
+        book.author = self.other_author
+        book.save()
+        self.assertNotIn('The Hobbit', self.author_page())
+        self.assertIn('The Hobbit', self.author_page(self.other_author))
+        self.assertIn('Herbert', self.book_page())
+        self.assertEqual(self.metrics('author'), (0, 2))
+
+    def test_author_rename_invalidates_their_books(self):
+        self.warm()
+        author = Author.objects.get(pk=self.author.pk)
+        author.last_name = 'Tolkien, J. R. R.'
+        author.save()
+        self.assertIn('J. R. R.', self.book_page())
+        self.book_page(self.other)
+        self.assertEqual(self.metrics('book'), (1, 1))
+
+    def test_genre_and_language_changes(self):
+        self.warm()
+        fantasy = Genre.objects.get(pk=self.fantasy.pk)
+        fantasy.name = 'High Fantasy'
+        fantasy.save()
+        self.assertIn('High Fantasy', self.book_page())
+
+        self.book_page()
+        self.book.genre.clear()
+        self.assertNotIn('High Fantasy', self.book_page())
+
+        fantasy.book_set.add(self.other)
+        self.assertIn('High Fantasy', self.book_page(self.other))
+        fantasy.delete()
+        self.assertNotIn('High Fantasy', self.book_page(self.other))
+
+        Language.objects.get(pk=self.english.pk).delete()
+        self.assertNotIn('English', self.book_page())
+        self.assertEqual(self.metrics('book'), (1, 5))
+
+    def test_versions_move_when_the_change_commits(self):
+        self.warm()
+        version = fragments.get_version(fragments.get_cache(), 'book', self.book.pk)
+        with transaction.atomic():
+            book = Book.objects.get(pk=self.book.pk)
+            book.title = 'There and Back Again'
+            book.save()
+            # a request that reads before the commit still sees the old title,
+            # and caches it under the version the change hasn't bumped yet
+            self.assertEqual(fragments.get_version(fragments.get_cache(), 'book', self.book.pk), version)
+            fragments.get_or_render('book', self.book.pk, lambda: 'The Hobbit')
+        self.assertIn('There and Back Again', self.book_page())
+
+        # a change rolled back leaves the cached pages alone
+        with transaction.atomic():
+            Book.objects.get(pk=self.other.pk).save()
+            transaction.set_rollback(True)
+        fragments.reset_fragment_metrics()
+        self.book_page(self.other)
+        self.assertEqual(self.metrics('book'), (1, 0))
+
+    def test_evicted_version_does_not_revive_old_fragments(self):
+        self.book_page()
+        fragments.get_cache().delete(fragments.version_key('book', self.book.pk))
+        self.book_page()
+        self.assertEqual(self.metrics('book'), (0, 2))
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'catalog': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-fragments'},
+})
+class BorrowerFragmentTest(TransactionTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patron = User.objects.create_user(username='patron', password='12345')
+        cls.other_patron = User.objects.create_user(username='other', password='12345')
+        author = Author.objects.create(first_name='John', last_name='Tolkien')
+        cls.book = Book.objects.create(title='The Hobbit', summary='', isbn='', author=author)
+        due = datetime.date.today() + datetime.timedelta(days=7)
+        cls.copy = BookInstance.objects.create(book=cls.book, status='o', borrower=cls.patron, due_back=due)
+        cls.other_copy = BookInstance.objects.create(book=cls.book, status='o', borrower=cls.other_patron, due_back=due)
+        cls.shelved = BookInstance.objects.create(book=cls.book, status='a')
+
+    def setUp(self):
+        # real transactions, since versions are only bumped when a change commits
+        self.setUpTestData()
+        fragments.get_cache().clear()
+        fragments.reset_fragment_metrics()
+
+    def my_books(self, patron=None, cursor=None):
+        self.client.login(username=(patron or self.patron).username, password='12345')
+        return self.client.get(reverse('borrowed-books'), {'cursor': cursor} if cursor else {}).content.decode()
+
+    def warm(self):
+        self.my_books()
+        self.my_books(self.other_patron)
+        fragments.reset_fragment_metrics()
+
+    def metrics(self):
+        metrics = fragments.fragment_metrics()['borrower']
+        return metrics['hits'], metrics['misses']
+
+    def test_hits_skip_the_loans_query(self):
+        self.client.login(username='patron', password='12345')
+        with self.assertNumQueries(6):
+            self.client.get(reverse('borrowed-books'))
+        # the session, the user, their permissions (for the sidebar) and their holds
+        with self.assertNumQueries(5):
+            self.assertIn('The Hobbit', self.client.get(reverse('borrowed-books')).content.decode())
+        self.assertEqual(self.metrics(), (1, 1))
+
+    def test_loan_changes_invalidate_only_the_borrower(self):
+        self.warm()
+        loans.renew([self.copy.pk], datetime.date(2030, 1, 2))
+        self.assertIn('Jan. 2, 2030', self.my_books())
+        self.my_books(self.other_patron)
+        self.assertEqual(self.metrics(), (1, 1))
+
+        loans.mark_returned([self.copy.pk])
+        self.assertIn('No books have been borrowed', self.my_books())
+
+        copy = BookInstance.objects.get(pk=self.shelved.pk)
+        copy.status, copy.borrower, copy.due_back = 'o', self.patron, datetime.date(2031, 3, 4)
+        copy.save()
+        self.assertIn('March 4, 2031', self.my_books())
+        self.my_books(self.other_patron)
+        self.assertEqual(self.metrics(), (2, 3))
+
+    def test_moving_a_loan_invalidates_both_borrowers(self):
+        self.warm()
+        copy = BookInstance.objects.get(pk=self.copy.pk)
+        copy.borrower = self.other_patron
+        copy.save()
+        self.assertIn('No books have been borrowed', self.my_books())
+        self.assertEqual(self.my_books(self.other_patron).count('The Hobbit'), 2)
+        self.assertEqual(self.metrics(), (0, 2))
+
+    def test_renaming_a_book_invalidates_its_borrowers(self):
+        self.warm()
+        book = Book.objects.get(pk=self.book.pk)
+        book.title = 'The Hobbit, or There and Back Again'
+        book.save()
+        self.assertIn('There and Back Again', self.my_books())
+        self.assertIn('There and Back Again', self.my_books(self.other_patron))
+
+    def test_pages_vary_on_cursor(self):
+        for n in range(10):
+            BookInstance.objects.create(book=self.book, status='o', borrower=self.patron,
+                due_back=datetime.date(2030, 1, 1) + datetime.timedelta(days=n))
+        first = self.my_books()
+        self.assertNotIn('previous', first)
+        cursor = first.split('cursor=')[1].split('"')[0]
+        second = self.my_books(cursor=cursor)
+        self.assertIn('previous', second)
+        self.assertNotIn('Jan. 1, 2030', second)
+        self.my_books(cursor=cursor)
+        self.assertEqual(self.metrics(), (1, 2))
@@ -0,0 +1,139 @@
+from django.test import TestCase, TransactionTestCase
+
+import datetime
+import random
+import threading
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db import connections
+
+from catalog import holds, loans
+from catalog.models import Author, Book, BookAvailability, BookInstance, CatalogStats, Hold
+
+class HoldQueueTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='John', last_name='Tolkien')
+        cls.book = Book.objects.create(title='The Hobbit', summary='', isbn='', author=author)
+        cls.patrons = [User.objects.create_user(username='patron%s' % n, password='12345') for n in range(3)]
+        cls.loans = [BookInstance.objects.create(book=cls.book, imprint='Imprint', status='o', borrower=cls.patrons[0],
+            due_back=datetime.date.today()) for n in range(2)]
+        CatalogStats.rebuild()
+
+    def copy(self, copy):
+        return BookInstance.objects.get(pk=copy.pk)
+
+    def assertCountsConsistent(self):
+        self.assertEqual(BookAvailability.inconsistencies([self.book.pk]), [])
+        self.assertEqual(CatalogStats.load().num_instances_available, CatalogStats.live_counts()['num_instances_available'])
+
+    def test_returned_copies_go_to_the_oldest_hold(self):
+        queue = [holds.place(self.book, patron) for patron in self.patrons]
+        self.assertEqual([hold.copy_id for hold in queue], [None] * 3)
+        loans.mark_returned([str(self.loans[1].pk)])
+        self.assertEqual([hold.copy_id for hold in Hold.objects.order_by('placed', 'id')], [self.loans[1].pk, None, None])
+        copy = self.copy(self.loans[1])
+        self.assertEqual((copy.status, copy.borrower, copy.due_back), ('r', self.patrons[0], None))
+        loans.mark_returned([str(self.loans[0].pk)])
+        self.assertEqual(Hold.objects.get(patron=self.patrons[1]).copy_id, self.loans[0].pk)
+        self.assertEqual(BookAvailability.objects.get(book=self.book).reserved, 2)
+        self.assertCountsConsistent()
+
+    def test_available_copy_is_reserved_at_once(self):
+        loans.mark_returned([str(self.loans[0].pk)])
+        hold = holds.place(self.book, self.patrons[1])
+        self.assertEqual(hold.copy_id, self.loans[0].pk)
+        # placing it again keeps the same hold
+        self.assertEqual(holds.place(self.book, self.patrons[1]).pk, hold.pk)
+        self.assertCountsConsistent()
+
+    def test_cancelled_copy_goes_to_the_next_hold(self):
+        first, second = holds.place(self.book, self.patrons[1]), holds.place(self.book, self.patrons[2])
+        loans.mark_returned([str(self.loans[0].pk)])
+        holds.cancel(first)
+        self.assertEqual(Hold.objects.get().pk, second.pk)
+        self.assertEqual(Hold.objects.get().copy_id, self.loans[0].pk)
+        self.assertEqual(self.copy(self.loans[0]).borrower, self.patrons[2])
+        holds.cancel(second)
+        self.assertEqual((self.copy(self.loans[0]).status, self.copy(self.loans[0]).borrower), ('a', None))
+        self.assertCountsConsistent()
+
+    def test_collect(self):
+        hold = holds.place(self.book, self.patrons[1])
+        self.assertIsNone(holds.collect(hold))
+        loans.mark_returned([str(self.loans[0].pk)])
+        self.assertEqual(holds.collect(hold), self.loans[0].pk)
+        copy = self.copy(self.loans[0])
+        self.assertEqual((copy.status, copy.borrower, copy.due_back),
+            ('o', self.patrons[1], datetime.date.today() + holds.LOAN_PERIOD))
+        self.assertFalse(Hold.objects.exists())
+        self.assertCountsConsistent()
+
+    def test_view(self):
+        url = reverse('hold-book', args=[self.book.pk])
+        self.assertEqual(self.client.post(url).status_code, 302)
+        self.assertFalse(Hold.objects.exists())
+        self.client.login(username='patron1', password='12345')
+        self.assertEqual(self.client.get(url).status_code, 405)
+        resp = self.client.post(url, follow=True)
+        self.assertRedirects(resp, reverse('borrowed-books'))
+        self.assertContains(resp, 'waiting since')
+        loans.mark_returned([str(self.loans[0].pk)])
+        self.assertContains(self.client.get(reverse('borrowed-books')), 'ready to collect')
+        self.client.post(url, {'action': 'cancel'})
+        self.assertFalse(Hold.objects.exists())
+        self.assertEqual(self.copy(self.loans[0]).status, 'a')
+
+
+class HoldConcurrencyTest(TransactionTestCase):
+    """
+    Patrons placing holds and librarians returning copies, all at once from many
+    threads. On SQLite none of them should fail with "database is locked": every
+    transaction takes the write lock first and waits its turn for it.
+    """
+    copies = 20
+    patrons = 30
+
+    def test_no_copy_is_given_out_twice(self):
+        author = Author.objects.create(first_name='Frank', last_name='Herbert')
+        book = Book.objects.create(title='Dune', summary='', isbn='', author=author)
+        patrons = [User.objects.create_user(username='patron%s' % n) for n in range(self.patrons)]
+        copies = [BookInstance.objects.create(book=book, imprint='Imprint', status='o', borrower=patrons[0])
+            for n in range(self.copies)]
+        CatalogStats.rebuild()
+
+        operations = ([lambda patron=patron: holds.place(book, patron) for patron in patrons] +
+                      [lambda copy=copy: loans.mark_returned([str(copy.pk)]) for copy in copies])
+        random.Random(42).shuffle(operations)
+        start = threading.Barrier(len(operations))
+        errors = []
+
+        def worker(operation):
+            try:
+                start.wait()
+                operation()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(operation,)) for operation in operations]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+        queue = list(Hold.objects.filter(book=book).order_by('placed', 'id'))
+        self.assertEqual(len(queue), self.patrons)
+        # every copy went to a hold, the oldest holds got them, and each to one hold only
+        self.assertEqual([hold.copy_id is not None for hold in queue],
+            [True] * self.copies + [False] * (self.patrons - self.copies))
+        self.assertEqual({hold.copy_id for hold in queue[:self.copies]}, {copy.pk for copy in copies})
+        for hold in queue[:self.copies]:
+            self.assertEqual(hold.copy.status, 'r')
+            self.assertEqual(hold.copy.borrower_id, hold.patron_id)
+        self.assertEqual(BookAvailability.inconsistencies([book.pk]), [])
+        self.assertEqual(CatalogStats.load().num_instances_available, 0)
@@ -0,0 +1,155 @@
+from django.test import TestCase, TransactionTestCase
+
+import json
+import os
+import shutil
+import tempfile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.six import StringIO
+from unittest import mock
+
+from catalog import autocomplete, importer
+from catalog.importer import CatalogImporter
+from catalog.models import Author, Book, BookInstance, CatalogStats, CatalogVersion, Genre, ImportCheckpoint, Language
+from catalog.search import search_books
+
+CSV = '''title,summary,isbn,author_first_name,author_last_name,language,genres,copies,imprint,status
+The Hobbit,There and back again,9780261102217,John,Tolkien,English,Fantasy|Adventure,2,Allen,a
+The Silmarillion,Myths,9780261102736,John,Tolkien,English,Fantasy,1,Allen,o
+,No title here,123,,,,,,,
+Dune,Spice,9780441172719,Frank,Herbert,German,Science Fiction,0,,
+'''
+
+class ImportCatalogTest(TestCase):
+    
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        
+    def write(self, name, content):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+        
+    def test_imports_csv(self):
+        out, err = StringIO(), StringIO()
+        call_command('import_catalog', self.write('books.csv', CSV), chunk_size=2, stdout=out, stderr=err)
+        self.assertIn('Imported 3 books and 3 copies from 4 rows', out.getvalue())
+        self.assertIn('Skipped row 3: missing title', err.getvalue())
+        
+        hobbit = Book.objects.get(title='The Hobbit')
+        self.assertEqual(str(hobbit.author), 'Tolkien, John')
+        self.assertEqual(hobbit.language.name, 'English')
+        self.assertEqual(sorted(g.name for g in hobbit.genre.all()), ['Adventure', 'Fantasy'])
+        self.assertEqual(hobbit.bookinstance_set.filter(status='a').count(), 2)
+        self.assertEqual(Author.objects.count(), 2)
+        self.assertEqual(Genre.objects.count(), 3)
+        self.assertEqual(Language.objects.count(), 2)
+        
+        # the denormalized tables were kept up to date
+        stats = CatalogStats.load()
+        for name, value in CatalogStats.live_counts().items():
+            self.assertEqual(getattr(stats, name), value, name)
+        self.assertEqual(list(search_books('herbert')[:10]), [Book.objects.get(title='Dune')])
+        
+    def test_reuses_existing_rows(self):
+        tolkien = Author.objects.create(first_name='John', last_name='Tolkien')
+        fantasy = Genre.objects.create(name='Fantasy')
+        path = self.write('books.jsonl', '\n'.join(json.dumps(row) for row in [
+            {'title': 'The Hobbit', 'author_first_name': 'John', 'author_last_name': 'Tolkien', 'genres': ['Fantasy']},
+            {'title': 'Beren and Luthien', 'author_first_name': 'John', 'author_last_name': 'Tolkien', 'genres': 'Fantasy'},
+        ]))
+        call_command('import_catalog', path, stdout=StringIO())
+        self.assertEqual(Author.objects.get(), tolkien)
+        self.assertEqual(Genre.objects.get(), fantasy)
+        self.assertEqual(tolkien.book_set.count(), 2)
+        
+    def test_chunks_use_a_fixed_number_of_queries(self):
+        CatalogStats.load()
+        CatalogVersion.load()
+        def rows(number, prefix):
+            return [dict(title='Book %s' % n, author_first_name=prefix, author_last_name='Author %s' % n,
+                         genres='%s%s' % (prefix, n % 3), language=prefix, copies='1') for n in range(number)]
+        with CaptureQueriesContext(connection) as small_chunk:
+            CatalogImporter(chunk_size=100).run(rows(50, 'A'))
+        with CaptureQueriesContext(connection) as big_chunk:
+            CatalogImporter(chunk_size=100).run(rows(100, 'B'))
+        self.assertEqual(len(small_chunk), len(big_chunk))
+        self.assertEqual(Book.objects.count(), 150)
+        self.assertEqual(BookInstance.objects.count(), 150)
+
+    def test_caches_smaller_than_a_chunk(self):
+        rows = [dict(title='Book %s' % n, author_first_name=first, author_last_name=last, genres=first, language=last)
+                for n, (first, last) in enumerate([('A', '1'), ('B', '2'), ('A', '1'), ('C', '3')])]
+        CatalogImporter(chunk_size=2, cache_size=2).run(rows)
+        self.assertEqual(Author.objects.count(), 3)
+        self.assertEqual(Genre.objects.count(), 3)
+        self.assertEqual(Language.objects.count(), 3)
+        self.assertEqual([str(book.author) for book in Book.objects.order_by('title')], ['1, A', '2, B', '1, A', '3, C'])
+        self.assertEqual(Book.objects.filter(genre__name='A', language__name='1').count(), 2)
+
+    def test_resume_from_checkpoint(self):
+        path = self.write('books.csv', CSV)
+        ImportCheckpoint.objects.create(source=path, rows_done=2)
+        out = StringIO()
+        call_command('import_catalog', path, resume=True, stdout=out, stderr=StringIO())
+        self.assertIn('Resuming after row 2', out.getvalue())
+        self.assertEqual(list(Book.objects.values_list('title', flat=True)), ['Dune'])
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+    def test_checkpoint_is_saved_with_its_chunk(self):
+        path = self.write('books.csv', CSV)
+        save = ImportCheckpoint.objects.update_or_create
+        def fail_on_the_second_chunk(source, defaults):
+            if defaults['rows_done'] > 2:
+                raise RuntimeError('crashed')
+            return save(source=source, defaults=defaults)
+        with mock.patch.object(ImportCheckpoint.objects, 'update_or_create', fail_on_the_second_chunk):
+            with self.assertRaises(RuntimeError):
+                call_command('import_catalog', path, chunk_size=2, stdout=StringIO(), stderr=StringIO())
+        # the second chunk's books went with its checkpoint
+        self.assertEqual(ImportCheckpoint.objects.get(source=path).rows_done, 2)
+        self.assertEqual(Book.objects.count(), 2)
+        call_command('import_catalog', path, resume=True, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(Book.objects.count(), 3)
+
+    def test_skipped_rows_are_counted(self):
+        rows = [{'title': ''}] * (importer.SKIPPED_SAMPLE * 5) + [{'title': 'Dune'}]
+        catalog = CatalogImporter(chunk_size=10)
+        catalog.run(rows)
+        self.assertEqual(catalog.skipped, importer.SKIPPED_SAMPLE * 5)
+        self.assertEqual(len(catalog.skipped_rows), importer.SKIPPED_SAMPLE)
+        self.assertEqual(catalog.skipped_rows[0], (1, 'missing title'))
+        self.assertEqual(catalog.books, 1)
+        
+    def test_resume_needs_a_checkpoint(self):
+        with self.assertRaises(CommandError):
+            call_command('import_catalog', self.write('books.csv', CSV), resume=True)
+
+
+class ImportAutocompleteTest(TransactionTestCase):
+
+    def setUp(self):
+        autocomplete.reset_index()
+        self.addCleanup(autocomplete.reset_index)
+
+    def test_rolled_back_chunks_leave_the_index_alone(self):
+        autocomplete.get_index()
+        rows = [{'title': 'The Hobbit', 'author_first_name': 'John', 'author_last_name': 'Tolkien'},
+                {'title': 'Dune', 'author_first_name': 'Frank', 'author_last_name': 'Herbert'}]
+        save = ImportCheckpoint.objects.update_or_create
+        def fail_on_the_second_chunk(source, defaults):
+            if defaults['rows_done'] > 1:
+                raise RuntimeError('crashed')
+            return save(source=source, defaults=defaults)
+        with mock.patch.object(ImportCheckpoint.objects, 'update_or_create', fail_on_the_second_chunk):
+            with self.assertRaises(RuntimeError):
+                CatalogImporter(chunk_size=1, checkpoint='books.jsonl').run(rows)
+        self.assertEqual([label for kind, pk, label in autocomplete.lookup('hob')], ['The Hobbit'])
+        self.assertEqual([label for kind, pk, label in autocomplete.lookup('tolk')], ['Tolkien, John'])
+        self.assertEqual(autocomplete.lookup('dune'), [])
+        self.assertEqual(autocomplete.lookup('herb'), [])
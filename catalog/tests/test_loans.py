@@ -0,0 +1,114 @@
+from django.test import TestCase
+
+import datetime
+import uuid
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.contrib.auth.models import Permission, User
+from django.core.urlresolvers import reverse
+from unittest import mock
+
+from catalog import loans
+from catalog.admin import BookInstanceAdmin
+from catalog.models import Author, Book, BookInstance, CatalogStats, CatalogVersion
+
+class BulkLoanTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = datetime.date.today()
+        cls.author = Author.objects.create(first_name='John', last_name='Tolkien')
+        cls.book = Book.objects.create(title='The Hobbit', summary='', isbn='', author=cls.author)
+        cls.borrower = User.objects.create_user(username='borrower', password='12345')
+        cls.librarian = User.objects.create_user(username='librarian', password='12345', is_staff=True)
+        cls.librarian.user_permissions.add(*Permission.objects.filter(
+            codename__in=['can_renew', 'can_mark_returned', 'change_bookinstance']))
+        cls.returner = User.objects.create_user(username='returner', password='12345')
+        cls.returner.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+        cls.loans = [BookInstance.objects.create(book=cls.book, imprint='Imprint', status='o', borrower=cls.borrower,
+            due_back=cls.today + datetime.timedelta(days=n)) for n in range(3)]
+        cls.available = BookInstance.objects.create(book=cls.book, imprint='Imprint', status='a')
+        CatalogStats.rebuild()
+
+    def ids(self, *copies):
+        return [str(copy.pk) for copy in copies]
+
+    def test_renew(self):
+        version = CatalogVersion.load().version
+        renewal = self.today + datetime.timedelta(weeks=2)
+        missing = str(uuid.uuid4())
+        outcomes = loans.renew(self.ids(*self.loans) + self.ids(self.available) + [missing, 'junk'], renewal)
+        self.assertEqual([outcome for copy_id, outcome in outcomes],
+            [loans.RENEWED] * 3 + [loans.NOT_ON_LOAN, loans.NOT_FOUND, loans.NOT_FOUND])
+        self.assertEqual(set(BookInstance.objects.on_loan().values_list('due_back', flat=True)), {renewal})
+        self.assertIsNone(BookInstance.objects.get(pk=self.available.pk).due_back)
+        self.assertEqual(CatalogVersion.load().version, version + 1)
+
+    def test_mark_returned_keeps_stats_in_step(self):
+        outcomes = loans.mark_returned(self.ids(self.loans[0], self.loans[1], self.available))
+        self.assertEqual(loans.summarize(outcomes), {loans.RETURNED: 2, loans.NOT_ON_LOAN: 1})
+        copy = BookInstance.objects.get(pk=self.loans[0].pk)
+        self.assertEqual((copy.status, copy.borrower, copy.due_back), ('a', None, None))
+        stats = CatalogStats.load()
+        self.assertEqual(stats.num_instances_available, CatalogStats.live_counts()['num_instances_available'])
+        self.assertEqual(stats.num_instances_available, 3)
+
+    def test_one_update_however_many_copies(self):
+        renewal = self.today + datetime.timedelta(weeks=1)
+        # savepoint, select, update, the logged renewals, catalog version, the books' authors, release
+        with self.assertNumQueries(7):
+            loans.renew(self.ids(*self.loans), renewal)
+        more = [BookInstance.objects.create(book=self.book, imprint='Imprint', status='o') for n in range(20)]
+        with self.assertNumQueries(7):
+            loans.renew(self.ids(*self.loans + more), renewal)
+
+    def test_view_renews_ticked_copies(self):
+        self.client.login(username='librarian', password='12345')
+        renewal = self.today + datetime.timedelta(weeks=2)
+        resp = self.client.post(reverse('bulk-update-loans'), {'action': 'renew', 'renewal_date': renewal,
+            'copy': self.ids(self.loans[0], self.available)})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([outcome for copy_id, copy, outcome in resp.context['results']],
+            [loans.RENEWED, loans.NOT_ON_LOAN])
+        self.assertContains(resp, '1 not on loan, 1 renewed')
+        self.assertEqual(BookInstance.objects.get(pk=self.loans[0].pk).due_back, renewal)
+
+    def test_view_uses_the_renewal_form_rules(self):
+        self.client.login(username='librarian', password='12345')
+        resp = self.client.post(reverse('bulk-update-loans'), {'action': 'renew',
+            'renewal_date': self.today + datetime.timedelta(weeks=5), 'copy': self.ids(*self.loans)})
+        self.assertFormError(resp, 'form', 'renewal_date', 'Invalid date - renewal more than 4 weeks ahead')
+        self.assertContains(resp, 'Nothing was changed')
+        self.assertEqual(BookInstance.objects.get(pk=self.loans[0].pk).due_back, self.today)
+
+    def test_view_permissions(self):
+        url = reverse('bulk-update-loans')
+        self.client.login(username='borrower', password='12345')
+        self.assertEqual(self.client.post(url, {'action': 'return', 'copy': self.ids(*self.loans)}).status_code, 302)
+        self.client.login(username='returner', password='12345')
+        self.assertEqual(self.client.get(url).status_code, 405)
+        resp = self.client.post(url, {'action': 'renew', 'renewal_date': self.today, 'copy': self.ids(*self.loans)})
+        self.assertEqual(resp.status_code, 403)
+        resp = self.client.post(url, {'action': 'return', 'copy': self.ids(*self.loans)})
+        self.assertContains(resp, '3 returned')
+        self.assertFalse(BookInstance.objects.on_loan().exists())
+
+    def test_admin_actions(self):
+        self.client.login(username='librarian', password='12345')
+        url = reverse('admin:catalog_bookinstance_changelist')
+        selected = {'action': 'renew_loans', ACTION_CHECKBOX_NAME: self.ids(self.loans[0], self.available)}
+        # first the date is asked for
+        resp = self.client.post(url, selected)
+        self.assertContains(resp, 'Renew 2 selected copies')
+        self.assertNotContains(resp, 'more</li>')
+        with mock.patch.object(BookInstanceAdmin, 'renew_preview_limit', 1):
+            self.assertContains(self.client.post(url, selected), 'and 1 more')
+        renewal = self.today + datetime.timedelta(weeks=1)
+        resp = self.client.post(url, dict(selected, apply='yes', renewal_date=renewal), follow=True)
+        self.assertContains(resp, 'Renewed 1 loan(s).')
+        self.assertContains(resp, 'Not renewed: %s (not on loan)' % self.available)
+        self.assertEqual(BookInstance.objects.get(pk=self.loans[0].pk).due_back, renewal)
+
+        resp = self.client.post(url, {'action': 'mark_returned', ACTION_CHECKBOX_NAME: self.ids(*self.loans)},
+            follow=True)
+        self.assertContains(resp, 'Returned 3 loan(s).')
+        self.assertEqual(CatalogStats.load().num_instances_available, 4)
@@ -0,0 +1,85 @@
+from django.test import TestCase
+
+import json
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import override_settings
+
+from catalog.middleware import QueryBudgetExceeded, query_shape, summarize
+from catalog.models import Author, Book, Genre, Language
+from catalog.views import BookListView
+
+class SQLInstrumentationTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='John', last_name='Tolkien')
+        for n in range(3):
+            Book.objects.create(title='Book %s' % n, summary='', isbn='', author=author)
+
+    def test_server_timing_header(self):
+        resp = self.client.get(reverse('books'))
+        self.assertRegex(resp['Server-Timing'], r'^sql;desc="5 queries, 0 duplicates";dur=[\d.]+, total;dur=[\d.]+$')
+
+    @override_settings(CATALOG_SQL_INSTRUMENTATION={'SERVER_TIMING': False})
+    def test_header_can_be_turned_off(self):
+        self.assertFalse(self.client.get(reverse('books')).has_header('Server-Timing'))
+
+    def test_log_line(self):
+        with self.assertLogs('catalog.middleware', 'INFO') as logs:
+            self.client.get(reverse('books'))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['view'], record['status'], record['queries'], record['budget']),
+            ('books', 200, 5, BookListView.query_budget))
+
+    def test_counts_without_the_query_log(self):
+        self.assertFalse(connection.queries_logged)
+        resp = self.client.get(reverse('books'))
+        self.assertIn('5 queries', resp['Server-Timing'])
+        self.assertEqual(len(connection.queries_log), 0)
+        self.assertNotIn('cursor', connection.__dict__)
+
+    def test_book_forms_stay_within_budget(self):
+        User.objects.create_superuser('librarian', 'librarian@example.com', '12345')
+        self.client.login(username='librarian', password='12345')
+        fantasy, epic = Genre.objects.create(name='Fantasy'), Genre.objects.create(name='Epic')
+        other = Author.objects.create(first_name='Frank', last_name='Herbert')
+        data = {'title': 'Dune', 'summary': 'Spice', 'isbn': '9780441172719', 'author': other.pk,
+                'genre': [fantasy.pk], 'language': Language.objects.create(name='English').pk}
+        self.assertEqual(self.client.post(reverse('book-create'), data).status_code, 302)
+        book = Book.objects.get(title='Dune')
+        data.update(title='Dune Messiah', author=Author.objects.get(last_name='Tolkien').pk, genre=[epic.pk])
+        self.assertEqual(self.client.post(reverse('book-update', args=[book.pk]), data).status_code, 302)
+
+    def test_does_not_disturb_assert_num_queries(self):
+        with self.assertNumQueries(5):
+            self.client.get(reverse('books'))
+
+    @override_settings(CATALOG_SQL_INSTRUMENTATION={'RAISE': True})
+    def test_over_budget_fails(self):
+        with mock.patch.object(BookListView, 'query_budget', 1):
+            with self.assertLogs('catalog.middleware', 'WARNING'):
+                with self.assertRaisesMessage(QueryBudgetExceeded, 'books ran 5 queries, over its budget of 1'):
+                    self.client.get(reverse('books'))
+
+    @override_settings(CATALOG_SQL_INSTRUMENTATION={'RAISE': False})
+    def test_over_budget_is_only_logged_outside_tests(self):
+        with mock.patch.object(BookListView, 'query_budget', 1):
+            with self.assertLogs('catalog.middleware', 'WARNING') as logs:
+                self.assertEqual(self.client.get(reverse('books')).status_code, 200)
+        self.assertEqual(json.loads(logs.records[0].getMessage())['problem'], 'over budget')
+
+    def test_repeated_queries(self):
+        self.assertEqual(query_shape("SELECT * FROM x WHERE id = 12 AND name = 'it''s' AND y IN (1, 2, 3)"),
+            'SELECT * FROM x WHERE id = ? AND name = ? AND y IN (...)')
+        # a template following book.author for every book on the page
+        queries = [{'sql': 'SELECT * FROM book', 'time': '0.001'}] + [
+            {'sql': 'SELECT * FROM author WHERE id = %d' % (n % 2), 'time': '0.002'} for n in range(6)]
+        summary = summarize(queries)
+        self.assertEqual((summary['queries'], summary['duplicates'], summary['similar'], summary['repeats']),
+            (7, 4, 5, 6))
+        self.assertEqual(summary['most_repeated'], 'SELECT * FROM author WHERE id = ?')
+        self.assertAlmostEqual(summary['sql_ms'], 13.0)
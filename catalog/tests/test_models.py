@@ -1,2 +1,59 @@
 from django.test import TestCase
 
+
+from catalog.models import Author, Book, BookInstance, CatalogStats, Language
+
+class CatalogStatsTest(TestCase):
+    
+    def setUp(self):
+        self.english = Language.objects.create(name='English')
+        self.german = Language.objects.create(name='German')
+        self.author = Author.objects.create(first_name='Big', last_name='Bob')
+        self.book = Book.objects.create(title='Book Title', summary='Summary', isbn='ABCDEFG',
+            author=self.author, language=self.english)
+        
+    def assertStatsMatchLiveCounts(self):
+        stats = CatalogStats.load()
+        for name, value in CatalogStats.live_counts().items():
+            self.assertEqual(getattr(stats, name), value, name)
+    
+    def test_counts_created_objects(self):
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='o')
+        stats = CatalogStats.load()
+        self.assertEqual(stats.num_books, 1)
+        self.assertEqual(stats.num_books_english, 1)
+        self.assertEqual(stats.num_authors, 1)
+        self.assertEqual(stats.num_instances, 2)
+        self.assertEqual(stats.num_instances_available, 1)
+        
+    def test_status_change_updates_available_count(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='o')
+        copy.status = 'a'
+        copy.save()
+        self.assertEqual(CatalogStats.load().num_instances_available, 1)
+        copy.status = 'm'
+        copy.save()
+        self.assertEqual(CatalogStats.load().num_instances_available, 0)
+        self.assertStatsMatchLiveCounts()
+        
+    def test_language_change_updates_english_count(self):
+        self.book.language = self.german
+        self.book.save()
+        self.assertEqual(CatalogStats.load().num_books_english, 0)
+        self.german.name = 'English'
+        self.german.save()
+        self.assertEqual(CatalogStats.load().num_books_english, 1)
+        
+    def test_deletes_are_counted(self):
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        BookInstance.objects.all().delete()
+        self.book.delete()
+        self.author.delete()
+        self.assertStatsMatchLiveCounts()
+        self.assertEqual(CatalogStats.load().num_books, 0)
+        
+    def test_rebuild_fixes_drift(self):
+        CatalogStats.objects.filter(pk=1).update(num_books=42)
+        CatalogStats.rebuild()
+        self.assertStatsMatchLiveCounts()
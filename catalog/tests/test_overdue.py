@@ -0,0 +1,88 @@
+from django.test import TestCase
+
+import datetime
+from django.contrib.auth.models import Permission, User
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.utils.six import StringIO
+
+from catalog.models import Book, BookInstance, OverdueSnapshot
+
+class OverdueTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = datetime.date.today()
+        cls.book = Book.objects.create(title='The Hobbit', summary='', isbn='')
+        cls.alice = User.objects.create_user(username='alice', password='12345')
+        cls.bob = User.objects.create_user(username='bob', password='12345')
+        cls.librarian = User.objects.create_user(username='librarian', password='12345')
+        cls.librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+        def loan(borrower, days, status='o'):
+            return BookInstance.objects.create(book=cls.book, imprint='Imprint', status=status, borrower=borrower,
+                due_back=cls.today + datetime.timedelta(days=days))
+        cls.late = [loan(cls.alice, -10), loan(cls.alice, -1), loan(cls.bob, -3), loan(None, -2)]
+        loan(cls.alice, 0)              # due today, not overdue yet
+        loan(cls.bob, 5)
+        loan(cls.bob, -5, status='a')   # returned
+        BookInstance.objects.create(book=cls.book, imprint='Imprint', status='o')  # no due date
+
+    def test_overdue_is_filtered_and_annotated_in_sql(self):
+        self.assertEqual(set(BookInstance.objects.overdue()), set(self.late))
+        self.assertEqual(BookInstance.objects.overdue(self.today + datetime.timedelta(days=1)).count(), 5)
+        flags = {copy.pk: copy.overdue for copy in BookInstance.objects.with_overdue()}
+        self.assertEqual({pk for pk, overdue in flags.items() if overdue}, {copy.pk for copy in self.late})
+        for copy in BookInstance.objects.with_overdue().filter(status='o').exclude(due_back=None):
+            self.assertEqual(copy.overdue, copy.is_overdue)
+
+    def test_overdue_by_borrower(self):
+        rows = list(BookInstance.objects.overdue_by_borrower())
+        self.assertEqual([(row['borrower'], row['overdue_loans']) for row in rows],
+            [(self.alice.pk, 2), (self.bob.pk, 1), (None, 1)])
+        self.assertEqual(rows[0]['oldest_due_back'], self.today - datetime.timedelta(days=10))
+
+    def test_report_needs_permission(self):
+        self.client.login(username='alice', password='12345')
+        resp = self.client.get(reverse('overdue-report'))
+        self.assertEqual(resp.status_code, 302)
+        self.assertTrue(resp.url.startswith('/accounts/login/'))
+
+    def test_report_groups_loans_by_borrower(self):
+        self.client.login(username='librarian', password='12345')
+        resp = self.client.get(reverse('overdue-report'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.context['total_overdue'], 4)
+        groups = resp.context['borrower_list']
+        self.assertEqual([group['user'] for group in groups], [self.alice, self.bob, None])
+        self.assertEqual([copy.pk for copy in groups[0]['loans']], [self.late[0].pk, self.late[1].pk])
+        self.assertEqual([copy.pk for copy in groups[2]['loans']], [self.late[3].pk])
+        self.assertContains(resp, 'No borrower recorded')
+
+    def test_report_query_count_does_not_grow_with_loans(self):
+        self.client.login(username='librarian', password='12345')
+        self.client.get(reverse('overdue-report'))
+        # session, user, permissions (2), borrower count, page of borrowers,
+        # users, the borrowers' loans' ids, the loans and the total
+        with self.assertNumQueries(10):
+            self.client.get(reverse('overdue-report'))
+        for n in range(15):
+            BookInstance.objects.create(book=self.book, imprint='Imprint', status='o', borrower=self.bob,
+                due_back=self.today - datetime.timedelta(days=n + 1))
+        with self.assertNumQueries(10):
+            resp = self.client.get(reverse('overdue-report'))
+        self.assertEqual(len(resp.context['borrower_list'][0]['loans']), 10)
+        self.assertContains(resp, 'and 6 more')
+
+    def test_snapshot_command(self):
+        out = StringIO()
+        call_command('snapshot_overdue', stdout=out)
+        snapshot = OverdueSnapshot.objects.get()
+        self.assertEqual((snapshot.date, snapshot.overdue_loans, snapshot.overdue_borrowers, snapshot.loans),
+            (self.today, 4, 2, 7))
+        self.assertIn('4 loans', out.getvalue())
+        # running it again the same day replaces the day's snapshot
+        BookInstance.objects.filter(pk=self.late[0].pk).update(status='a')
+        call_command('snapshot_overdue', stdout=out)
+        self.assertEqual(OverdueSnapshot.objects.get().overdue_loans, 3)
+        call_command('snapshot_overdue', '--date', '2020-01-01', stdout=out)
+        self.assertEqual(OverdueSnapshot.objects.count(), 2)
@@ -0,0 +1,100 @@
+from django.test import TestCase
+
+import datetime
+from django.contrib.auth.models import Permission, User
+from django.core.urlresolvers import reverse
+from django.test import override_settings
+
+from catalog.models import Author, Book, BookInstance
+from catalog.pagination import decode_cursor, encode_cursor
+
+class CursorTest(TestCase):
+    
+    def test_cursor_round_trip(self):
+        fields = [BookInstance._meta.get_field('due_back'), BookInstance._meta.get_field('id')]
+        copy = BookInstance(due_back=datetime.date(2020, 1, 2))
+        cursor = encode_cursor('n', [copy.due_back, copy.id])
+        self.assertEqual(decode_cursor(cursor, fields), ('n', [copy.due_back, copy.id]))
+        
+    def test_malformed_cursor(self):
+        fields = [Book._meta.get_field('id')]
+        for cursor in ('', 'garbage', encode_cursor('x', [1]), encode_cursor('n', [1, 2])):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor, fields)
+                
+class BookListCursorPaginationTest(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='Test', last_name='Author')
+        # duplicate titles, so the id tie-breaker matters
+        for n in range(25):
+            Book.objects.create(title='Title %s' % (n // 2), summary='Summary', isbn='1234567890123', author=author)
+        cls.expected = list(Book.objects.order_by('title', 'id'))
+        
+    def walk(self, url):
+        """
+        Follows the next links from url, then the previous links back again
+        """
+        forwards, backwards, cursor = [], [], ''
+        while cursor is not None:
+            resp = self.client.get(url, {'cursor': cursor})
+            self.assertEqual(resp.status_code, 200)
+            self.assertIsNone(resp.context['paginator'])
+            forwards.append(list(resp.context['book_list']))
+            cursor = resp.context['page_obj'].next_cursor
+        page = resp.context['page_obj']
+        while page.previous_cursor is not None:
+            resp = self.client.get(url, {'cursor': page.previous_cursor})
+            page = resp.context['page_obj']
+            backwards.insert(0, list(resp.context['book_list']))
+        return forwards, backwards + forwards[-1:]
+        
+    def test_pages_cover_every_book_once_in_order(self):
+        forwards, backwards = self.walk(reverse('books'))
+        self.assertEqual([len(page) for page in forwards], [10, 10, 5])
+        self.assertEqual(sum(forwards, []), self.expected)
+        self.assertEqual(backwards, forwards)
+        
+    def test_cursor_pages_do_not_count(self):
+        # a single query for the page (with the authors joined), and no COUNT(*);
+        # the other three are the facet counts, which the tests don't cache
+        with self.assertNumQueries(4):
+            resp = self.client.get(reverse('books'), {'cursor': ''})
+        self.assertTrue(resp.context['is_paginated'])
+        self.assertTrue(resp.context['page_obj'].is_cursor)
+        self.assertContains(resp, 'cursor=%s' % resp.context['page_obj'].next_cursor)
+        
+    def test_offset_pagination_is_still_the_default(self):
+        resp = self.client.get(reverse('books'), {'page': 3})
+        self.assertEqual(list(resp.context['book_list']), self.expected[20:])
+        self.assertContains(resp, 'Page 3 of 3')
+        
+    @override_settings(CATALOG_PAGINATION_MODE='keyset')
+    def test_keyset_mode_setting(self):
+        resp = self.client.get(reverse('books'))
+        self.assertTrue(resp.context['page_obj'].is_cursor)
+        
+    def test_invalid_cursor_is_404(self):
+        resp = self.client.get(reverse('books'), {'cursor': 'garbage'})
+        self.assertEqual(resp.status_code, 404)
+        
+class LoanCursorPaginationTest(TestCase):
+    
+    def setUp(self):
+        librarian = User.objects.create_user(username='librarian', password='12345')
+        librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+        book = Book.objects.create(title='Test Book Title', summary='Summary', isbn='1234567890123')
+        # some loans without a due date, and several due on the same day
+        for n in range(23):
+            due_back = None if n % 7 == 0 else datetime.date.today() + datetime.timedelta(days=n % 3)
+            BookInstance.objects.create(book=book, imprint='Imprint', status='o', due_back=due_back)
+        self.client.login(username='librarian', password='12345')
+        
+    def test_pages_cover_every_loan_once_including_null_due_dates(self):
+        seen, cursor = [], ''
+        while cursor is not None:
+            resp = self.client.get(reverse('all-borrowed-books'), {'cursor': cursor})
+            seen.extend(resp.context['bookinstance_list'])
+            cursor = resp.context['page_obj'].next_cursor
+        self.assertEqual(seen, list(BookInstance.objects.order_by('due_back', 'id')))
@@ -0,0 +1,94 @@
+from django.test import TestCase
+
+import datetime
+import unittest
+import uuid
+from django.contrib.auth.models import User
+from django.db import connection
+
+from catalog.models import Author, Book, BookInstance
+from catalog.pagination import keyset_filter
+from catalog.queryplans import access_paths, explain, full_scans, queryset_full_scans, view_queryset
+from catalog.views import BookListView
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'query plans are read from SQLite EXPLAIN QUERY PLAN')
+class BookInstanceQueryPlanTest(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='John', last_name='Tolkien')
+        cls.book = Book.objects.create(title='The Hobbit', summary='', isbn='', author=cls.author)
+        cls.user = User.objects.create_user(username='borrower', password='12345')
+        BookInstance.objects.create(book=cls.book, imprint='Imprint', status='o', borrower=cls.user,
+            due_back=datetime.date.today() - datetime.timedelta(days=1))
+        
+    def test_no_access_path_scans_the_copies_table(self):
+        for name, queryset in access_paths(self.book, self.author, self.user).items():
+            with self.subTest(query=name):
+                self.assertEqual(queryset_full_scans(queryset), [], '%s: %s' % (name, '; '.join(explain(queryset))))
+                
+    def big_catalog_statistics(self):
+        """
+        Statistics as on a big catalog with a quarter of the copies on loan
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            cursor.execute("DELETE FROM sqlite_stat1 WHERE tbl = %s", [BookInstance._meta.db_table])
+            cursor.executemany("INSERT INTO sqlite_stat1 VALUES (%s, %s, %s)", [
+                (BookInstance._meta.db_table, 'copy_status_due_idx', '1000000 250000 2'),
+                (BookInstance._meta.db_table, 'copy_status_id_idx', '1000000 250000 1'),
+                (BookInstance._meta.db_table, 'sqlite_autoindex_catalog_bookinstance_1', '1000000 1')])
+            cursor.execute('ANALYZE sqlite_master')
+        self.addCleanup(self.forget_statistics)
+
+    def forget_statistics(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM sqlite_stat1')
+            cursor.execute('ANALYZE sqlite_master')
+
+    def test_limited_walks_past_a_filter_are_detected(self):
+        # SQLite walks the primary key and checks each copy's imprint on the way
+        scans = queryset_full_scans(BookInstance.objects.filter(imprint='Imprint').order_by('pk')[:5000])
+        self.assertEqual(len(scans), 1)
+        self.assertIn('USING INDEX sqlite_autoindex_catalog_bookinstance_1', scans[0])
+
+    def test_loans_export_walks_the_status_index(self):
+        self.big_catalog_statistics()
+        queryset = BookInstance.objects.filter(status__exact='o').order_by('pk').values_list(
+            'pk', 'book__title', 'imprint', 'status', 'due_back', 'borrower__username')
+        for page in (queryset[:5000], queryset.filter(pk__gt=uuid.UUID(int=0))[:5000]):
+            plan = explain(page)
+            self.assertEqual(queryset_full_scans(page), [], '; '.join(plan))
+            self.assertIn('copy_status_id_idx (status=?', plan[0])
+            self.assertFalse([line for line in plan if 'TEMP B-TREE' in line], '; '.join(plan))
+
+    def test_full_scans_are_detected(self):
+        self.assertEqual(full_scans(explain(BookInstance.objects.filter(imprint='Imprint').order_by())),
+            ['SCAN catalog_bookinstance'])
+        index_scan = ['SCAN TABLE catalog_bookinstance USING INDEX copy_status_due_idx']
+        self.assertEqual(full_scans(index_scan), index_scan)
+        self.assertEqual(full_scans(index_scan, limited=True), [])
+        self.assertEqual(full_scans(index_scan, limited=True, filtered=True), index_scan)
+        self.assertEqual(full_scans(['SEARCH catalog_bookinstance USING INDEX copy_status_due_idx (status=?)']), [])
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'query plans are read from SQLite EXPLAIN QUERY PLAN')
+class BookListQueryPlanTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader', password='12345')
+
+    def test_pages_are_read_off_the_title_index(self):
+        books = view_queryset(BookListView, self.user)
+        fields = [Book._meta.get_field(name) for name in BookListView.cursor_ordering]
+        pages = {
+            'first page': books[:11],
+            'next page': books.filter(keyset_filter(fields, ['The Hobbit', 5], '>'))[:11],
+            'previous page': books.filter(keyset_filter(fields, ['The Hobbit', 5], '<')).reverse()[:11],
+        }
+        for name, queryset in pages.items():
+            with self.subTest(page=name):
+                plan = explain(queryset)
+                self.assertIn('USING INDEX book_title_idx', '; '.join(plan))
+                self.assertFalse([line for line in plan if 'TEMP B-TREE' in line], '; '.join(plan))
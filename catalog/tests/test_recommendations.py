@@ -0,0 +1,104 @@
+from django.test import TestCase
+
+import random
+from unittest import mock, skipIf
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.utils.six import StringIO
+
+from catalog import recommendations
+from catalog.models import Author, Book, BookInstance, Genre, Hold, RecommendationRun, RelatedBook
+
+
+class RecommendationsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tolkien = Author.objects.create(first_name='John', last_name='Tolkien')
+        cls.herbert = Author.objects.create(first_name='Frank', last_name='Herbert')
+        cls.fantasy = Genre.objects.create(name='Fantasy')
+        cls.epic = Genre.objects.create(name='Epic')
+        cls.scifi = Genre.objects.create(name='Science Fiction')
+        cls.patron = User.objects.create_user(username='patron', password='12345')
+
+        def book(title, author, *genres):
+            book = Book.objects.create(title=title, summary='', isbn='', author=author)
+            book.genre.set(genres)
+            return book
+        cls.hobbit = book('The Hobbit', cls.tolkien, cls.fantasy)
+        cls.lotr = book('The Lord of the Rings', cls.tolkien, cls.fantasy, cls.epic)
+        cls.silmarillion = book('The Silmarillion', cls.tolkien, cls.epic)
+        cls.dune = book('Dune', cls.herbert, cls.scifi, cls.epic)
+        cls.earthsea = book('A Wizard of Earthsea', None, cls.fantasy)
+        cls.unrelated = book('Cookbook', None)
+        # the patron borrowed the hobbit and waits for dune
+        BookInstance.objects.create(book=cls.hobbit, status='o', borrower=cls.patron)
+        Hold.objects.create(book=cls.dune, patron=cls.patron)
+
+    def related(self, book):
+        return list(RelatedBook.objects.filter(book=book).values_list('related__title', 'score'))
+
+    def test_scores_and_ranks(self):
+        recommendations.recompute()
+        # author 2 + shared genres 1 each + co-borrowed 3, ties to the older book
+        self.assertEqual(self.related(self.hobbit), [
+            ('The Lord of the Rings', 3), ('Dune', 3), ('The Silmarillion', 2), ('A Wizard of Earthsea', 1)])
+        self.assertEqual(self.related(self.lotr)[:2], [('The Hobbit', 3), ('The Silmarillion', 3)])
+        self.assertEqual(self.related(self.unrelated), [])
+
+    def test_top_n(self):
+        recommendations.recompute(top_n=2)
+        self.assertEqual(len(self.related(self.hobbit)), 2)
+        # the silmarillion now outscores what dune lists
+        self.silmarillion.genre.add(self.scifi)
+        recommendations.recompute(incremental=True, top_n=2)
+        self.assertEqual(self.related(self.dune), [('The Hobbit', 3), ('The Silmarillion', 2)])
+
+    @skipIf(recommendations.np is None, 'NumPy is not installed')
+    def test_numpy_and_python_agree(self):
+        rng = random.Random(0)
+        genres = [Genre.objects.create(name='Genre %s' % n) for n in range(5)]
+        users = [User.objects.create_user(username='reader%s' % n) for n in range(5)]
+        for n in range(60):
+            book = Book.objects.create(title='Book %s' % n, summary='', isbn='',
+                author=rng.choice([self.tolkien, self.herbert, None]))
+            book.genre.set(rng.sample(genres, rng.randint(0, 3)))
+            if rng.random() < 0.5:
+                BookInstance.objects.create(book=book, status='o', borrower=rng.choice(users))
+        incidence = recommendations.load()
+        with mock.patch.object(recommendations, 'BLOCK_CELLS', 200):
+            vectorized = recommendations.top_related(incidence, incidence.book_ids)
+        with mock.patch.object(recommendations, 'np', None):
+            plain = recommendations.top_related(incidence, incidence.book_ids)
+        self.assertEqual(vectorized, plain)
+
+    def test_incremental_run(self):
+        recommendations.recompute()
+        run = recommendations.recompute(incremental=True)
+        self.assertEqual((run.books, run.recomputed), (6, 0))
+
+        self.dune.genre.add(self.fantasy)
+        run = recommendations.recompute(incremental=True)
+        # dune, and the books whose lists it is on or now gets onto; not the cookbook
+        self.assertEqual(run.recomputed, 5)
+        self.assertEqual(self.related(self.dune)[0], ('The Hobbit', 4))
+        self.assertIn(('Dune', 1), self.related(self.earthsea))
+        incremental = {book.pk: self.related(book) for book in Book.objects.all()}
+        recommendations.recompute()
+        self.assertEqual(incremental, {book.pk: self.related(book) for book in Book.objects.all()})
+
+    def test_book_page(self):
+        recommendations.recompute()
+        resp = self.client.get(reverse('book-detail', args=[self.hobbit.pk]))
+        self.assertContains(resp, 'More like this')
+        self.assertEqual([related.related for related in resp.context['related_books']][:2], [self.lotr, self.dune])
+
+    def test_command_records_timings(self):
+        out = StringIO()
+        call_command('recommend_books', stdout=out)
+        self.assertIn('for 6 of 6 books', out.getvalue())
+        run = RecommendationRun.objects.get()
+        self.assertFalse(run.incremental)
+        self.assertAlmostEqual(run.total_seconds, run.load_seconds + run.compute_seconds + run.store_seconds)
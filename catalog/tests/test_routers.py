@@ -0,0 +1,83 @@
+from django.test import TransactionTestCase
+
+import os
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import connections, router
+from django.test import override_settings
+from django.utils.six import StringIO
+
+from catalog import routers, visits
+from catalog.models import Author, Book
+
+@override_settings(CATALOG_REPLICAS={'ALIASES': ['replica'], 'STICKY_SECONDS': 15})
+class ReplicaRoutingTest(TransactionTestCase):
+    """
+    Against a second SQLite file standing in for the replica, brought up to date
+    with sync_replica
+    """
+
+    def setUp(self):
+        handle, self.replica_name = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        connections.databases['replica'] = dict(connections.databases['default'], NAME=self.replica_name)
+        self.author = Author.objects.create(first_name='John', last_name='Tolkien')
+        Book.objects.create(title='The Hobbit', summary='', isbn='', author=self.author)
+        User.objects.create_user(username='patron', password='12345')
+        call_command('sync_replica', stdout=StringIO())
+
+    def tearDown(self):
+        connections['replica'].close()
+        del connections.databases['replica']
+        delattr(connections._connections, 'replica')
+        os.remove(self.replica_name)
+
+    def test_browsing_reads_the_replica_until_it_catches_up(self):
+        Book.objects.create(title='Dune', summary='', isbn='', author=self.author)
+        resp = self.client.get(reverse('books'))
+        self.assertContains(resp, 'The Hobbit')
+        self.assertNotContains(resp, 'Dune')
+        self.assertNotContains(self.client.get(reverse('api-books')), 'Dune')
+        # pages that aren't marked read-only use the primary
+        self.client.login(username='patron', password='12345')
+        self.assertEqual(self.client.get(reverse('borrowed-books')).status_code, 200)
+        call_command('sync_replica', stdout=StringIO())
+        self.assertContains(self.client.get(reverse('books')), 'Dune')
+
+    @override_settings(CATALOG_VISIT_BUFFER={'FLUSH_EVERY': 100, 'FLUSH_INTERVAL': None})
+    def test_visit_counts_come_from_the_primary(self):
+        visits.reset_visit_buffer()
+        self.addCleanup(visits.reset_visit_buffer)
+        for visit in range(3):
+            self.assertEqual(self.client.get(reverse('index')).context['num_visits'], visit)
+        # flushed to the primary, which the replica hasn't caught up with
+        visits.get_visit_buffer().flush()
+        self.assertEqual(self.client.get(reverse('index')).context['num_visits'], 3)
+
+    def test_a_visitor_who_wrote_reads_the_primary(self):
+        self.client.login(username='patron', password='12345')
+        book = Book.objects.get(title='The Hobbit')
+        resp = self.client.post(reverse('hold-book', args=[book.pk]))
+        self.assertEqual(resp.cookies[routers.PIN_COOKIE]['max-age'], 15)
+        Book.objects.create(title='Dune', summary='', isbn='', author=self.author)
+        self.assertContains(self.client.get(reverse('books')), 'Dune')
+        # anyone else still gets the replica
+        self.client.cookies.pop(routers.PIN_COOKIE)
+        self.assertNotContains(self.client.get(reverse('books')), 'Dune')
+
+    def test_writes_and_migrations_go_to_the_primary(self):
+        routers.start_request()
+        routers.use_replica('replica')
+        try:
+            self.assertEqual(router.db_for_read(Book), 'replica')
+            self.assertEqual(router.db_for_read(User), 'default')
+            self.assertEqual(router.db_for_write(Book), 'default')
+            # and once the request has written, so do its reads
+            self.assertEqual(router.db_for_read(Book), 'default')
+        finally:
+            routers.start_request()
+        self.assertFalse(router.allow_migrate('replica', 'catalog'))
+        self.assertTrue(router.allow_migrate('default', 'catalog'))
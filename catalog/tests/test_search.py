@@ -0,0 +1,104 @@
+from django.test import TestCase
+
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import OperationalError, connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.six import StringIO
+from unittest import mock
+
+from catalog import search
+from catalog.models import Author, Book
+from catalog.search import match_expression, search_books, FTS_TABLE
+
+class SearchTest(TestCase):
+    
+    def setUp(self):
+        self.tolkien = Author.objects.create(first_name='John', last_name='Tolkien')
+        self.hobbit = Book.objects.create(title='The Hobbit', summary='There and back again', isbn='9780261102217',
+            author=self.tolkien)
+        self.rings = Book.objects.create(title='The Lord of the Rings', summary='One ring to rule them all, and a hobbit',
+            isbn='9780261103252', author=self.tolkien)
+        self.other = Book.objects.create(title='Dune', summary='Spice', isbn='9780441172719')
+        
+    def search(self, query):
+        return list(search_books(query)[:10])
+        
+    def test_match_expression(self):
+        self.assertEqual(match_expression('The  hob'), '"the" "hob"*')
+        self.assertEqual(match_expression('"; DROP TABLE x --'), '"drop" "table" "x"*')
+        self.assertEqual(match_expression('!!!'), '')
+        
+    def test_title_matches_rank_first(self):
+        self.assertEqual(self.search('hobbit'), [self.hobbit, self.rings])
+        
+    def test_searches_isbn_author_and_prefixes(self):
+        self.assertEqual(self.search('9780441172719'), [self.other])
+        self.assertEqual(set(self.search('tolk')), {self.hobbit, self.rings})
+        self.assertEqual(search_books('tolkien').count(), 2)
+        self.assertEqual(self.search(''), [])
+        
+    def test_index_follows_changes(self):
+        self.other.title = 'Children of Dune'
+        self.other.author = self.tolkien
+        self.other.save()
+        self.assertEqual(self.search('children'), [self.other])
+        self.tolkien.last_name = 'Herbert'
+        self.tolkien.save()
+        self.assertEqual(search_books('tolkien').count(), 0)
+        self.assertEqual(search_books('herbert').count(), 3)
+        self.tolkien.delete()
+        self.assertEqual(search_books('herbert').count(), 0)
+        self.hobbit.delete()
+        self.assertEqual(self.search('hobbit'), [self.rings])
+        
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s' % FTS_TABLE)
+        self.assertEqual(self.search('dune'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 3 books', out.getvalue())
+        self.assertEqual(self.search('dune'), [self.other])
+        
+    def test_search_view_is_paginated(self):
+        for n in range(12):
+            Book.objects.create(title='Hobbit sequel %s' % n, summary='More', isbn='1', author=self.tolkien)
+        resp = self.client.get(reverse('search'), {'q': 'hobbit'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertTemplateUsed(resp, 'catalog/book_search.html')
+        self.assertTrue(resp.context['is_paginated'])
+        self.assertEqual(resp.context['paginator'].count, 14)
+        resp = self.client.get(reverse('search'), {'q': 'hobbit', 'page': 2})
+        self.assertEqual(len(resp.context['book_list']), 4)
+        self.assertContains(resp, 'q=hobbit')
+        
+    def test_probes_for_fts5(self):
+        self.assertTrue(search.has_fts5(connection))
+        # an SQLite built without FTS5, which can't load it either
+        cursor = mock.MagicMock()
+        cursor.fetchone.return_value = (0,)
+        def execute(sql, params=None):
+            if 'fts5(' in sql:
+                raise OperationalError('no such module: fts5')
+        cursor.execute.side_effect = execute
+        without = mock.MagicMock(vendor='sqlite', alias='without-fts5')
+        without.cursor.return_value.__enter__.return_value = cursor
+        self.assertFalse(search.has_fts5(without))
+        cursor.execute.reset_mock()
+        with mock.patch.dict(search._fts5):
+            self.assertFalse(search.search_available(without))
+            self.assertEqual(search._fts5['without-fts5'], False)
+            # the answer is kept
+            self.assertFalse(search.search_available(without))
+            self.assertEqual(cursor.execute.call_count, 2)
+        
+    def test_falls_back_without_fts5(self):
+        with mock.patch.dict(search._fts5, {connection.alias: False}):
+            with CaptureQueriesContext(connection) as queries:
+                Book.objects.create(title='The Silmarillion', summary='', isbn='', author=self.tolkien)
+                self.assertEqual(self.search('silmarillion'), [Book.objects.get(title='The Silmarillion')])
+                self.assertEqual(search_books('tolkien').count(), 3)
+                with connection.schema_editor() as schema_editor:
+                    search.create_index(schema_editor)
+            self.assertFalse([query for query in queries if FTS_TABLE in query['sql']])
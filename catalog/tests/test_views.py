@@ -43,7 +43,7 @@ class AuthorListViewTest(TestCase):
     
 from django.utils import timezone
 
-from catalog.models import BookInstance, Book, Genre, Language
+from catalog.models import BookInstance, Book, Genre, Language, CatalogStats, VisitCount
 from django.contrib.auth.models import User # required to assign User as borrower
 import datetime
 
@@ -154,6 +154,62 @@ class LoanedBookInstancesByUserListViewTest(TestCase):
                 else:
                     self.assertTrue(last_date <= copy.due_back)
             
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from catalog.visits import get_visit_buffer, reset_visit_buffer
+
+@override_settings(CATALOG_VISIT_BUFFER={'FLUSH_EVERY': 100, 'FLUSH_INTERVAL': None})
+class IndexViewTest(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        test_language = Language.objects.create(name='English')
+        test_author = Author.objects.create(first_name='Test', last_name='Author')
+        test_book = Book.objects.create(title='Test Book Title', summary='A test book summary', isbn='1234567890123',
+            author=test_author, language=test_language)
+        BookInstance.objects.create(book=test_book, imprint='Test Imprint', status='a')
+        BookInstance.objects.create(book=test_book, imprint='Test Imprint', status='o')
+        
+    def tearDown(self):
+        # flush buffered visits while this test's transaction is still open,
+        # so they get rolled back with it
+        reset_visit_buffer()
+        
+    def test_counts_come_from_stats_row(self):
+        resp = self.client.get(reverse('index'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.context['num_books'], 1)
+        self.assertEqual(resp.context['num_instances'], 2)
+        self.assertEqual(resp.context['num_instances_available'], 1)
+        self.assertEqual(resp.context['num_authors'], 1)
+        self.assertEqual(resp.context['num_books_english'], 1)
+        
+    def test_counts_use_a_single_query(self):
+        CatalogStats.load()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('index'))
+        # ignore the session bookkeeping, only the catalog tables matter here
+        catalog_queries = [q['sql'] for q in queries.captured_queries if 'catalog_' in q['sql']]
+        self.assertEqual(len(catalog_queries), 2) # stats row and the visitor's stored visit count
+        
+    def test_visits_are_counted_without_session_writes(self):
+        with CaptureQueriesContext(connection) as queries:
+            for visit in range(3):
+                resp = self.client.get(reverse('index'))
+                self.assertEqual(resp.context['num_visits'], visit)
+        self.assertFalse([q for q in queries.captured_queries if 'django_session' in q['sql']])
+        # the buffer writes the hits out once it is flushed
+        get_visit_buffer().flush()
+        self.assertEqual(VisitCount.objects.get().count, 3)
+        
+    def test_logged_in_visits_are_counted_per_user(self):
+        User.objects.create_user(username='visitor', password='12345')
+        self.client.login(username='visitor', password='12345')
+        self.client.get(reverse('index'))
+        get_visit_buffer().flush()
+        self.assertEqual(VisitCount.objects.get().key, 'user:%s' % User.objects.get(username='visitor').pk)
+            
 from django.contrib.auth.models import Permission
         
 class RenewBookInstancesViewTest(TestCase):
@@ -250,4 +306,80 @@ class RenewBookInstancesViewTest(TestCase):
         resp = self.client.post(reverse('renew-book-librarian', kwargs={'pk':self.test_bookinstance1.pk,}),
         {'renewal_date':valid_date_in_future}, follow=True)
         
-        self.assertRedirects(resp, reverse('all-borrowed-books'))
\ No newline at end of file
+        self.assertRedirects(resp, reverse('all-borrowed-books'))
+
+
+class BookDetailViewTest(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        test_author = Author.objects.create(first_name='Test', last_name='Author')
+        test_language = Language.objects.create(name='English')
+        cls.test_book = Book.objects.create(title='Test Book Title', summary='A test book summary', isbn='1234567890123',
+            author=test_author, language=test_language)
+            
+    def add_copies_and_genres(self, number):
+        for n in range(number):
+            BookInstance.objects.create(book=self.test_book, imprint='Test Imprint', status='ao'[n % 2])
+            self.test_book.genre.add(Genre.objects.create(name='Genre %s' % n))
+            
+    def get_detail(self):
+        return self.client.get(reverse('book-detail', kwargs={'pk': self.test_book.pk}))
+        
+    def test_shows_status_counts(self):
+        self.add_copies_and_genres(3)
+        resp = self.get_detail()
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.context['status_counts'], [('On Loan', 1), ('Available', 2)])
+        
+    def test_query_count_does_not_grow_with_copies_or_genres(self):
+        # book with author, language and status counts, genres, copies, related books
+        self.add_copies_and_genres(1)
+        with self.assertNumQueries(4):
+            self.get_detail()
+        self.add_copies_and_genres(30)
+        with self.assertNumQueries(4):
+            self.get_detail()
+        
+class AuthorDetailViewTest(TestCase):
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.test_author = Author.objects.create(first_name='Test', last_name='Author')
+        
+    def add_books(self, number):
+        for n in range(number):
+            book = Book.objects.create(title='Book %03d' % Book.objects.count(), summary='A test book summary',
+                isbn='1234567890123', author=self.test_author)
+            BookInstance.objects.create(book=book, imprint='Test Imprint', status='a')
+            BookInstance.objects.create(book=book, imprint='Test Imprint', status='o')
+            
+    def get_detail(self, page=None):
+        url = reverse('author-detail', kwargs={'pk': self.test_author.pk})
+        return self.client.get(url + ('?page=%s' % page if page else ''))
+        
+    def test_books_are_annotated_with_copy_counts(self):
+        self.add_books(1)
+        resp = self.get_detail()
+        self.assertEqual(resp.status_code, 200)
+        book = resp.context['book_list'][0]
+        self.assertEqual(book.num_copies, 2)
+        self.assertEqual(book.num_available, 1)
+        
+    def test_book_list_is_paginated(self):
+        self.add_books(13)
+        resp = self.get_detail()
+        self.assertTrue(resp.context['is_paginated'])
+        self.assertEqual(len(resp.context['book_list']), 10)
+        resp = self.get_detail(page=2)
+        self.assertEqual(len(resp.context['book_list']), 3)
+        self.assertEqual(self.get_detail(page=3).status_code, 404)
+        
+    def test_query_count_does_not_grow_with_books(self):
+        # author, count for the paginator, annotated page of books
+        self.add_books(2)
+        with self.assertNumQueries(3):
+            self.get_detail()
+        self.add_books(20)
+        with self.assertNumQueries(3):
+            self.get_detail()
@@ -0,0 +1,52 @@
+from django.test import TestCase
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from catalog.models import VisitCount
+from catalog.visits import VisitBuffer
+
+class VisitBufferTest(TestCase):
+    
+    def test_hits_are_buffered_until_flush_every(self):
+        buffer = VisitBuffer(flush_every=3, flush_interval=None)
+        buffer.record('visitor:a')
+        buffer.record('visitor:b')
+        self.assertFalse(VisitCount.objects.exists())
+        buffer.record('visitor:a')
+        self.assertEqual(VisitCount.objects.get(key='visitor:a').count, 2)
+        self.assertEqual(VisitCount.objects.get(key='visitor:b').count, 1)
+        
+    def test_count_includes_pending_hits(self):
+        buffer = VisitBuffer(flush_every=100, flush_interval=None)
+        VisitCount.objects.create(key='visitor:a', count=5)
+        buffer.record('visitor:a')
+        buffer.record('visitor:a')
+        self.assertEqual(buffer.count('visitor:a'), 7)
+        self.assertEqual(buffer.count('visitor:z'), 0)
+        
+    def test_flush_adds_to_existing_counts(self):
+        buffer = VisitBuffer(flush_every=100, flush_interval=None)
+        VisitCount.objects.create(key='visitor:a', count=5)
+        for _ in range(4):
+            buffer.record('visitor:a')
+        self.assertEqual(buffer.flush(), 4)
+        self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(VisitCount.objects.get(key='visitor:a').count, 9)
+        
+    def writes(self, queries):
+        return [q['sql'] for q in queries.captured_queries if q['sql'].startswith(('INSERT', 'UPDATE'))]
+        
+    def test_flush_writes_once_per_visitor(self):
+        buffer = VisitBuffer(flush_every=1000, flush_interval=None)
+        for n in range(50):
+            buffer.record('visitor:%s' % (n % 5))
+        # one UPDATE (plus an INSERT the first time) per visitor rather than one per hit
+        with CaptureQueriesContext(connection) as queries:
+            buffer.flush()
+        self.assertEqual(len(self.writes(queries)), 10)
+        with CaptureQueriesContext(connection) as queries:
+            for n in range(50):
+                buffer.record('visitor:%s' % (n % 5))
+            buffer.flush()
+        self.assertEqual(len(self.writes(queries)), 5)
@@ -1,19 +1,24 @@
 from django.conf.urls import url
 
-from . import views
+from . import api, views
 
 urlpatterns = [
     url(r'^$', views.index, name='index'),
     url(r'^books/$', views.BookListView.as_view(), name='books'),
+    url(r'^search/$', views.BookSearchView.as_view(), name='search'),
     url(r'^book/(?P<pk>\d+)$', views.BookDetailView.as_view(), name='book-detail'),
     url(r'^authors/$', views.AuthorListView.as_view(), name='authors'),
     url(r'^author/(?P<pk>\d+)$', views.AuthorDetailView.as_view(), name='author-detail'),
     url(r'^mybooks/$', views.LoanedBooksByUserListView.as_view(), name='borrowed-books'),
     url(r'^borrowed/$', views.AllBooksLoanedListView.as_view(), name='all-borrowed-books'),
+    url(r'^overdue/$', views.OverdueReportView.as_view(), name='overdue-report'),
+    url(r'^stats/circulation/$', views.CirculationStatsView.as_view(), name='circulation-stats'),
 ]
 
 urlpatterns += [
     url(r'^book/(?P<pk>[-\w]+)/renew/$', views.renew_book_librarian, name='renew-book-librarian'),
+    url(r'^borrowed/bulk/$', views.bulk_update_loans, name='bulk-update-loans'),
+    url(r'^book/(?P<pk>\d+)/hold/$', views.hold_book, name='hold-book'),
 ]
 
 urlpatterns += [
@@ -26,4 +31,20 @@ urlpatterns += [
     url(r'^book/create/$', views.BookCreate.as_view(), name='book-create'),
     url(r'^book/(?P<pk>\d+)/update/$', views.BookUpdate.as_view(), name='book-update'),
     url(r'^book/(?P<pk>\d+)/delete/$', views.BookDelete.as_view(), name='book-deete'),
-]
\ No newline at end of file
+]
+
+urlpatterns += [
+    url(r'^export/(?P<table>books|copies|loans)\.(?P<fmt>csv|jsonl)(?P<compress>\.gz)?$', views.export_catalog, name='export-catalog'),
+]
+
+urlpatterns += [
+    url(r'^api/books/$', api.book_list, name='api-books'),
+    url(r'^api/books/(?P<pk>\d+)/$', api.book_detail, name='api-book-detail'),
+    url(r'^api/authors/$', api.author_list, name='api-authors'),
+    url(r'^api/authors/(?P<pk>\d+)/$', api.author_detail, name='api-author-detail'),
+    url(r'^api/copies/$', api.copy_list, name='api-copies'),
+    url(r'^api/copies/(?P<pk>[-\w]+)/$', api.copy_detail, name='api-copy-detail'),
+    url(r'^api/availability/$', api.availability_list, name='api-availability'),
+    url(r'^api/availability/(?P<pk>\d+)/$', api.availability_detail, name='api-availability-detail'),
+    url(r'^api/autocomplete/$', api.autocomplete_list, name='api-autocomplete'),
+]
@@ -1,72 +1,201 @@
 from django.shortcuts import render
 
-from .models import Book, Author, BookInstance, Genre
+from .models import Book, Author, BookAvailability, BookInstance, Genre, CatalogStats, Hold
+from .middleware import query_budget
+from .routers import read_replica
+from .visits import get_visit_buffer, visitor_key, VISITOR_COOKIE, VISITOR_COOKIE_AGE
 
+@query_budget(6)
+@read_replica
 def index(request):
     """
     A barebones home page
     """
-    # Generate counts of some of the main objects
-    num_books = Book.objects.all().count()
-    num_instances = BookInstance.objects.all().count()
-    # Available books
-    num_instances_available = BookInstance.objects.filter(status__exact='a').count()
-    num_authors = Author.objects.all().count()
-    num_books_english = Book.objects.filter(language__name='English').count()
+    # Counts of the main objects come from the precomputed stats row
+    # (one query instead of five COUNT(*)s over the big tables)
+    stats = CatalogStats.load()
     
-    # Number of visits to this view, counted in sessions variable
-    num_visits = request.session.get('num_visits', 0)
-    request.session['num_visits'] = num_visits + 1
+    # Number of visits to this view, counted in memory and written in batches
+    # (see catalog.visits) so the page doesn't write to the session every time
+    visits = get_visit_buffer()
+    visit_key, new_visitor_id = visitor_key(request)
+    num_visits = visits.count(visit_key)
+    visits.record(visit_key)
     
     # Render the HTML
-    return render(
+    response = render(
         request,
         'index.html', 
-        context = {'num_books':num_books, 'num_instances': num_instances, 'num_instances_available': num_instances_available, 'num_authors': num_authors, 'num_books_english': num_books_english,
+        context = {'num_books': stats.num_books, 'num_instances': stats.num_instances, 'num_instances_available': stats.num_instances_available, 'num_authors': stats.num_authors, 'num_books_english': stats.num_books_english,
             'num_visits': num_visits,
         },
     )
+    if new_visitor_id:
+        response.set_signed_cookie(VISITOR_COOKIE, new_visitor_id, max_age=VISITOR_COOKIE_AGE, httponly=True)
+    return response
     
 from django.views import generic
 
-class BookListView(generic.ListView):
+from .pagination import CursorPaginationMixin
+
+from . import facets
+
+class BookListView(CursorPaginationMixin, generic.ListView):
     model = Book
     paginate_by = 10
+    cursor_ordering = ('title', 'id')
+    query_budget = 9
+    read_replica = True
     
-    # we could also just set the 'queryset' property but this gives us more flexibility
-    # only list top 5
-    # (removing because we can paginate now)
-    #def get_queryset(self):
-    #    return Book.objects.all()[:5]
+    def get_queryset(self):
+        # filtered by the facets chosen (see catalog.facets); the list shows each
+        # book's author and how many of its copies are available
+        self.filters = facets.parse_filters(self.request.GET)
+        return facets.apply_filters(Book.objects.select_related('author', 'availability'), self.filters)
+        
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # one aggregate per dimension, each cached until books or copies change
+        counts = facets.facet_counts(Book.objects.all(), self.filters)
+        context['facets'] = [(dimension, self.filters.get(dimension), counts[dimension])
+                             for dimension in facets.DIMENSIONS]
+        context['filtered'] = bool(self.filters)
+        return context
         
+from django.db.models import Count
+
 class BookDetailView(generic.DetailView):
     model = Book # shorthand for queryset = Book.objects.all()
     paginate_by = 10
+    query_budget = 7
+    read_replica = True
+    
+    def get_queryset(self):
+        # author, language and the copy counts come along in the same query
+        return Book.objects.select_related('author', 'language', 'availability')
+        
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # genres and copies are one query each, however many there are, and are
+        # only run when the page isn't in the fragment cache
+        context['copies'] = self.object.bookinstance_set.order_by('due_back', 'id')
+        context['status_counts'] = self.get_status_counts()
+        # precomputed by `manage.py recommend_books`, see catalog.recommendations
+        context['related_books'] = self.object.related_books.select_related('related').order_by('rank')
+        return context
+        
+    def get_status_counts(self):
+        # how many copies are in each status, from the book's availability summary
+        try:
+            return self.object.availability.status_counts()
+        except BookAvailability.DoesNotExist:
+            return []
     
-class AuthorListView(generic.ListView):
+class AuthorListView(CursorPaginationMixin, generic.ListView):
     model = Author # shorthand for queryset = Author.objects.all()
     paginate_by = 10
+    cursor_ordering = ('last_name', 'first_name', 'id')
+    query_budget = 6
+    read_replica = True
     
+from django.core.paginator import Paginator, InvalidPage
+from django.db.models import Case, IntegerField, Sum, When
+from django.http import Http404
+
 class AuthorDetailView(generic.DetailView):
     model = Author # shorthand for queryset = Author.objects.all()
     paginate_by = 10
+    query_budget = 7
+    read_replica = True
+    
+    def get_books(self):
+        """
+        The author's books, each annotated with its number of copies and available
+        copies, all from a single query per page
+        """
+        return self.object.book_set.order_by('title', 'id').annotate(
+            num_copies=Count('bookinstance'),
+            num_available=Sum(Case(When(bookinstance__status='a', then=1), default=0, output_field=IntegerField())),
+        )
+        
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # paginate the book list the same way ListView does
+        paginator = Paginator(self.get_books(), self.paginate_by)
+        try:
+            page = paginator.page(self.request.GET.get('page') or 1)
+        except InvalidPage as e:
+            raise Http404('Invalid page: %s' % e)
+        context.update({
+            'paginator': paginator,
+            'page_obj': page,
+            'is_paginated': page.has_other_pages(),
+            'book_list': page.object_list,
+        })
+        return context
+    
+from .search import search_books
+
+class BookSearchView(generic.ListView):
+    """
+    Full-text search over titles, summaries, ISBNs and author names, best matches first
+    """
+    template_name = 'catalog/book_search.html'
+    context_object_name = 'book_list'
+    paginate_by = 10
+    query_budget = 5
+    read_replica = True
+    
+    def get_queryset(self):
+        return search_books(self.request.GET.get('q', ''))
+        
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.request.GET.get('q', '')
+        return context
     
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db.models import F
+from django.utils.functional import SimpleLazyObject
 
-class LoanedBooksByUserListView(LoginRequiredMixin, generic.ListView):
+class LoanedBooksByUserListView(LoginRequiredMixin, CursorPaginationMixin, generic.ListView):
     """
     Generic class-based view listing books on loan to logged-in user.
     """
     model = BookInstance
     template_name = 'catalog/bookinstance_list_borrowed_user.html'
     paginate_by = 10
+    cursor_ordering = ('due_back', 'id')
+    query_budget = 6
     
     def get_queryset(self):
-        return BookInstance.objects.filter(borrower = self.request.user).filter(status__exact='o').order_by('due_back')
+        return (BookInstance.objects.filter(borrower = self.request.user).on_loan().with_overdue()
+            .select_related('book').order_by('due_back'))
+
+    def uses_cursor_pagination(self):
+        # no COUNT(*), so rendering the list is a single query
+        return True
+
+    def get_paginate_by(self, queryset):
+        # paginated in the template instead, see get_context_data
+        return None
+        
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # the list of loans is cached per borrower (see catalog.fragments), so the
+        # page of loans is only read when the cached copy has to be rendered again
+        context['loan_page'] = SimpleLazyObject(lambda: self.paginate_queryset(self.object_list, self.paginate_by)[1])
+        context['cursor'] = self.request.GET.get(self.cursor_param, '')
+        # which loans are overdue changes at midnight
+        context['today'] = datetime.date.today()
+        # the user's holds, ready to collect first
+        context['hold_list'] = (Hold.objects.filter(patron=self.request.user).select_related('book', 'copy')
+            .order_by(F('ready').desc(nulls_last=True), 'placed'))
+        return context
 
 from django.contrib.auth.mixins import PermissionRequiredMixin
 
-class AllBooksLoanedListView(PermissionRequiredMixin, LoginRequiredMixin, generic.ListView):
+class AllBooksLoanedListView(PermissionRequiredMixin, LoginRequiredMixin, CursorPaginationMixin, generic.ListView):
     """
     Generic class-based view listing ALL books on loan (for librarian eyes only).
     """
@@ -74,9 +203,99 @@ class AllBooksLoanedListView(PermissionRequiredMixin, LoginRequiredMixin, generi
     model = BookInstance
     template_name = 'catalog/bookinstance_list_borrowed_all.html'
     paginate_by = 10
+    cursor_ordering = ('due_back', 'id')
+    query_budget = 6
+    
+    def get_queryset(self):
+        return BookInstance.objects.on_loan().with_overdue().select_related('book', 'borrower').order_by('due_back')
+        
+from django.contrib.auth.models import User
+from django.db.models import Q
+
+class OverdueReportView(PermissionRequiredMixin, LoginRequiredMixin, generic.ListView):
+    """
+    Overdue loans grouped by borrower, borrowers with the most overdue loans first
+    (for librarian eyes only). Each borrower shows their longest overdue loans,
+    read for the whole page at once, so the number of queries doesn't depend on
+    the page size or on how many loans there are.
+    """
+    permission_required = ('catalog.can_mark_returned', )
+    template_name = 'catalog/overdue_report.html'
+    context_object_name = 'borrower_list'
+    paginate_by = 20
+    loans_per_borrower = 10
+    # session, user, permissions (2), borrower count, page of borrowers, users,
+    # their loans' ids, the loans and the total
+    query_budget = 10
     
     def get_queryset(self):
-        return BookInstance.objects.filter(status__exact='o').order_by('due_back')
+        return BookInstance.objects.overdue_by_borrower()
+        
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        groups = list(context['borrower_list'])
+        borrower_ids = [group['borrower'] for group in groups if group['borrower'] is not None]
+        users = User.objects.in_bulk(borrower_ids)
+        # the overdue loans of every borrower on the page, grouped here; only
+        # their ids, and then the copies each borrower has room for
+        on_page = Q(borrower_id__in=borrower_ids)
+        if len(borrower_ids) < len(groups):
+            on_page |= Q(borrower__isnull=True)
+        overdue = BookInstance.objects.overdue().filter(on_page).order_by('due_back', 'id')
+        wanted = {group['borrower']: [] for group in groups}
+        for borrower_id, pk in overdue.values_list('borrower_id', 'id').iterator():
+            if len(wanted[borrower_id]) < self.loans_per_borrower:
+                wanted[borrower_id].append(pk)
+        copies = BookInstance.objects.select_related('book').in_bulk([pk for pks in wanted.values() for pk in pks])
+        loans = {borrower_id: [copies[pk] for pk in pks] for borrower_id, pks in wanted.items()}
+        for group in groups:
+            group['user'] = users.get(group['borrower'])
+            group['loans'] = loans[group['borrower']]
+            group['more_loans'] = group['overdue_loans'] - len(group['loans'])
+        context['borrower_list'] = groups
+        context['total_overdue'] = BookInstance.objects.overdue().count()
+        return context
+        
+from .models import DailyBookLoans, DailyGenreLoans, DailyLoans, LoanRollupMark
+
+class CirculationStatsView(PermissionRequiredMixin, LoginRequiredMixin, generic.TemplateView):
+    """
+    Checkouts, renewals and returns per day over the last few weeks, and the
+    books and genres lent most (for librarian eyes only). Reads only the daily
+    rollups written by `manage.py rollup_loans`, never the loan event log.
+    """
+    permission_required = ('catalog.can_mark_returned', )
+    template_name = 'catalog/circulation_stats.html'
+    days = 30
+    max_days = 366
+    top = 10
+    query_budget = 10
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        try:
+            days = min(max(int(self.request.GET.get('days', self.days)), 1), self.max_days)
+        except ValueError:
+            days = self.days
+        today = datetime.date.today()
+        since = today - datetime.timedelta(days=days - 1)
+        counted = ('checkouts', 'renewals', 'returns')
+        daily = {row.date: row for row in DailyLoans.objects.filter(date__gte=since)}
+        # every day of the range, the quiet ones too
+        context['daily'] = [daily.get(day) or DailyLoans(date=day)
+                            for day in (today - datetime.timedelta(days=n) for n in range(days))]
+        context['totals'] = {name: sum(getattr(row, name) for row in daily.values()) for name in counted}
+        # named apart from the fields they add up
+        sums = {'checked_out': Sum('checkouts'), 'renewed': Sum('renewals'), 'returned': Sum('returns')}
+        context['top_books'] = (DailyBookLoans.objects.filter(date__gte=since).order_by()
+                                .values('book', 'book__title').annotate(**sums)
+                                .order_by('-checked_out', 'book__title')[:self.top])
+        context['top_genres'] = (DailyGenreLoans.objects.filter(date__gte=since).order_by()
+                                 .values('genre', 'genre__name').annotate(**sums)
+                                 .order_by('-checked_out', 'genre__name')[:self.top])
+        context['days'] = days
+        context['mark'] = LoanRollupMark.objects.filter(pk=1).first()
+        return context
         
 from django.contrib.auth.decorators import permission_required
 
@@ -87,6 +306,7 @@ import datetime
 
 from .forms import RenewalBookForm
 
+@query_budget(12)
 @permission_required('catalog.can_renew')
 def renew_book_librarian(request, pk):
     """
@@ -118,6 +338,65 @@ def renew_book_librarian(request, pk):
     # done
     return render(request, 'catalog/book_renew_librarian.html', {'form': form, 'bookinst': book_inst})
 
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponseBadRequest
+from django.views.decorators.http import require_POST
+
+from . import loans
+
+@query_budget(15)
+@permission_required('catalog.can_mark_returned')
+@require_POST
+def bulk_update_loans(request):
+    """
+    View function renewing (to one date) or marking returned all the loans ticked
+    on the all borrowed books page, each change in a single UPDATE
+    """
+    copy_ids = request.POST.getlist('copy')
+    action = request.POST.get('action')
+    form = None
+    if action == 'renew':
+        if not request.user.has_perm('catalog.can_renew'):
+            raise PermissionDenied
+        # the same date rules as renewing one copy
+        form = RenewalBookForm(request.POST)
+        outcomes = loans.renew(copy_ids, form.cleaned_data['renewal_date']) if form.is_valid() else []
+    elif action == 'return':
+        outcomes = loans.mark_returned(copy_ids)
+    else:
+        return HttpResponseBadRequest('Unknown action')
+    
+    return render(request, 'catalog/bulk_loan_results.html', {
+        'action': action,
+        'form': form,
+        'results': loans.with_copies(outcomes),
+        'counts': sorted(loans.summarize(outcomes).items()),
+    })
+
+from django.contrib.auth.decorators import login_required
+
+from . import holds
+
+@query_budget(21)
+@login_required
+@require_POST
+def hold_book(request, pk):
+    """
+    View function placing (or, with action=cancel, cancelling) the user's hold
+    on a book, then showing their holds on their borrowed books page
+    """
+    book = get_object_or_404(Book, pk=pk)
+    action = request.POST.get('action', 'place')
+    if action == 'place':
+        holds.place(book, request.user)
+    elif action == 'cancel':
+        hold = Hold.objects.filter(book=book, patron=request.user).first()
+        if hold is not None:
+            holds.cancel(hold)
+    else:
+        return HttpResponseBadRequest('Unknown action')
+    return HttpResponseRedirect(reverse('borrowed-books'))
+
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 from django.core.urlresolvers import reverse_lazy
 from .models import Author
@@ -127,12 +406,16 @@ class AuthorCreate(PermissionRequiredMixin, CreateView):
     model = Author
     fields = '__all__'
     initial = { 'date_of_death': None, }
+    query_budget = 7
         
 class AuthorUpdate(PermissionRequiredMixin, UpdateView):
     permission_required = ('catalog.change_author',)
     model = Author
     fields = ['first_name', 'last_name', 'date_of_birth', 'date_of_death',]
+    query_budget = 10
     
+# No budget for the delete views: deleting cascades to the copies, and each
+# deleted row sends its own signals.
 class AuthorDelete(PermissionRequiredMixin, DeleteView):
     permission_required = ('catalog.delete_author',)
     model = Author
@@ -142,13 +425,41 @@ class BookCreate(PermissionRequiredMixin, CreateView):
     permission_required = ('catalog.add_book',)
     model = Book
     fields = '__all__'
+    # the session and user, the form's five lookups, the insert with its stats,
+    # search index and version updates (6), and setting the genres (4)
+    query_budget = 17
     
 class BookUpdate(PermissionRequiredMixin, UpdateView):
     permission_required = ('catalog.change_book',)
     model = Book
     fields = '__all__'
+    # the session, user and book, the form's six lookups, the update with the old
+    # row, search index and version (5), the pages it invalidates (2), and
+    # swapping genres, some removed and others added (7)
+    query_budget = 23
     
 class BookDelete(PermissionRequiredMixin, DeleteView):
     permission_required = ('catalog.delete_book',)
     model = Book
     success_url = reverse_lazy('books')
+    
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import StreamingHttpResponse
+
+from . import export
+
+@query_budget(4)
+@staff_member_required
+def export_catalog(request, table, fmt, compress):
+    """
+    Streams a whole table out as CSV or JSON Lines (gzipped if the URL ends in .gz),
+    a chunk at a time, for the data warehouse
+    """
+    compress = bool(compress)
+    response = StreamingHttpResponse(export.export(table, fmt, compress), content_type=export.content_type(fmt))
+    filename = '%s.%s%s' % (table, fmt, '.gz' if compress else '')
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    if compress:
+        # the body is already a .gz file, not content-encoded for the browser to undo
+        response['Content-Type'] = 'application/gzip'
+    return response
@@ -0,0 +1,195 @@
+"""
+In-process buffer for the index page visit counter.
+
+Counting visits in the session turned every landing page view into a session
+write. Instead each process collects increments in memory and writes them to
+the VisitCount table in one transaction per batch.
+
+Consistency rules:
+
+* A process flushes as soon as it holds FLUSH_EVERY unwritten hits, and its
+  background thread flushes anything still pending every FLUSH_INTERVAL seconds.
+  So a count read from the database lags the true count by at most
+  FLUSH_INTERVAL seconds (or FLUSH_EVERY hits, whichever comes first).
+* The process that recorded a hit sees it straight away: counts shown to a
+  visitor are the stored count plus whatever this process has not written yet.
+  Other processes see it after that process's next flush.
+* Pending hits are flushed when the process exits normally. A crash loses at
+  most the hits buffered since the last flush; a failed flush keeps them in the
+  buffer to be retried.
+
+Configure with the CATALOG_VISIT_BUFFER setting, e.g.
+{'FLUSH_EVERY': 100, 'FLUSH_INTERVAL': 5}. A FLUSH_INTERVAL of None disables
+the background thread (hits are then only flushed by count and at exit).
+"""
+import atexit
+import logging
+import threading
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import IntegrityError, connection, router, transaction
+from django.db.models import F
+from django.dispatch import receiver
+
+from .models import VisitCount
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_EVERY = 100
+DEFAULT_FLUSH_INTERVAL = 5
+
+# anonymous visitors are told apart by this (signed) cookie rather than a session
+VISITOR_COOKIE = 'catalog_visitor'
+VISITOR_COOKIE_AGE = 365 * 24 * 60 * 60
+
+
+def visitor_key(request):
+    """
+    Returns (key, new_visitor_id). new_visitor_id is only set when the visitor
+    didn't have a cookie yet, and needs to be sent with the response.
+    """
+    if request.user.is_authenticated:
+        return 'user:%s' % request.user.pk, None
+    visitor_id = request.get_signed_cookie(VISITOR_COOKIE, default=None)
+    if visitor_id:
+        return 'visitor:%s' % visitor_id, None
+    visitor_id = uuid.uuid4().hex
+    return 'visitor:%s' % visitor_id, visitor_id
+
+
+class VisitBuffer(object):
+    """
+    Thread-safe counter that batches visit increments into VisitCount
+    """
+
+    def __init__(self, flush_every=DEFAULT_FLUSH_EVERY, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.pending = Counter()
+        self.unflushed = 0
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def record(self, key):
+        """
+        Counts one visit for key, flushing if enough hits have piled up
+        """
+        with self.lock:
+            self.pending[key] += 1
+            self.unflushed += 1
+            due = self.unflushed >= self.flush_every
+        if due:
+            self.flush()
+        elif self.flush_interval is not None and self.thread is None:
+            self.start()
+
+    def count(self, key):
+        """
+        Visits recorded for key: what is stored plus what we haven't written yet
+        """
+        # from the database flush() writes to: a replica that is behind would
+        # lose the hits this process has just flushed
+        stored = (VisitCount.objects.using(router.db_for_write(VisitCount)).filter(key=key)
+                  .values_list('count', flat=True).first() or 0)
+        with self.lock:
+            return stored + self.pending[key]
+
+    def flush(self):
+        """
+        Writes all pending increments in a single transaction and returns how many
+        hits were written. On failure the hits go back into the buffer.
+        """
+        with self.lock:
+            batch, self.pending = self.pending, Counter()
+            self.unflushed = 0
+        if not batch:
+            return 0
+        try:
+            with transaction.atomic():
+                for key, hits in batch.items():
+                    self._add(key, hits)
+        except Exception:
+            logger.exception('Could not flush %s buffered visits, will retry', sum(batch.values()))
+            with self.lock:
+                self.pending.update(batch)
+                self.unflushed += sum(batch.values())
+            return 0
+        return sum(batch.values())
+
+    @staticmethod
+    def _add(key, hits):
+        if VisitCount.objects.filter(key=key).update(count=F('count') + hits):
+            return
+        try:
+            with transaction.atomic():
+                VisitCount.objects.create(key=key, count=hits)
+        except IntegrityError:
+            # another process created the row first
+            VisitCount.objects.filter(key=key).update(count=F('count') + hits)
+
+    def start(self):
+        """
+        Starts the background thread that flushes every flush_interval seconds
+        """
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self._run, name='visit-buffer-flush', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def _run(self):
+        while not self.stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            finally:
+                # this thread has its own connection; don't leave it open between flushes
+                connection.close()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_visit_buffer():
+    """
+    The process-wide buffer, configured from settings.CATALOG_VISIT_BUFFER
+    """
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            options = getattr(settings, 'CATALOG_VISIT_BUFFER', {})
+            _buffer = VisitBuffer(
+                flush_every=options.get('FLUSH_EVERY', DEFAULT_FLUSH_EVERY),
+                flush_interval=options.get('FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL))
+        return _buffer
+
+
+def reset_visit_buffer():
+    """
+    Flushes and discards the process-wide buffer (it is rebuilt on next use)
+    """
+    global _buffer
+    with _buffer_lock:
+        old, _buffer = _buffer, None
+    if old is not None:
+        old.stop()
+        old.flush()
+
+
+@receiver(setting_changed)
+def visit_buffer_setting_changed(sender, setting, **kwargs):
+    if setting == 'CATALOG_VISIT_BUFFER':
+        reset_visit_buffer()
+
+
+@atexit.register
+def flush_at_exit():
+    if _buffer is not None:
+        _buffer.flush()
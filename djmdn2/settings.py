@@ -48,6 +48,8 @@ BUILT_IN_APPS = [
 INSTALLED_APPS = USER_APPS + BUILT_IN_APPS
 
 MIDDLEWARE_CLASSES = [
+    'catalog.middleware.SQLInstrumentationMiddleware',
+    'catalog.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -92,6 +94,23 @@ DATABASES = {
     }
 }
 
+# Browsing pages read from the replicas, writes go to the primary, see
+# catalog/routers.py. Setting CATALOG_REPLICA_DB to a second SQLite file makes
+# it a local replica, filled and refreshed with `manage.py sync_replica`.
+DATABASE_ROUTERS = ['catalog.routers.ReplicaRouter']
+CATALOG_REPLICAS = {
+    'ALIASES': [],
+    'STICKY_SECONDS': 15,   # reads go to the primary this long after a write
+}
+if os.environ.get('CATALOG_REPLICA_DB'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['CATALOG_REPLICA_DB'],
+        # the tests read everything from the primary's test database
+        'TEST': {'MIRROR': 'default'},
+    }
+    CATALOG_REPLICAS['ALIASES'] = ['replica']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.9/ref/settings/#auth-password-validators
@@ -129,10 +148,60 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/1.9/howto/static-files/
 STATIC_URL = '/static/'
+# `manage.py vendor_static` then `manage.py collectstatic` fill STATIC_ROOT with
+# content-hashed, precompressed files, served by catalog/static_handler.py (see
+# catalog/assets.py).
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+STATICFILES_STORAGE = 'catalog.assets.CompressedManifestStaticFilesStorage'
 
 # Redirect to home page on successful login
 LOGIN_REDIRECT_URL = '/'
 
+# Index page visit counts are buffered in memory and written in batches,
+# see catalog/visits.py for the consistency rules
+CATALOG_VISIT_BUFFER = {
+    'FLUSH_EVERY': 100,     # hits
+    'FLUSH_INTERVAL': 5,    # seconds
+}
+
+# Rendered book and author pages are cached in files shared by all the server
+# processes and invalidated by signals, see catalog/fragments.py.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'catalog'),
+        'TIMEOUT': 24 * 60 * 60,
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+}
+
+CATALOG_FRAGMENT_CACHE = {
+    'CACHE': 'catalog',
+}
+
+# Title and author suggestions come from an in-memory prefix index in each
+# process, see catalog/autocomplete.py.
+CATALOG_AUTOCOMPLETE = {
+    'MAX_TITLE_BYTES': 640 * 1024 * 1024,   # about 90 bytes an entry, so 5 million titles and then some
+    'MAX_NAME_BYTES': 128 * 1024 * 1024,
+    'MAX_AGE': 15 * 60,     # rebuilt this often to pick up other processes' changes
+}
+
+# Every request's query count and SQL time go out in a Server-Timing header and
+# a log line, see catalog/middleware.py.
+CATALOG_SQL_INSTRUMENTATION = {
+    'ENABLED': True,
+    'SERVER_TIMING': True,
+    'RAISE': False,
+    'REPEAT_THRESHOLD': 5,
+}
+
+# The tests swap in the settings they need, see catalog/tests/runner.py
+TEST_RUNNER = 'catalog.tests.runner.CatalogTestRunner'
+
 # To test email (our env blocks SMTP to prevent spammers)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
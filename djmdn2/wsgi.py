@@ -9,8 +9,16 @@ https://docs.djangoproject.com/en/1.9/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "djmdn2.settings")
 
-application = get_wsgi_application()
+from catalog import autocomplete
+from catalog.static_handler import PrecompressedStaticFiles
+
+# the collected static files are answered before Django sees the request
+application = PrecompressedStaticFiles(get_wsgi_application(), settings.STATIC_ROOT, settings.STATIC_URL)
+
+# so the first suggestions don't wait for the autocomplete index to be built
+autocomplete.warm()